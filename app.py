@@ -1,15 +1,29 @@
-from flask import Flask, render_template, request, redirect, url_for, send_from_directory, flash, session, jsonify
+from flask import Flask, render_template, request, redirect, url_for, send_file, flash, session, jsonify, Response, abort
 import os
+import gzip
+import shutil
+import hashlib
 import base64
 import sqlite3
+import zipfile
+import mimetypes
 from datetime import datetime
 from io import BytesIO
 from PIL import Image
 from functools import wraps
-import json
+
+# zstd-compressed CSV downloads are optional
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 from werkzeug.security import generate_password_hash, check_password_hash
-from backend.main import build_class_embeddings, process_classroom_images, process_multiple_classroom_images, generate_excel_report
+from werkzeug.utils import safe_join
+from backend.main import ensure_class_embeddings, queue_roster_update, process_classroom_images, process_multiple_classroom_images, new_job_dir, generate_excel_report, embedding_variant, OUTPUT_DIR
+from backend import metrics, reports, attendance_store, thumbnails, user_store, aggregates, bulk_enrollment, sessions, result_cache, scheduler, roster_sync, retention
+from sample_image_utils import register_sample_images
+from init_db import initialize_database
 
 # =============================
 # CONFIG
@@ -25,74 +39,51 @@ os.makedirs(UPLOAD_FOLDER_CLASSROOM, exist_ok=True)
 os.makedirs(REPORTS_DIR, exist_ok=True)
 os.makedirs(USERS_DIR, exist_ok=True)
 
+# How files are handed to the client: "flask" streams them from Python, "x-sendfile"
+# (Apache/lighttpd) and "x-accel" (nginx) let the front proxy stream them instead
+FILE_SERVING_MODE = os.environ.get("FILE_SERVING_MODE", "flask")
+X_ACCEL_LOCATIONS = {
+    REPORTS_DIR: os.environ.get("X_ACCEL_REPORTS_LOCATION", "/_protected/reports"),
+    UPLOAD_FOLDER_STUDENTS: os.environ.get("X_ACCEL_PHOTOS_LOCATION", "/_protected/photo"),
+    attendance_store.CONSOLIDATED_CACHE_DIR: os.environ.get("X_ACCEL_CONSOLIDATED_LOCATION", "/_protected/consolidated"),
+    thumbnails.THUMBNAIL_DIR: os.environ.get("X_ACCEL_THUMBNAILS_LOCATION", "/_protected/thumbnails"),
+}
+SAMPLE_IMAGE_MAX_AGE = 24 * 3600
+THUMBNAIL_MAX_AGE = 365 * 24 * 3600 # Thumbnail URLs carry a version, so they never change
+GRID_THUMBNAIL_SIZE = 256
+# Webcam frames are downscaled in the browser to this longest edge and sent as JPEG files
+CAPTURE_MAX_EDGE = int(os.environ.get("CAPTURE_MAX_EDGE", 1280))
+CAPTURE_JPEG_QUALITY = float(os.environ.get("CAPTURE_JPEG_QUALITY", 0.85))
+
 app = Flask(__name__)
 app.secret_key = "sih2025_secret"
+app.config['USE_X_SENDFILE'] = FILE_SERVING_MODE == 'x-sendfile'
+
+
+REPORTS_PER_PAGE = 50
+
+# Create tables, summary tables and triggers before anything reads or writes them
+initialize_database()
+
+# Register any reports generated before the report index existed
+attendance_store.sync_report_index(REPORTS_DIR)
+
+
+def get_all_reports(page=1, per_page=REPORTS_PER_PAGE):
+    """Newest reports across all classes from the report index, with the total count"""
+    return attendance_store.list_reports(page=page, per_page=per_page)
 
 
 # Load or initialize user database
-def get_all_reports():
-    all_reports = []
-    for root, dirs, files in os.walk(REPORTS_DIR):
-        for file in files:
-            if file.endswith('.xlsx'):
-                rel_dir = os.path.relpath(root, REPORTS_DIR)
-                rel_file = os.path.join(rel_dir, file) if rel_dir != '.' else file
-                all_reports.append(rel_file)
-    return sorted(all_reports, reverse=True)
-
-
-def load_users():
-    if not os.path.exists(USERS_FILE):
-        default_users = {
-            "admin1": {
-                "password": generate_password_hash("adminpass"),
-                "role": "admin",
-                "last_login": "",
-                "login_count": 0
-            },
-            "teacher1": {
-                "password": generate_password_hash("teachpass"),
-                "role": "teacher",
-                "class": "class101",
-                "last_login": "",
-                "login_count": 0
-            }
-        }
-        with open(USERS_FILE, "w") as f:
-            json.dump(default_users, f, indent=2)
-        return default_users
-    else:
-        try:
-            with open(USERS_FILE, "r") as f:
-                data = f.read().strip()
-                if not data:
-                    raise ValueError("Empty file")
-                return json.loads(data)
-        except Exception:
-            default_users = {
-                "admin1": {
-                    "password": generate_password_hash("adminpass"),
-                    "role": "admin",
-                    "last_login": "",
-                    "login_count": 0
-                },
-                "teacher1": {
-                    "password": generate_password_hash("teachpass"),
-                    "role": "teacher",
-                    "class": "class101",
-                    "last_login": "",
-                    "login_count": 0
-                }
-            }
-            with open(USERS_FILE, "w") as f:
-                json.dump(default_users, f, indent=2)
-            return default_users
-
-def save_users(users):
-    with open(USERS_FILE, "w") as f:
-        json.dump(users, f)
-
-users = load_users()
+# User accounts live in SQLite; users.json is only read once to migrate existing accounts
+user_store.migrate_from_json(USERS_FILE)
+
+# Take any rosters published by other app servers, then keep following the snapshot manifest
+roster_sync.pull(OUTPUT_DIR, embedding_variant())
+roster_sync.start_watcher(lambda: OUTPUT_DIR, embedding_variant)
+
+# Expire old classroom images, sessions, reports and rejected samples in the background
+retention.start_scheduler()
 
 def get_class_report_dir(class_name):
     """Create and return class-specific report directory"""
@@ -102,6 +93,94 @@ def get_class_report_dir(class_name):
     os.makedirs(path, exist_ok=True)
     return path
 
+# ==============================
+# File serving (conditional GETs, ranges, compressed CSV, proxy offload)
+# ==============================
+def compressed_variant(full_path):
+    """
+    Pick a precompressed variant of a CSV file that the client accepts,
+    writing it next to the original the first time it is requested.
+    :return: (path to serve, content encoding or None)
+    """
+    if not full_path.endswith('.csv'):
+        return full_path, None
+
+    for encoding, suffix in (('zstd', '.zst'), ('gzip', '.gz')):
+        if not request.accept_encodings[encoding] or (encoding == 'zstd' and zstandard is None):
+            continue
+        variant = full_path + suffix
+        if not os.path.exists(variant) or os.path.getmtime(variant) < os.path.getmtime(full_path):
+            partial = variant + '.part'
+            with open(full_path, 'rb') as src:
+                if encoding == 'zstd':
+                    with open(partial, 'wb') as raw, zstandard.ZstdCompressor().stream_writer(raw) as dst:
+                        shutil.copyfileobj(src, dst)
+                else:
+                    with gzip.open(partial, 'wb') as dst:
+                        shutil.copyfileobj(src, dst)
+            os.replace(partial, variant)
+        return variant, encoding
+
+    return full_path, None
+
+def serve_file(directory, filename, as_attachment=False, download_name=None, max_age=None):
+    """
+    Serve a file with ETag/Last-Modified validation and byte-range support, or hand it
+    to the front proxy when FILE_SERVING_MODE is x-sendfile or x-accel.
+    """
+    full_path = safe_join(directory, filename)
+    if full_path is None or not os.path.isfile(full_path):
+        abort(404)
+
+    download_name = download_name or os.path.basename(full_path)
+    mimetype = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+    path, encoding = compressed_variant(full_path)
+
+    if FILE_SERVING_MODE == 'x-accel':
+        location = X_ACCEL_LOCATIONS[directory].rstrip('/')
+        response = Response(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = f"{location}/{os.path.relpath(path, directory).replace(os.sep, '/')}"
+        if as_attachment:
+            response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+        if max_age:
+            response.cache_control.max_age = max_age
+    else:
+        response = send_file(path, mimetype=mimetype, as_attachment=as_attachment,
+                             download_name=download_name, conditional=True, max_age=max_age)
+
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+@app.context_processor
+def capture_settings():
+    return {"capture_max_edge": CAPTURE_MAX_EDGE, "capture_jpeg_quality": CAPTURE_JPEG_QUALITY}
+
+def read_captured_image():
+    """
+    Bytes of a captured frame, sent as a multipart file 'image', a raw image/jpeg or
+    image/png body, or (older pages) a base64 data URL in the 'image' form field.
+    """
+    file = request.files.get("image")
+    if file:
+        return file.read()
+    if request.mimetype in ("image/jpeg", "image/png"):
+        return request.get_data()
+    data_url = request.form["image"]
+    return base64.b64decode(data_url.split(",")[1])
+
+@app.errorhandler(scheduler.SchedulerBusy)
+def recognition_busy(e):
+    """Too many recognition jobs queued: ask the client to come back after Retry-After seconds"""
+    if request.path.startswith('/api/'):
+        response = jsonify({'error': str(e), 'retry_after': e.retry_after})
+    else:
+        response = Response(render_template("busy.html", retry_after=e.retry_after), mimetype="text/html")
+    response.status_code = 429
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
 # Role-based access decorator
 def role_required(role):
     def wrapper(f):
@@ -122,18 +201,10 @@ def login():
     if request.method == "POST":
         userid = request.form.get('userid')
         password = request.form.get('password')
-        user = users.get(userid)
+        user = user_store.get_user(userid)
         if user and check_password_hash(user['password'], password):
-            # Record last login time
-            current_login = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            user['last_login'] = current_login
-            
-            # Update login count (optional)
-            user['login_count'] = user.get('login_count', 0) + 1
-            
-            # Save updated user data
-            users[userid] = user
-            save_users(users)
+            # Record last login time and login count with a single-row update
+            user_store.record_login(userid)
             
             session['userid'] = userid
             session['role'] = user['role']
@@ -173,28 +244,42 @@ def capture_image():
             flash("No class assigned to your account. Contact admin.")
             return redirect(url_for('index'))
             
-        data_url = request.form["image"]
-        image_data = base64.b64decode(data_url.split(",")[1])
-
-        image_path = os.path.join(UPLOAD_FOLDER_CLASSROOM, "captured_classroom.jpg")
-        with open(image_path, "wb") as f:
-            f.write(image_data)
+        image_data = read_captured_image()
 
         # Pass teacher's class to backend functions
-        build_class_embeddings(teacher_class)
-        students_present = process_classroom_images(teacher_class)
-        results, report_filename = generate_excel_report(students_present, teacher_class)
+        ensure_class_embeddings(teacher_class)
+
+        # A re-submitted snapshot (double-click, retry, refresh) gets the stored result
+        cache_key = result_cache.make_key('single', teacher_class, [hashlib.sha256(image_data).hexdigest()])
+        with result_cache.claim(cache_key):
+            cached = result_cache.get(cache_key, REPORTS_DIR)
+            if cached:
+                results, report_file = cached
+                flash("Attendance processed successfully!")
+                return render_template("results.html", present=results, report_file=report_file)
+
+            # Each capture gets its own folder; the single-image pipeline reads every photo in it
+            job_dir = new_job_dir()
+            image_path = os.path.join(UPLOAD_FOLDER_CLASSROOM, job_dir, "captured_classroom.jpg")
+            with open(image_path, "wb") as f:
+                f.write(image_data)
+
+            students_present = scheduler.run(teacher_class, process_classroom_images, teacher_class, job_dir)
+            results, report_filename = generate_excel_report(students_present, teacher_class, background=True)
+            report_file = os.path.join(teacher_class, report_filename)
+            result_cache.put(cache_key, teacher_class, results, report_file, 1)
 
         # Debug: Print where the file should be
         print(f"[DEBUG] Report should be saved as: {report_filename}")
         if teacher_class:
             expected_path = os.path.join(get_class_report_dir(teacher_class), report_filename)
             print(f"[DEBUG] Expected path: {expected_path}")
-            print(f"[DEBUG] File exists: {os.path.exists(expected_path)}")
         
         flash("Attendance processed successfully!")
-        return render_template("results.html", present=results, report_file=report_filename)
+        return render_template("results.html", present=results, report_file=report_file)
         
+    except scheduler.SchedulerBusy:
+        raise
     except Exception as e:
         flash(f"Error while processing image: {str(e)}")
         return redirect(url_for("index"))
@@ -207,12 +292,10 @@ def view_attendance():
         flash("No class assigned to your account. Contact admin.")
         return redirect(url_for('index'))
         
-    class_report_dir = get_class_report_dir(teacher_class)
-    try:
-        files = sorted(os.listdir(class_report_dir), reverse=True)
-    except Exception:
-        files = []  
-    return render_template("reports.html", files=files)
+    page = request.args.get('page', 1, type=int)
+    files, total = attendance_store.list_reports(teacher_class, page=page, per_page=REPORTS_PER_PAGE)
+    return render_template("reports.html", files=files, total=total, page=page,
+                           total_pages=(total + REPORTS_PER_PAGE - 1) // REPORTS_PER_PAGE)
 
 @app.route("/upload_classroom_images", methods=["GET", "POST"])
 @role_required('teacher')
@@ -232,52 +315,118 @@ def upload_classroom_images():
             return redirect(request.url)
 
         try:
-            # Clear old classroom images
-            clear_old_classroom_images()
-            
-            # Save uploaded images
-            saved_count = 0
-            for i, file in enumerate(uploaded_files):
-                if file and file.filename.lower().endswith(('.jpg', '.jpeg', '.png')):
+            valid_files = [file for file in uploaded_files
+                           if file and file.filename.lower().endswith(('.jpg', '.jpeg', '.png'))]
+            if not valid_files:
+                flash("No valid image files were uploaded.")
+                return redirect(request.url)
+
+            # The same upload set submitted again gets the stored result
+            ensure_class_embeddings(teacher_class)
+            cache_key = result_cache.make_key('multi', teacher_class,
+                                              [result_cache.stream_digest(file.stream) for file in valid_files])
+            with result_cache.claim(cache_key):
+                cached = result_cache.get(cache_key, REPORTS_DIR)
+                if cached:
+                    results, report_file = cached
+                    flash("Attendance processed successfully from uploaded images!")
+                    return render_template("results.html", present=results, report_file=report_file,
+                                           image_count=len(valid_files))
+
+                # Save uploaded images into a folder of their own; the pipeline reads every photo in it
+                job_dir = new_job_dir()
+                saved_count = 0
+                for i, file in enumerate(valid_files):
                     filename = f"classroom_{i+1}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-                    file_path = os.path.join(UPLOAD_FOLDER_CLASSROOM, filename)
+                    file_path = os.path.join(UPLOAD_FOLDER_CLASSROOM, job_dir, filename)
                     file.save(file_path)
                     saved_count += 1
 
-            if saved_count == 0:
-                flash("No valid image files were uploaded.")
-                return redirect(request.url)
+                flash(f"Successfully uploaded {saved_count} classroom images.")
 
-            flash(f"Successfully uploaded {saved_count} classroom images.")
-
-            # Process attendance from multiple images
-            build_class_embeddings(teacher_class)
-            students_present = process_multiple_classroom_images(teacher_class)
-            results, report_filename = generate_excel_report(students_present, teacher_class)
+                # Process attendance from multiple images
+                students_present = scheduler.run(teacher_class, process_multiple_classroom_images,
+                                                 teacher_class, job_dir)
+                results, report_filename = generate_excel_report(students_present, teacher_class, background=True)
+                report_file = os.path.join(teacher_class, report_filename)
+                result_cache.put(cache_key, teacher_class, results, report_file, saved_count)
 
             flash("Attendance processed successfully from uploaded images!")
             return render_template(
                 "results.html",
                 present=results,
-                report_file=report_filename,
+                report_file=report_file,
                 image_count=saved_count
             )
 
+        except scheduler.SchedulerBusy:
+            raise
         except Exception as e:
             flash(f"Error processing classroom images: {str(e)}")
             return redirect(request.url)
 
     return render_template("upload_classroom_images.html")
 
-def clear_old_classroom_images():
-    """Clear old classroom images before processing new ones"""
-    for file in os.listdir(UPLOAD_FOLDER_CLASSROOM):
-        if file.startswith("classroom_") or file.startswith("captured_"):
-            file_path = os.path.join(UPLOAD_FOLDER_CLASSROOM, file)
-            try:
-                os.remove(file_path)
-            except Exception as e:
-                print(f"[WARNING] Could not remove {file}: {e}")
+# ==============================
+# Incremental attendance sessions (add photos one at a time)
+# ==============================
+def teacher_session_or_404(session_id):
+    attendance_session = sessions.get_session(session_id)
+    if attendance_session is None or attendance_session['class_name'] != session.get('class'):
+        abort(404)
+    return attendance_session
+
+@app.route('/api/sessions', methods=['POST'])
+@role_required('teacher')
+def session_start():
+    """Open an attendance session for the teacher's class"""
+    teacher_class = session.get('class')
+    if not teacher_class:
+        return jsonify({'error': 'No class assigned to your account'}), 400
+    ensure_class_embeddings(teacher_class)
+    session_id = sessions.create_session(teacher_class, session.get('userid'))
+    return jsonify(sessions.get_session(session_id)), 201
+
+@app.route('/api/sessions/<session_id>', methods=['GET'])
+@role_required('teacher')
+def session_status(session_id):
+    """Images processed so far and the current per-student decision"""
+    return jsonify(teacher_session_or_404(session_id))
+
+@app.route('/api/sessions/<session_id>/images', methods=['POST'])
+@role_required('teacher')
+def session_add_image(session_id):
+    """Add one classroom photo (multipart field 'image'); only this photo is processed"""
+    teacher_session_or_404(session_id)
+    file = request.files.get('image')
+    img_bytes = file.read() if file else b''
+    extension = captured_image_extension(img_bytes)
+    if extension is None:
+        return jsonify({'error': 'Expected a JPEG or PNG image'}), 400
+
+    try:
+        sessions.get_open_session(session_id)  # A closed session must not collect orphan photos
+        filename = f"classroom_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}{extension}"
+        with open(sessions.image_path(session_id, filename), 'wb') as f:
+            f.write(img_bytes)
+        return jsonify(scheduler.run(session.get('class'), sessions.add_image, session_id, filename))
+    except KeyError:
+        abort(404)
+    except (ValueError, RuntimeError) as e:  # Closed session, unreadable photo or no usable roster
+        return jsonify({'error': str(e)}), 409
+
+@app.route('/api/sessions/<session_id>/close', methods=['POST'])
+@role_required('teacher')
+def session_close(session_id):
+    """Close the session and write its attendance report"""
+    teacher_session_or_404(session_id)
+    try:
+        results, report_filename = sessions.close_session(session_id)
+    except KeyError:
+        abort(404)
+    except (ValueError, RuntimeError) as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify({'results': results, 'report_file': os.path.join(session.get('class'), report_filename)})
 
 # ==============================
 # Admin Routes
@@ -286,54 +435,36 @@ def clear_old_classroom_images():
 @app.route("/admin_dashboard")
 @role_required('admin')
 def admin_dashboard():
-    # Get reports
-    try:
-        reports = sorted(os.listdir(REPORTS_DIR), reverse=True)
-    except Exception:
-        reports = []
+    # Get the most recent reports from the report index
+    recent_reports, total_reports = get_all_reports(per_page=10)
     
-    # Prepare user statistics
-    total_users = len(users)
-    total_teachers = sum(1 for user in users.values() if user.get('role') == 'teacher')
-    total_admins = sum(1 for user in users.values() if user.get('role') == 'admin')
-    
-    # Get classes count
-    try:
-        total_classes = len([d for d in os.listdir(os.path.join('database', 'photo')) 
-                           if os.path.isdir(os.path.join('database', 'photo', d))])
-        class_list = [d for d in os.listdir(os.path.join('database', 'photo')) 
-                     if os.path.isdir(os.path.join('database', 'photo', d))]
-    except:
-        total_classes = 0
-        class_list = []
-    
-    # Prepare detailed user list with login info
+    # Counts come from summary tables kept current by triggers, not from scanning users
+    role_counts = aggregates.get_user_counts()
+    total_users = sum(role_counts.values())
+    total_teachers = role_counts.get('teacher', 0)
+    total_admins = role_counts.get('admin', 0)
+
+    class_list = aggregates.get_class_names()
+    total_classes = len(class_list)
+
+    # Prepare detailed user list with login info (login age is computed by SQLite)
     user_list = []
-    for userid, data in users.items():
-        last_login = data.get('last_login', 'Never')
-        if last_login != 'Never':
-            try:
-                # Parse and format the datetime for better display
-                login_dt = datetime.strptime(last_login, '%Y-%m-%d %H:%M:%S')
-                time_ago = datetime.now() - login_dt
-                
-                if time_ago.days > 0:
-                    last_login_display = f"{last_login} ({time_ago.days} days ago)"
-                elif time_ago.seconds > 3600:
-                    hours = time_ago.seconds // 3600
-                    last_login_display = f"{last_login} ({hours}h ago)"
-                elif time_ago.seconds > 60:
-                    minutes = time_ago.seconds // 60
-                    last_login_display = f"{last_login} ({minutes}m ago)"
-                else:
-                    last_login_display = f"{last_login} (Just now)"
-            except:
-                last_login_display = last_login
+    for data in user_store.list_users(order_by_login=True):
+        last_login = data.get('last_login') or 'Never'
+        seconds_ago = data.get('seconds_since_login')
+        if seconds_ago is None:
+            last_login_display = "Never" if last_login == 'Never' else last_login
+        elif seconds_ago >= 86400:
+            last_login_display = f"{last_login} ({seconds_ago // 86400} days ago)"
+        elif seconds_ago > 3600:
+            last_login_display = f"{last_login} ({seconds_ago // 3600}h ago)"
+        elif seconds_ago > 60:
+            last_login_display = f"{last_login} ({seconds_ago // 60}m ago)"
         else:
-            last_login_display = "Never"
-        
+            last_login_display = f"{last_login} (Just now)"
+
         user_list.append({
-            "userid": userid,
+            "userid": data["userid"],
             "role": data.get("role", "Unknown"),
             "class": data.get("class", "N/A"),
             "last_login": last_login,
@@ -341,12 +472,10 @@ def admin_dashboard():
             "login_count": data.get("login_count", 0),
             "status": "Active" if last_login != 'Never' else "Inactive"
         })
-    
-    # Sort by last login (most recent first)
-    user_list.sort(key=lambda x: x['last_login'] if x['last_login'] != 'Never' else '1900-01-01', reverse=True)
-    
+
     return render_template("admin_dashboard_combined.html", 
-                         reports=reports, 
+                         reports=recent_reports,
+                         total_reports=total_reports, 
                          user_list=user_list,
                          total_users=total_users,
                          total_teachers=total_teachers,
@@ -373,28 +502,24 @@ def add_teacher():
             flash("All required fields must be filled.")
             return redirect(url_for("add_teacher"))
 
-        if new_userid in users:
+        # Add class for teachers only
+        if not user_store.add_user(new_userid, generate_password_hash(new_password), role,
+                                   class_name if role == "teacher" and class_name else None):
             flash("User ID already exists.")
             return redirect(url_for("add_teacher"))
 
-        new_user = {
-            "password": generate_password_hash(new_password),
-            "role": role,
-            "last_login": "",  # Initialize as empty
-            "login_count": 0   # Initialize login count
-        }
-        
-        # Add class for teachers only
-        if role == "teacher" and class_name:
-            new_user["class"] = class_name
-            
-        users[new_userid] = new_user
-        save_users(users)
         flash(f"User '{new_userid}' added successfully.")
         return redirect(url_for("admin_dashboard"))
 
     return render_template("add_teacher.html")
 
+def captured_image_extension(img_bytes):
+    """File extension for JPEG/PNG bytes that can be stored without re-encoding, else None"""
+    for extension, signature in bulk_enrollment.IMAGE_SIGNATURES.items():
+        if extension != '.jpeg' and img_bytes.startswith(signature):
+            return extension
+    return None
+
 @app.route("/upload_samples", methods=["GET", "POST"])
 @role_required('admin')
 def upload_samples():
@@ -413,29 +538,61 @@ def upload_samples():
         total_saved = 0
 
         # Handle file uploads
+        saved_paths = []
         files = request.files.getlist("sample_images")
         for file in files:
             if file and file.filename.lower().endswith(('.jpg', '.jpeg', '.png')):
-                file.save(os.path.join(student_folder, file.filename))
+                file_path = os.path.join(student_folder, file.filename)
+                file.save(file_path)
+                saved_paths.append(file_path)
                 total_saved += 1
 
-        # Handle multiple captured images from webcam
+        # Handle multiple captured images from webcam; JPEG/PNG payloads are stored as sent
+        capture_stamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        captured_files = request.files.getlist("captured_files")
+        for i, file in enumerate(captured_files):
+            extension = captured_image_extension(file.stream.read(8))
+            file.stream.seek(0)
+            if extension is None:
+                flash(f"Captured image {i+1} is not a JPEG or PNG")
+                continue
+            file_path = os.path.join(student_folder, f"captured_{student_name}_{capture_stamp}_{i+1}{extension}")
+            file.save(file_path)
+            saved_paths.append(file_path)
+            total_saved += 1
+
+        # Pages loaded before the binary upload send data URLs in form fields
         captured_images = request.form.getlist("captured_images")
-        for i, captured_image_data in enumerate(captured_images):
+        for i, captured_image_data in enumerate(captured_images, start=len(captured_files)):
             if captured_image_data:
                 try:
                     # Strip base64 header
-                    img_data = captured_image_data.split(",")[1]
-                    img_bytes = base64.b64decode(img_data)
-                    img = Image.open(BytesIO(img_bytes))
-
-                    # Save with unique filename
-                    filename = f"captured_{student_name}_{i+1}_{len(os.listdir(student_folder)) + 1}.jpg"
-                    img.save(os.path.join(student_folder, filename))
+                    img_bytes = base64.b64decode(captured_image_data.split(",")[1])
+                    extension = captured_image_extension(img_bytes)
+                    filename = f"captured_{student_name}_{capture_stamp}_{i+1}{extension or '.jpg'}"
+                    file_path = os.path.join(student_folder, filename)
+                    if extension:
+                        with open(file_path, "wb") as f:
+                            f.write(img_bytes)
+                    else:
+                        Image.open(BytesIO(img_bytes)).convert("RGB").save(file_path, "JPEG")
+                    saved_paths.append(file_path)
                     total_saved += 1
                 except Exception as e:
                     flash(f"Error saving captured image {i+1}: {str(e)}")
 
+        # Register the uploads so the review grid and dashboard counts include them
+        register_sample_images(saved_paths, student_name, class_name, approved_by=session.get('userid'))
+        if saved_paths:
+            queue_roster_update(class_name, [student_name])
+
+        # Build grid thumbnails now so the admin grid never waits on a full-size decode
+        for file_path in saved_paths:
+            try:
+                thumbnails.generate_thumbnails(file_path)
+            except Exception as e:
+                print(f"[WARNING] Could not build thumbnails for {file_path}: {e}")
+
         if total_saved > 0:
             flash(f"Successfully saved {total_saved} images for {student_name} in {class_name}.")
         else:
@@ -449,6 +606,87 @@ def upload_samples():
 # Admin API Routes
 # ==============================
 
+@app.route('/api/admin/bulk-enrollment', methods=['POST'])
+@role_required('admin')
+def bulk_enrollment_start():
+    """
+    Start a chunked upload of a ZIP or tar archive laid out as class/student/*.jpg.
+    JSON body: {"total_bytes": <archive size>, "filename": <optional name>}
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        total_bytes = int(data.get('total_bytes', 0))
+        upload_id = bulk_enrollment.create_upload(total_bytes, data.get('filename'), session.get('userid'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(bulk_enrollment.get_upload(upload_id)), 201
+
+@app.route('/api/admin/bulk-enrollment/<upload_id>', methods=['PUT'])
+@role_required('admin')
+def bulk_enrollment_chunk(upload_id):
+    """Append raw archive bytes starting at ?offset=N; processing starts after the last chunk"""
+    try:
+        upload = bulk_enrollment.append_chunk(upload_id, request.args.get('offset', 0, type=int),
+                                              request.stream, on_complete=refresh_rosters)
+    except KeyError:
+        return jsonify({'error': 'Unknown upload'}), 404
+    except ValueError as e:
+        # The client resumes from bytes_received
+        return jsonify(dict(bulk_enrollment.get_upload(upload_id), error=str(e))), 409
+    return jsonify(upload)
+
+@app.route('/api/admin/bulk-enrollment/<upload_id>', methods=['GET'])
+@role_required('admin')
+def bulk_enrollment_status(upload_id):
+    """Bytes received (for resuming) and processing progress of a bulk upload"""
+    upload = bulk_enrollment.get_upload(upload_id)
+    if upload is None:
+        return jsonify({'error': 'Unknown upload'}), 404
+    return jsonify(upload)
+
+@app.route('/api/admin/bulk-enrollment/<upload_id>/retry', methods=['POST'])
+@role_required('admin')
+def bulk_enrollment_retry(upload_id):
+    """Process a fully received upload again after a failure"""
+    try:
+        upload = bulk_enrollment.retry_upload(upload_id, on_complete=refresh_rosters)
+    except KeyError:
+        return jsonify({'error': 'Unknown upload'}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify(upload)
+
+@app.route('/api/admin/rosters/manifest')
+@role_required('admin')
+def roster_manifest():
+    """Current roster snapshot of every class (version, hash, model version)"""
+    return jsonify(roster_sync.load_manifest())
+
+@app.route('/api/admin/rosters/export')
+@role_required('admin')
+def roster_export():
+    """Download the current roster snapshots as a ZIP; ?classes=A,B limits the classes"""
+    class_names = [name for name in request.args.get('classes', '').split(',') if name] or None
+    archive = BytesIO()
+    roster_sync.export_snapshots(archive, class_names)
+    archive.seek(0)
+    return send_file(archive, mimetype='application/zip', as_attachment=True,
+                     download_name=f"rosters_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip")
+
+@app.route('/api/admin/rosters/import', methods=['POST'])
+@role_required('admin')
+def roster_import():
+    """Publish the snapshots in an exported ZIP (form file 'archive') and load them on this server"""
+    file = request.files.get('archive')
+    if not file:
+        return jsonify({'error': 'No archive uploaded'}), 400
+    try:
+        imported = roster_sync.import_snapshots(file.stream)
+    except (ValueError, KeyError, zipfile.BadZipFile) as e:
+        return jsonify({'error': str(e)}), 400
+    updated = roster_sync.pull(OUTPUT_DIR, embedding_variant(), imported)
+    return jsonify({'imported': imported, 'loaded': updated})
+
 @app.route('/admin/reports')
 def admin_reports():
     """Admin reports dashboard"""
@@ -603,7 +841,8 @@ def admin_student_detail(student_id):
 
     # Get student's sample images
     sample_images = conn.execute("""
-        SELECT id, image_filename, upload_date, status, quality_score, rejection_reason
+        SELECT id, image_filename, image_path, class_name, student_name, upload_date, status,
+               quality_score, rejection_reason, file_size
         FROM sample_images 
         WHERE student_id = ?
         ORDER BY upload_date DESC
@@ -623,60 +862,54 @@ def admin_student_detail(student_id):
     conn.close()
 
     return jsonify({
-        'sample_images': [dict(img) for img in sample_images],
+        'sample_images': [dict(img, thumbnail_url=thumbnail_url(img)) for img in sample_images],
         'attendance_records': [dict(rec) for rec in attendance_records]
     })
 
 @app.route('/api/admin/class-statistics')
 def admin_class_statistics():
     """Get statistics by class"""
-    conn = sqlite3.connect('attendance.db')
-    conn.row_factory = sqlite3.Row
+    sample_stats, attendance_stats = aggregates.get_class_statistics()
+    return jsonify({
+        'sample_stats': sample_stats,
+        'attendance_stats': attendance_stats
+    })
 
-    # Get sample image stats by class
-    sample_stats = conn.execute("""
-        SELECT 
-            class_name,
-            COUNT(DISTINCT student_id) as total_students,
-            COUNT(*) as total_samples,
-            COUNT(CASE WHEN status = 'approved' THEN 1 END) as approved_samples,
-            COUNT(CASE WHEN status = 'pending' THEN 1 END) as pending_samples,
-            COUNT(CASE WHEN status = 'rejected' THEN 1 END) as rejected_samples
-        FROM sample_images
-        WHERE class_name IS NOT NULL
-        GROUP BY class_name
-        ORDER BY class_name
-    """).fetchall()
-
-    # Get attendance stats by class
-    attendance_stats = conn.execute("""
-        SELECT 
-            class_name,
-            COUNT(*) as total_records,
-            COUNT(CASE WHEN status = 'Present' THEN 1 END) as present_records,
-            COUNT(DISTINCT student_name) as unique_students,
-            COUNT(DISTINCT date) as unique_dates
-        FROM attendance_records
-        WHERE class_name IS NOT NULL
-        GROUP BY class_name
-        ORDER BY class_name
-    """).fetchall()
+@app.route('/api/admin/reports')
+@role_required('admin')
+def admin_reports_list():
+    """Paginated report listing from the report index"""
+    class_filter = request.args.get('class', 'all')
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 10, type=int)
 
-    conn.close()
+    reports_page, total_count = attendance_store.list_reports(
+        class_name=None if class_filter == 'all' else class_filter,
+        page=page,
+        per_page=per_page,
+        date_from=request.args.get('date_from') or None,
+        date_to=request.args.get('date_to') or None,
+    )
 
     return jsonify({
-        'sample_stats': [dict(row) for row in sample_stats],
-        'attendance_stats': [dict(row) for row in attendance_stats]
+        'reports': reports_page,
+        'total': total_count,
+        'page': page,
+        'per_page': per_page,
+        'total_pages': (total_count + per_page - 1) // per_page
     })
 
 @app.route('/download_report/<path:filename>')
 def download_report(filename):
     user_role = session.get('role')
     try:
-        # Construct full absolute file path
-        full_path = os.path.join(REPORTS_DIR, filename)
+        full_path = safe_join(REPORTS_DIR, filename)
+
+        # Reports are written in the background; wait if this one is still being generated
+        if full_path is not None:
+            reports.wait_for_report(full_path)
         
-        if not os.path.exists(full_path):
+        if full_path is None or not os.path.isfile(full_path):
             flash("Report file not found.")
             # Redirect based on user role
             if user_role == 'teacher':
@@ -684,12 +917,8 @@ def download_report(filename):
             else:
                 return redirect(url_for('admin_dashboard'))
         
-        # Determine directory and file name for send_from_directory
-        directory = os.path.dirname(full_path)
-        file = os.path.basename(full_path)
-        
         # Serve the file as attachment to trigger download
-        return send_from_directory(directory=directory, filename=file, as_attachment=True)
+        return serve_file(REPORTS_DIR, filename, as_attachment=True)
     
     except Exception as e:
         flash(f"Error downloading file: {str(e)}")
@@ -698,6 +927,36 @@ def download_report(filename):
         else:
             return redirect(url_for('admin_dashboard'))
 
+@app.route('/reports/consolidated')
+def consolidated_report():
+    """Download a students x sessions attendance summary for a class and date range"""
+    user_role = session.get('role')
+    if user_role == 'teacher':
+        class_name = session.get('class')
+    elif user_role == 'admin':
+        class_name = request.args.get('class')
+    else:
+        flash("Access denied. Please login with appropriate credentials.")
+        return redirect(url_for('login'))
+
+    if not class_name:
+        flash("A class is required for a consolidated report.")
+        return redirect(url_for('view_attendance' if user_role == 'teacher' else 'admin_dashboard'))
+
+    date_from = request.args.get('date_from', '')
+    date_to = request.args.get('date_to', '')
+    fmt = request.args.get('format', 'xlsx')
+    try:
+        report_path = attendance_store.get_consolidated_report(class_name, date_from, date_to, fmt)
+    except (ValueError, RuntimeError) as e:
+        flash(f"Error generating consolidated report: {str(e)}")
+        return redirect(url_for('view_attendance' if user_role == 'teacher' else 'admin_dashboard'))
+
+    download_name = f"attendance_{class_name}_{date_from or 'start'}_to_{date_to or 'latest'}.{fmt}"
+    return serve_file(attendance_store.CONSOLIDATED_CACHE_DIR,
+                      os.path.relpath(report_path, attendance_store.CONSOLIDATED_CACHE_DIR),
+                      as_attachment=True, download_name=download_name)
+
 # Sample Images Management Routes
 @app.route('/admin/sample-images')
 def admin_sample_images():
@@ -750,6 +1009,9 @@ def get_sample_images():
     images = [dict(row) for row in cursor.fetchall()]
     conn.close()
 
+    for image in images:
+        image['thumbnail_url'] = thumbnail_url(image)
+
     return jsonify({
         'images': images,
         'total': total_count,
@@ -773,12 +1035,29 @@ def get_sample_image_details(image_id):
     else:
         return jsonify({'error': 'Image not found'}), 404
 
+def students_changing_status(conn, image_ids, new_status):
+    """Dictionary of class -> students owning images whose status is about to change"""
+    affected = {}
+    placeholders = ','.join(['?' for _ in image_ids])
+    for class_name, student_name in conn.execute(f"""
+        SELECT DISTINCT class_name, student_name FROM sample_images
+        WHERE id IN ({placeholders}) AND status IS NOT ?
+    """, list(image_ids) + [new_status]):
+        affected.setdefault(class_name, set()).add(student_name)
+    return affected
+
+def refresh_rosters(affected):
+    """Queue one incremental roster update per class for the students whose samples changed"""
+    for class_name, student_names in affected.items():
+        queue_roster_update(class_name, student_names)
+
 @app.route('/api/sample-image/<int:image_id>/approve', methods=['POST'])
 def approve_sample_image(image_id):
     """Approve a sample image"""
     admin_id = request.json.get('admin_id', 'admin')
 
     conn = sqlite3.connect('attendance.db')
+    affected = students_changing_status(conn, [image_id], 'approved')
     conn.execute("""
         UPDATE sample_images 
         SET status = 'approved', 
@@ -788,6 +1067,7 @@ def approve_sample_image(image_id):
     """, (admin_id, image_id))
     conn.commit()
     conn.close()
+    refresh_rosters(affected)
 
     return jsonify({'success': True, 'message': 'Image approved successfully'})
 
@@ -798,6 +1078,7 @@ def reject_sample_image(image_id):
     reason = request.json.get('reason', 'Quality not acceptable')
 
     conn = sqlite3.connect('attendance.db')
+    affected = students_changing_status(conn, [image_id], 'rejected')
     conn.execute("""
         UPDATE sample_images 
         SET status = 'rejected', 
@@ -808,6 +1089,7 @@ def reject_sample_image(image_id):
     """, (reason, admin_id, image_id))
     conn.commit()
     conn.close()
+    refresh_rosters(affected)
 
     return jsonify({'success': True, 'message': 'Image rejected successfully'})
 
@@ -825,6 +1107,7 @@ def bulk_sample_action():
     conn = sqlite3.connect('attendance.db')
 
     if action == 'approve':
+        affected = students_changing_status(conn, image_ids, 'approved')
         placeholders = ','.join(['?' for _ in image_ids])
         conn.execute(f"""
             UPDATE sample_images 
@@ -836,6 +1119,7 @@ def bulk_sample_action():
         message = f'{len(image_ids)} images approved successfully'
 
     elif action == 'reject':
+        affected = students_changing_status(conn, image_ids, 'rejected')
         placeholders = ','.join(['?' for _ in image_ids])
         conn.execute(f"""
             UPDATE sample_images 
@@ -853,13 +1137,43 @@ def bulk_sample_action():
 
     conn.commit()
     conn.close()
+    refresh_rosters(affected)
 
     return jsonify({'success': True, 'message': message})
 
+def thumbnail_url(image, size=GRID_THUMBNAIL_SIZE):
+    """
+    Thumbnail URL for a sample_images row, versioned by the source file's mtime and size,
+    so a replaced photo gets a new URL despite the year-long max-age.
+    """
+    source_path = thumbnails.resolve_sample_path(image['image_path'], image['class_name'],
+                                                 image['student_name'], image['image_filename'])
+    return url_for('sample_thumbnail', image_id=image['id'], size=size, v=thumbnails.source_version(source_path))
+
+@app.route('/thumbnails/<int:image_id>/<int:size>')
+def sample_thumbnail(image_id, size):
+    """Serve a cached thumbnail of a sample image, generating it on first request"""
+    if size not in thumbnails.THUMBNAIL_SIZES:
+        abort(404)
+
+    conn = sqlite3.connect('attendance.db')
+    row = conn.execute("""
+        SELECT image_path, class_name, student_name, image_filename
+        FROM sample_images WHERE id = ?
+    """, (image_id,)).fetchone()
+    conn.close()
+
+    source_path = thumbnails.resolve_sample_path(*row) if row else None
+    if source_path is None:
+        abort(404)
+
+    relpath = thumbnails.get_thumbnail(source_path, size)
+    return serve_file(thumbnails.THUMBNAIL_DIR, relpath, max_age=THUMBNAIL_MAX_AGE)
+
 @app.route('/uploads/samples/<filename>')
 def serve_sample_image(filename):
     """Serve sample images"""
-    return send_from_directory('database/photo', filename)
+    return serve_file(UPLOAD_FOLDER_STUDENTS, filename, max_age=SAMPLE_IMAGE_MAX_AGE)
 
 @app.route('/api/classes')
 def get_classes():
@@ -886,7 +1200,10 @@ def get_classes():
         print(f"Error getting classes: {e}")
         return jsonify([])
 
-from init_db import initialize_database
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus-style text metrics for the attendance pipeline (per worker process)"""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == "__main__":
     app.run(debug=True)
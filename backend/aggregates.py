@@ -0,0 +1,225 @@
+import sqlite3
+
+from backend.attendance_store import DB_PATH
+
+# ==============================
+# Dashboard aggregates
+# ==============================
+# Summary tables are maintained by triggers on every write to users, sample_images
+# and attendance_records, so dashboard reads never scan the base tables. Distinct
+# counts use EXISTS probes on indexed columns, which stay cheap as the tables grow.
+
+SUMMARY_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS user_role_counts (
+        role VARCHAR(20) PRIMARY KEY,
+        user_count INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS sample_class_stats (
+        class_name VARCHAR(50) PRIMARY KEY,
+        total_students INTEGER NOT NULL DEFAULT 0,
+        total_samples INTEGER NOT NULL DEFAULT 0,
+        approved_samples INTEGER NOT NULL DEFAULT 0,
+        pending_samples INTEGER NOT NULL DEFAULT 0,
+        rejected_samples INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS attendance_class_stats (
+        class_name VARCHAR(50) PRIMARY KEY,
+        total_records INTEGER NOT NULL DEFAULT 0,
+        present_records INTEGER NOT NULL DEFAULT 0,
+        unique_students INTEGER NOT NULL DEFAULT 0,
+        unique_dates INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS idx_sample_class_student ON sample_images (class_name, student_id);
+"""
+
+TRIGGERS = """
+    CREATE TRIGGER IF NOT EXISTS trg_users_insert AFTER INSERT ON users
+    BEGIN
+        INSERT OR IGNORE INTO user_role_counts (role) VALUES (NEW.role);
+        UPDATE user_role_counts SET user_count = user_count + 1 WHERE role = NEW.role;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_users_delete AFTER DELETE ON users
+    BEGIN
+        UPDATE user_role_counts SET user_count = user_count - 1 WHERE role = OLD.role;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_users_role AFTER UPDATE OF role ON users
+    BEGIN
+        UPDATE user_role_counts SET user_count = user_count - 1 WHERE role = OLD.role;
+        INSERT OR IGNORE INTO user_role_counts (role) VALUES (NEW.role);
+        UPDATE user_role_counts SET user_count = user_count + 1 WHERE role = NEW.role;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_samples_insert AFTER INSERT ON sample_images
+    BEGIN
+        INSERT OR IGNORE INTO sample_class_stats (class_name) VALUES (NEW.class_name);
+        UPDATE sample_class_stats SET
+            total_samples = total_samples + 1,
+            approved_samples = approved_samples + (NEW.status IS 'approved'),
+            pending_samples = pending_samples + (NEW.status IS 'pending'),
+            rejected_samples = rejected_samples + (NEW.status IS 'rejected'),
+            total_students = total_students + (NEW.student_id IS NOT NULL AND NOT EXISTS (
+                SELECT 1 FROM sample_images
+                WHERE class_name = NEW.class_name AND student_id = NEW.student_id AND id != NEW.id))
+        WHERE class_name = NEW.class_name;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_samples_delete AFTER DELETE ON sample_images
+    BEGIN
+        UPDATE sample_class_stats SET
+            total_samples = total_samples - 1,
+            approved_samples = approved_samples - (OLD.status IS 'approved'),
+            pending_samples = pending_samples - (OLD.status IS 'pending'),
+            rejected_samples = rejected_samples - (OLD.status IS 'rejected'),
+            total_students = total_students - (OLD.student_id IS NOT NULL AND NOT EXISTS (
+                SELECT 1 FROM sample_images
+                WHERE class_name = OLD.class_name AND student_id = OLD.student_id))
+        WHERE class_name = OLD.class_name;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_samples_update AFTER UPDATE OF status, class_name, student_id ON sample_images
+    BEGIN
+        UPDATE sample_class_stats SET
+            total_samples = total_samples - 1,
+            approved_samples = approved_samples - (OLD.status IS 'approved'),
+            pending_samples = pending_samples - (OLD.status IS 'pending'),
+            rejected_samples = rejected_samples - (OLD.status IS 'rejected'),
+            total_students = total_students - (OLD.student_id IS NOT NULL AND NOT EXISTS (
+                SELECT 1 FROM sample_images
+                WHERE class_name = OLD.class_name AND student_id = OLD.student_id))
+        WHERE class_name = OLD.class_name;
+        INSERT OR IGNORE INTO sample_class_stats (class_name) VALUES (NEW.class_name);
+        UPDATE sample_class_stats SET
+            total_samples = total_samples + 1,
+            approved_samples = approved_samples + (NEW.status IS 'approved'),
+            pending_samples = pending_samples + (NEW.status IS 'pending'),
+            rejected_samples = rejected_samples + (NEW.status IS 'rejected'),
+            total_students = total_students + (NEW.student_id IS NOT NULL
+                AND (NEW.class_name IS NOT OLD.class_name OR NEW.student_id IS NOT OLD.student_id)
+                AND NOT EXISTS (
+                    SELECT 1 FROM sample_images
+                    WHERE class_name = NEW.class_name AND student_id = NEW.student_id AND id != NEW.id))
+        WHERE class_name = NEW.class_name;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_attendance_insert AFTER INSERT ON attendance_records
+    BEGIN
+        INSERT OR IGNORE INTO attendance_class_stats (class_name) VALUES (NEW.class_name);
+        UPDATE attendance_class_stats SET
+            total_records = total_records + 1,
+            present_records = present_records + (NEW.status IS 'Present'),
+            unique_students = unique_students + NOT EXISTS (
+                SELECT 1 FROM attendance_records
+                WHERE student_name = NEW.student_name AND class_name = NEW.class_name AND id != NEW.id),
+            unique_dates = unique_dates + NOT EXISTS (
+                SELECT 1 FROM attendance_records
+                WHERE class_name = NEW.class_name AND date = NEW.date AND id != NEW.id)
+        WHERE class_name = NEW.class_name;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_attendance_delete AFTER DELETE ON attendance_records
+    BEGIN
+        UPDATE attendance_class_stats SET
+            total_records = total_records - 1,
+            present_records = present_records - (OLD.status IS 'Present'),
+            unique_students = unique_students - NOT EXISTS (
+                SELECT 1 FROM attendance_records
+                WHERE student_name = OLD.student_name AND class_name = OLD.class_name),
+            unique_dates = unique_dates - NOT EXISTS (
+                SELECT 1 FROM attendance_records
+                WHERE class_name = OLD.class_name AND date = OLD.date)
+        WHERE class_name = OLD.class_name;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_attendance_status AFTER UPDATE OF status ON attendance_records
+    BEGIN
+        UPDATE attendance_class_stats SET
+            present_records = present_records - (OLD.status IS 'Present') + (NEW.status IS 'Present')
+        WHERE class_name = NEW.class_name;
+    END;
+"""
+
+def rebuild_aggregates(conn):
+    """Recompute every summary table from the base tables (initial backfill or repair)"""
+    conn.executescript("""
+        BEGIN IMMEDIATE;
+        DELETE FROM user_role_counts;
+        INSERT INTO user_role_counts (role, user_count)
+            SELECT role, COUNT(*) FROM users GROUP BY role;
+
+        DELETE FROM sample_class_stats;
+        INSERT INTO sample_class_stats
+            (class_name, total_students, total_samples, approved_samples, pending_samples, rejected_samples)
+            SELECT class_name,
+                   COUNT(DISTINCT student_id),
+                   COUNT(*),
+                   COUNT(CASE WHEN status = 'approved' THEN 1 END),
+                   COUNT(CASE WHEN status = 'pending' THEN 1 END),
+                   COUNT(CASE WHEN status = 'rejected' THEN 1 END)
+            FROM sample_images
+            WHERE class_name IS NOT NULL
+            GROUP BY class_name;
+
+        DELETE FROM attendance_class_stats;
+        INSERT INTO attendance_class_stats
+            (class_name, total_records, present_records, unique_students, unique_dates)
+            SELECT class_name,
+                   COUNT(*),
+                   COUNT(CASE WHEN status = 'Present' THEN 1 END),
+                   COUNT(DISTINCT student_name),
+                   COUNT(DISTINCT date)
+            FROM attendance_records
+            WHERE class_name IS NOT NULL
+            GROUP BY class_name;
+        COMMIT;
+    """)
+
+def install_aggregates(conn):
+    """
+    Create the summary tables and triggers, backfilling them on first install.
+    Expects users, sample_images and attendance_records to exist already. Safe to
+    race from several workers: the backfill is a full recompute under a write lock.
+    """
+    installed = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_attendance_status'"
+    ).fetchone()
+    if not installed:
+        conn.executescript("BEGIN IMMEDIATE;" + SUMMARY_SCHEMA + TRIGGERS + "COMMIT;")
+        rebuild_aggregates(conn)
+        print("[INFO] Dashboard aggregates installed")
+
+# ==========================================
+# Reads
+# ==========================================
+def get_connection():
+    conn = sqlite3.connect(DB_PATH, timeout=10)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def get_user_counts():
+    """Dictionary of role -> user count"""
+    conn = get_connection()
+    counts = {row["role"]: row["user_count"] for row in conn.execute("SELECT role, user_count FROM user_role_counts")}
+    conn.close()
+    return counts
+
+def get_class_statistics():
+    """Per-class sample and attendance summaries, shaped like /api/admin/class-statistics"""
+    conn = get_connection()
+    sample_stats = conn.execute("""
+        SELECT class_name, total_students, total_samples, approved_samples, pending_samples, rejected_samples
+        FROM sample_class_stats
+        WHERE total_samples > 0
+        ORDER BY class_name
+    """).fetchall()
+    attendance_stats = conn.execute("""
+        SELECT class_name, total_records, present_records, unique_students, unique_dates
+        FROM attendance_class_stats
+        WHERE total_records > 0
+        ORDER BY class_name
+    """).fetchall()
+    conn.close()
+    return [dict(row) for row in sample_stats], [dict(row) for row in attendance_stats]
+
+def get_class_names():
+    """Classes that currently have sample images"""
+    conn = get_connection()
+    classes = [row[0] for row in conn.execute(
+        "SELECT class_name FROM sample_class_stats WHERE total_samples > 0 ORDER BY class_name")]
+    conn.close()
+    return classes
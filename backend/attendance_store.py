@@ -0,0 +1,312 @@
+import os
+import uuid
+import sqlite3
+import threading
+from datetime import datetime
+from concurrent.futures import TimeoutError
+
+from backend import reports
+
+# ==============================
+# CONFIGURATION
+# ==============================
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # project root
+DB_PATH = os.path.join(BASE_DIR, "attendance.db")
+CONSOLIDATED_CACHE_DIR = os.path.join(BASE_DIR, "reports_cache") # Cached term reports
+CONSOLIDATED_TIMEOUT = int(os.environ.get("CONSOLIDATED_REPORT_TIMEOUT", 300)) # Seconds a download waits for its build
+
+_build_locks = {} # class name -> lock held while a consolidated build is checked and submitted
+_build_locks_guard = threading.Lock()
+_builds = {} # cache path -> Future of the consolidated build in progress
+
+def get_connection():
+    conn = sqlite3.connect(DB_PATH)
+    ensure_schema(conn)
+    return conn
+
+def ensure_schema(conn):
+    """Create the attendance tables if they do not exist yet"""
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS attendance_records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id VARCHAR(32) NOT NULL,
+            student_id VARCHAR(50),
+            student_name VARCHAR(100) NOT NULL,
+            class_name VARCHAR(50) NOT NULL,
+            date DATE NOT NULL,
+            time TIME NOT NULL,
+            status VARCHAR(20) NOT NULL,
+            confidence FLOAT
+        );
+        CREATE INDEX IF NOT EXISTS idx_attendance_class_date
+            ON attendance_records (class_name, date, session_id);
+        CREATE INDEX IF NOT EXISTS idx_attendance_student
+            ON attendance_records (student_name, class_name);
+
+        CREATE TABLE IF NOT EXISTS attendance_versions (
+            class_name VARCHAR(50) PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        );
+
+        CREATE TABLE IF NOT EXISTS report_index (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            class_name VARCHAR(50),
+            created_at DATETIME NOT NULL,
+            path TEXT NOT NULL UNIQUE,
+            size INTEGER DEFAULT 0,
+            present_count INTEGER,
+            absent_count INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_report_index_class
+            ON report_index (class_name, created_at);
+        CREATE INDEX IF NOT EXISTS idx_report_index_created
+            ON report_index (created_at);
+    """)
+
+# ==========================================
+# Recording sessions
+# ==========================================
+def record_session(class_name, results, session_time, confidences=None):
+    """
+    Store one attendance session and bump the class data version.
+    :param class_name: Class the session belongs to
+    :param results: Dictionary of student name -> "Present"/"Absent"
+    :param session_time: datetime of the session (stored in the date and time columns)
+    :param confidences: Optional dictionary of student name -> confidence
+    :return: Session id
+    """
+    confidences = confidences or {}
+    # Unique even for two sessions of a class in the same second (older rows used the timestamp)
+    session_id = uuid.uuid4().hex
+    date = session_time.strftime("%Y-%m-%d")
+    time = session_time.strftime("%H:%M:%S")
+
+    conn = get_connection()
+    with conn:
+        conn.executemany("""
+            INSERT INTO attendance_records (session_id, student_name, class_name, date, time, status, confidence)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, [(session_id, student, class_name, date, time, status, confidences.get(student))
+              for student, status in results.items()])
+        conn.execute("""
+            INSERT INTO attendance_versions (class_name, version) VALUES (?, 1)
+            ON CONFLICT(class_name) DO UPDATE SET version = version + 1
+        """, (class_name,))
+    conn.close()
+    return session_id
+
+def get_data_version(conn, class_name):
+    row = conn.execute("SELECT version FROM attendance_versions WHERE class_name = ?", (class_name,)).fetchone()
+    return row[0] if row else 0
+
+# ==========================================
+# Consolidated students x sessions report
+# ==========================================
+def iter_consolidated_rows(conn, class_name, date_from, date_to, sessions):
+    """
+    Yield one pivoted row per student: status per session, then present count,
+    total sessions and attendance percentage. Rows are built while the cursor is read.
+    """
+    column = {session_id: i for i, session_id in enumerate(sessions)}
+    cursor = conn.execute("""
+        SELECT student_name, session_id, status
+        FROM attendance_records
+        WHERE class_name = ? AND date BETWEEN ? AND ?
+        ORDER BY student_name, session_id
+    """, (class_name, date_from, date_to))
+
+    def finish(student, statuses):
+        present = sum(1 for status in statuses if status == "Present")
+        attended = sum(1 for status in statuses if status)
+        percentage = round(present / attended * 100, 1) if attended else 0.0
+        return [student] + [status or "-" for status in statuses] + [present, attended, percentage]
+
+    current, statuses = None, None
+    for student, session_id, status in cursor:
+        if session_id not in column:  # Recorded after the header was built; the next version has it
+            continue
+        if student != current:
+            if current is not None:
+                yield finish(current, statuses)
+            current, statuses = student, [""] * len(sessions)
+        statuses[column[session_id]] = status
+    if current is not None:
+        yield finish(current, statuses)
+
+def _consolidated_rows(class_name, date_from, date_to, sessions):
+    """iter_consolidated_rows on a connection of its own, so the report pool can consume it"""
+    conn = get_connection()
+    try:
+        yield from iter_consolidated_rows(conn, class_name, date_from, date_to, sessions)
+    finally:
+        conn.close()
+
+def _build_lock(class_name):
+    with _build_locks_guard:
+        return _build_locks.setdefault(class_name, threading.Lock())
+
+def _submit_consolidated(conn, class_name, date_from, date_to, version, cache_path, fmt):
+    """Queue the consolidated build on the report pool (call with the class build lock held)"""
+    # Older versions of this class's reports can never be served again
+    class_cache_dir = os.path.dirname(cache_path)
+    for file in os.listdir(class_cache_dir):
+        if f"_v{version}." not in file and not file.endswith(".part"):
+            try:
+                os.remove(os.path.join(class_cache_dir, file))
+            except FileNotFoundError:
+                pass  # Removed by another request or by retention
+
+    sessions, labels, seen = [], [], {}
+    for session_id, date, time in conn.execute("""
+        SELECT session_id, MIN(date), MIN(time) FROM attendance_records
+        WHERE class_name = ? AND date BETWEEN ? AND ?
+        GROUP BY session_id
+        ORDER BY MIN(date), MIN(time), MIN(id)
+    """, (class_name, date_from, date_to)):
+        # Columns are headed by session time; sessions in the same second are numbered
+        label = f"{date} {time}"
+        seen[label] = seen.get(label, 0) + 1
+        sessions.append(session_id)
+        labels.append(label if seen[label] == 1 else f"{label} ({seen[label]})")
+
+    # Built on the report pool, streaming rows from the cursor, not on the request thread
+    header = ["Student Name"] + labels + ["Present", "Sessions", "Attendance %"]
+    rows = _consolidated_rows(class_name, date_from, date_to, sessions)
+    future = reports.submit_report(cache_path, header, rows, fmt,
+                                   lambda path: print(f"[SUCCESS] Consolidated report saved at: {path}"))
+    _builds[cache_path] = future
+    future.add_done_callback(lambda finished: _builds.pop(cache_path, None))
+    return future
+
+def get_consolidated_report(class_name, date_from=None, date_to=None, fmt="xlsx"):
+    """
+    Build (or reuse) a students x sessions report for a class and date range.
+    Files are cached under CONSOLIDATED_CACHE_DIR keyed by class, range and data
+    version, so repeated downloads cost nothing until new attendance is recorded.
+    The file is written on the report pool; the caller waits up to CONSOLIDATED_TIMEOUT.
+    :return: Path of the report file
+    :raises RuntimeError: The report is not finished within CONSOLIDATED_TIMEOUT
+    """
+    if fmt not in reports.REPORT_FORMATS:
+        raise ValueError(f"Unsupported report format: {fmt}")
+    if not class_name or os.path.basename(class_name) != class_name or class_name.startswith('.'):
+        raise ValueError(f"Invalid class name: {class_name}")
+    for value in (date_from, date_to):
+        if value:
+            datetime.strptime(value, "%Y-%m-%d")  # Raises ValueError for anything but YYYY-MM-DD
+    date_from = date_from or "0000-01-01"
+    date_to = date_to or "9999-12-31"
+
+    # Concurrent requests for the same report wait for one build instead of each writing it
+    with _build_lock(class_name):
+        conn = get_connection()
+        try:
+            version = get_data_version(conn, class_name)
+            class_cache_dir = os.path.join(CONSOLIDATED_CACHE_DIR, class_name)
+            os.makedirs(class_cache_dir, exist_ok=True)
+            cache_path = os.path.join(class_cache_dir, f"{date_from}_{date_to}_v{version}.{fmt}")
+            if os.path.exists(cache_path):
+                return cache_path
+            future = _builds.get(cache_path)
+            if future is None:
+                future = _submit_consolidated(conn, class_name, date_from, date_to, version, cache_path, fmt)
+        finally:
+            conn.close()
+
+    try:
+        future.result(timeout=CONSOLIDATED_TIMEOUT)
+    except TimeoutError:
+        raise RuntimeError("The report is still being generated; please try again shortly")
+
+    return cache_path
+
+# ==========================================
+# Report index (replaces walking the reports directory)
+# ==========================================
+def register_report(path, class_name, created_at, size, present_count=None, absent_count=None):
+    """
+    Register a generated report file.
+    :param path: Report path relative to the reports directory (e.g. class101/attendance_...xlsx)
+    :param created_at: datetime the report was generated
+    """
+    conn = get_connection()
+    with conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO report_index (class_name, created_at, path, size, present_count, absent_count)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (class_name, created_at.strftime("%Y-%m-%d %H:%M:%S"), path, size, present_count, absent_count))
+    conn.close()
+
+def list_reports(class_name=None, page=1, per_page=50, date_from=None, date_to=None):
+    """
+    List registered reports, newest first.
+    :param date_from: Optional first day (YYYY-MM-DD) to include
+    :param date_to: Optional last day (YYYY-MM-DD) to include
+    :return: (list of report dictionaries, total count)
+    """
+    conn = get_connection()
+    conn.row_factory = sqlite3.Row
+    conditions, params = [], []
+    if class_name:
+        conditions.append("class_name = ?")
+        params.append(class_name)
+    if date_from:
+        conditions.append("created_at >= ?")
+        params.append(date_from)
+    if date_to:
+        conditions.append("created_at < date(?, '+1 day')")
+        params.append(date_to)
+    where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+
+    total = conn.execute(f"SELECT COUNT(*) FROM report_index {where}", params).fetchone()[0]
+    rows = conn.execute(f"""
+        SELECT id, class_name, created_at, path, size, present_count, absent_count
+        FROM report_index {where}
+        ORDER BY created_at DESC, id DESC
+        LIMIT ? OFFSET ?
+    """, params + [per_page, (max(page, 1) - 1) * per_page]).fetchall()
+    conn.close()
+
+    return [dict(row) for row in rows], total
+
+def _created_at_from_filename(path):
+    """attendance_<class>_<YYYY-mm-dd>_<HH-MM-SS>.xlsx -> datetime, else file mtime"""
+    parts = os.path.splitext(os.path.basename(path))[0].split('_')
+    try:
+        return datetime.strptime(f"{parts[-2]}_{parts[-1]}", "%Y-%m-%d_%H-%M-%S")
+    except (IndexError, ValueError):
+        return datetime.fromtimestamp(os.path.getmtime(path))
+
+def sync_report_index(reports_dir):
+    """
+    One-time migration: register report files already on disk that are not indexed yet.
+    Only walks the directory while the index is empty.
+    :return: Number of reports registered
+    """
+    conn = get_connection()
+    indexed = conn.execute("SELECT COUNT(*) FROM report_index").fetchone()[0]
+    if indexed or not os.path.isdir(reports_dir):
+        conn.close()
+        return 0
+
+    entries = []
+    for root, dirs, files in os.walk(reports_dir):
+        for file in files:
+            if not file.endswith('.xlsx'):
+                continue
+            full_path = os.path.join(root, file)
+            rel_path = os.path.relpath(full_path, reports_dir)
+            class_name = os.path.dirname(rel_path) or None
+            created_at = _created_at_from_filename(full_path)
+            entries.append((class_name, created_at.strftime("%Y-%m-%d %H:%M:%S"), rel_path,
+                            os.path.getsize(full_path), None, None))
+
+    with conn:
+        conn.executemany("""
+            INSERT OR IGNORE INTO report_index (class_name, created_at, path, size, present_count, absent_count)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, entries)
+    conn.close()
+    if entries:
+        print(f"[INFO] Indexed {len(entries)} existing reports")
+    return len(entries)
@@ -0,0 +1,309 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import resource
+import tempfile
+import numpy as np
+import cv2
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # project root
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+# Benchmarks track the CPU-only deployment, so hide any GPU before torch is imported
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+
+from backend import main
+
+# ==============================
+# CONFIGURATION
+# ==============================
+SCENE_SIZE = (1280, 720) # Width, height of synthetic classroom images
+DEFAULT_SCALES = (0.5, 0.75, 1.0) # Face size relative to a grid cell
+STAGES = ("decode", "detect", "crop", "embed", "match", "annotate", "report")
+
+# ==========================================
+# Build synthetic classroom images
+# ==========================================
+def make_background(rng):
+    """Vertical colour gradient with noise, roughly the tone range of a classroom wall"""
+    width, height = SCENE_SIZE
+    top = rng.integers(60, 200, size=3)
+    bottom = rng.integers(60, 200, size=3)
+    ramp = np.linspace(0.0, 1.0, height)[:, None, None]
+    background = top * (1 - ramp) + bottom * ramp
+    background = np.repeat(background, width, axis=1)
+    background += rng.normal(0, 6, size=background.shape)
+    return np.clip(background, 0, 255).astype(np.uint8)
+
+def build_synthetic_scenes(class_name, output_dir, num_scenes=10, faces_per_scene=6,
+                           scales=DEFAULT_SCALES, seed=0):
+    """
+    Composite enrollment photos of a class onto generated backgrounds.
+    The faces come from the enrollment set itself, so recall here is an upper bound and
+    the numbers are meant for catching regressions rather than estimating field accuracy.
+    :return: List of (image_path, set of ground-truth student names, list of placed
+             photo rectangles as x1, y1, x2, y2)
+    """
+    rng = np.random.default_rng(seed)
+    picker = random.Random(seed)
+    enrollment = main.get_enrollment_images(class_name)
+    students = sorted(name for name, images in enrollment.items() if images)
+    if not students:
+        raise RuntimeError(f"No enrollment images found for class {class_name}")
+
+    width, height = SCENE_SIZE
+    columns = int(np.ceil(np.sqrt(faces_per_scene * width / height)))
+    rows = int(np.ceil(faces_per_scene / columns))
+    cell_w, cell_h = width // columns, height // rows
+
+    scenes = []
+    for scene_idx in range(num_scenes):
+        canvas = make_background(rng)
+        chosen = picker.sample(students, min(faces_per_scene, len(students)))
+        cells = picker.sample(range(columns * rows), len(chosen))
+        placed = []
+        present = set()  # Only students actually pasted are ground truth
+
+        for student_name, cell in zip(chosen, cells):
+            image_path, _ = picker.choice(enrollment[student_name])
+            face = cv2.imread(image_path)
+            if face is None:
+                continue
+            scale = picker.choice(scales)
+            fit = min(cell_w / face.shape[1], cell_h / face.shape[0]) * scale
+            face = cv2.resize(face, (max(1, int(face.shape[1] * fit)), max(1, int(face.shape[0] * fit))))
+
+            x0 = (cell % columns) * cell_w + (cell_w - face.shape[1]) // 2
+            y0 = (cell // columns) * cell_h + (cell_h - face.shape[0]) // 2
+            canvas[y0:y0 + face.shape[0], x0:x0 + face.shape[1]] = face
+            placed.append((x0, y0, x0 + face.shape[1], y0 + face.shape[0]))
+            present.add(student_name)
+
+        scene_path = os.path.join(output_dir, f"scene_{scene_idx:03d}.jpg")
+        cv2.imwrite(scene_path, canvas)
+        scenes.append((scene_path, present, placed))
+
+    return scenes
+
+# ==========================================
+# Timed pipeline run over one image
+# ==========================================
+def run_pipeline_timed(image_path, roster, class_name):
+    """
+    Run every recognition stage on one image, timing each separately.
+    :return: (dictionary of stage -> seconds, set of recognised names, face count)
+    """
+    timings = {}
+
+    start = time.perf_counter()
+    img = cv2.imread(image_path)
+    img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    timings["decode"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    boxes, landmarks = main.detect_faces(img_rgb)
+    timings["detect"] = time.perf_counter() - start
+    if boxes is None:
+        boxes = np.empty((0, 4), dtype=np.float32)
+
+    start = time.perf_counter()
+    face_boxes = [[int(b) for b in box] for box in boxes]
+    crops = main.preprocess.crop_faces(main.preprocess.image_to_tensor(img_rgb, main.device), boxes, landmarks)
+    timings["crop"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    face_embeddings = main.engine(crops) if len(crops) else np.empty((0, 512))
+    timings["embed"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matches = main.match_faces(face_embeddings, roster) if len(crops) else []
+    timings["match"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for (x1, y1, x2, y2), (name, dist) in zip(face_boxes, matches):
+        cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        cv2.putText(img, f"{name} ({dist:.2f})", (x1, y1 - 10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+    cv2.imencode(".jpg", img)
+    timings["annotate"] = time.perf_counter() - start
+
+    recognised = {name for name, _ in matches if name != "Unknown"}
+
+    start = time.perf_counter()
+    main.generate_excel_report(recognised, class_name)
+    timings["report"] = time.perf_counter() - start
+
+    return timings, recognised, len(face_boxes)
+
+# ==========================================
+# Summaries
+# ==========================================
+def latency_summary(samples):
+    samples = np.array(samples) * 1000.0
+    return {
+        "p50_ms": round(float(np.percentile(samples, 50)), 3),
+        "p95_ms": round(float(np.percentile(samples, 95)), 3),
+        "mean_ms": round(float(samples.mean()), 3),
+    }
+
+def detector_summary(detector, scenes):
+    """
+    Detection-only recall and latency of one detector over the synthetic scenes.
+    A placed photo counts as found when some detected box has its centre inside it.
+    """
+    samples = []
+    placed_total = found = detected = 0
+    for scene_path, _, placed in scenes:
+        img_rgb = cv2.cvtColor(cv2.imread(scene_path), cv2.COLOR_BGR2RGB)
+        start = time.perf_counter()
+        boxes, _, _ = detector(img_rgb)
+        samples.append(time.perf_counter() - start)
+
+        boxes = np.empty((0, 4)) if boxes is None else np.asarray(boxes)
+        centres = (boxes[:, :2] + boxes[:, 2:]) / 2
+        detected += len(boxes)
+        placed_total += len(placed)
+        for x1, y1, x2, y2 in placed:
+            inside = (centres[:, 0] >= x1) & (centres[:, 0] <= x2) & (centres[:, 1] >= y1) & (centres[:, 1] <= y2)
+            found += bool(inside.any())
+
+    return {
+        "recall": round(found / max(placed_total, 1), 4),
+        "faces_placed": placed_total,
+        "boxes_detected": detected,
+        "latency": latency_summary(samples),
+    }
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+# ==========================================
+# Benchmark entry point
+# ==========================================
+def run_benchmark(class_name, num_scenes=10, faces_per_scene=6, scales=DEFAULT_SCALES,
+                  seed=0, include_build=False, threads=None, detectors=()):
+    """
+    Benchmark the recognition pipeline on synthetic classroom images.
+    Rosters, roster snapshots, reports and the attendance sessions recorded with them
+    are written to a scratch directory and database, never to the live folders,
+    the shared snapshot store or attendance.db.
+    :param detectors: Extra face detector backends to compare on the same scenes
+                      (detection recall and latency only)
+    :return: Dictionary of results (JSON-serialisable)
+    """
+    if threads:
+        main.torch.set_num_threads(threads)
+
+    scratch = tempfile.mkdtemp(prefix="attendance_bench_")
+    live_output_dir, live_reports_dir = main.OUTPUT_DIR, main.REPORTS_DIR
+    live_attendance_db = main.attendance_store.DB_PATH
+    live_snapshot_dir = main.roster_sync.SNAPSHOT_DIR
+    results = {
+        "class": class_name,
+        "device": main.device,
+        "inference_backend": main.engine.name,
+        "face_detector": main.detector.name,
+        "torch_threads": main.torch.get_num_threads(),
+        "scenes": num_scenes,
+        "faces_per_scene": faces_per_scene,
+        "scales": list(scales),
+    }
+
+    try:
+        main.REPORTS_DIR = os.path.join(scratch, "reports")
+        os.makedirs(main.REPORTS_DIR)
+        # generate_excel_report records a session and indexes the report; keep both out of the live history
+        main.attendance_store.DB_PATH = os.path.join(scratch, "attendance.db")
+
+        if include_build:
+            # Saving a roster publishes it; other nodes must never pull a benchmark roster
+            main.roster_sync.SNAPSHOT_DIR = os.path.join(scratch, "snapshots")
+            main.OUTPUT_DIR = os.path.join(scratch, "roster")
+            os.makedirs(main.OUTPUT_DIR)
+            start = time.perf_counter()
+            main.build_class_embeddings(class_name)
+            results["build_class_embeddings_s"] = round(time.perf_counter() - start, 3)
+        roster = main.load_roster(class_name)
+
+        scene_dir = os.path.join(scratch, "scenes")
+        os.makedirs(scene_dir)
+        scenes = build_synthetic_scenes(class_name, scene_dir, num_scenes, faces_per_scene, scales, seed)
+
+        stage_samples = {stage: [] for stage in STAGES}
+        totals = []
+        true_positives = false_positives = false_negatives = faces_detected = 0
+
+        for scene_path, truth, _ in scenes:
+            timings, recognised, face_count = run_pipeline_timed(scene_path, roster, class_name)
+            for stage in STAGES:
+                stage_samples[stage].append(timings[stage])
+            totals.append(sum(timings.values()))
+            faces_detected += face_count
+            true_positives += len(recognised & truth)
+            false_positives += len(recognised - truth)
+            false_negatives += len(truth - recognised)
+
+        total_time = sum(totals)
+        results["stages"] = {stage: latency_summary(samples) for stage, samples in stage_samples.items()}
+        results["per_image"] = latency_summary(totals)
+        results["throughput"] = {
+            "images_per_s": round(len(scenes) / total_time, 3) if total_time else None,
+            "faces_per_s": round(faces_detected / total_time, 3) if total_time else None,
+        }
+        results["accuracy"] = {
+            "faces_detected": faces_detected,
+            "true_positives": true_positives,
+            "false_positives": false_positives,
+            "false_negatives": false_negatives,
+            "precision": round(true_positives / max(true_positives + false_positives, 1), 4),
+            "recall": round(true_positives / max(true_positives + false_negatives, 1), 4),
+        }
+        if detectors:
+            results["detectors"] = {}
+            for backend in detectors:
+                detector = main.detection.load_detector(main.mtcnn, backend)
+                if detector.name != backend:
+                    results["detectors"][backend] = {"available": False}
+                    continue
+                results["detectors"][backend] = {"available": True, **detector_summary(detector, scenes)}
+        results["peak_rss_mb"] = peak_rss_mb()
+    finally:
+        main.OUTPUT_DIR, main.REPORTS_DIR = live_output_dir, live_reports_dir
+        main.attendance_store.DB_PATH = live_attendance_db
+        main.roster_sync.SNAPSHOT_DIR = live_snapshot_dir
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Accuracy and latency benchmark for the recognition pipeline")
+    parser.add_argument("class_name", help="Class whose enrollment photos are used")
+    parser.add_argument("--scenes", type=int, default=10, help="Number of synthetic classroom images")
+    parser.add_argument("--faces", type=int, default=6, help="Faces composited per image")
+    parser.add_argument("--scales", type=float, nargs="+", default=list(DEFAULT_SCALES),
+                        help="Face scales relative to a grid cell")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    parser.add_argument("--include-build", action="store_true",
+                        help="Also time build_class_embeddings into a scratch roster")
+    parser.add_argument("--detectors", default="",
+                        help="Comma-separated face detectors to compare, e.g. mtcnn,haar,dnn+mtcnn")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.class_name, args.scenes, args.faces, tuple(args.scales),
+                           args.seed, args.include_build, args.threads,
+                           [name for name in args.detectors.split(",") if name])
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[SUCCESS] Benchmark results saved at: {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,312 @@
+import os
+import uuid
+import shutil
+import sqlite3
+import tarfile
+import zipfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# fcntl is POSIX only; without it chunks are serialised within one process only
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from backend.attendance_store import BASE_DIR, DB_PATH
+from sample_image_utils import register_sample_entries
+
+# ==============================
+# CONFIGURATION
+# ==============================
+DATASET_DIR = os.path.join(BASE_DIR, "database", "photo") # Student images
+STAGING_DIR = os.path.join(BASE_DIR, "database", "bulk_uploads") # Archives being received
+MAX_IMAGE_BYTES = 20 * 1024 * 1024 # Larger archive members are skipped
+MAX_UPLOAD_BYTES = int(os.environ.get("BULK_ENROLLMENT_MAX_BYTES", 2 * 1024 ** 3)) # Largest archive accepted
+PROGRESS_INTERVAL = 50 # Images between progress updates
+COPY_CHUNK_BYTES = 1024 * 1024
+
+# Only the header is checked; images are stored exactly as uploaded, never re-encoded
+IMAGE_SIGNATURES = {
+    '.jpg': b"\xff\xd8\xff",
+    '.jpeg': b"\xff\xd8\xff",
+    '.png': b"\x89PNG\r\n\x1a\n",
+}
+
+os.makedirs(STAGING_DIR, exist_ok=True)
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="enrollment")
+_locks = {}
+_locks_guard = threading.Lock()
+
+def get_connection():
+    conn = sqlite3.connect(DB_PATH, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS bulk_uploads (
+            upload_id VARCHAR(32) PRIMARY KEY,
+            filename TEXT,
+            uploaded_by VARCHAR(50),
+            total_bytes INTEGER NOT NULL,
+            bytes_received INTEGER NOT NULL DEFAULT 0,
+            status VARCHAR(20) NOT NULL DEFAULT 'receiving',
+            images_found INTEGER NOT NULL DEFAULT 0,
+            images_stored INTEGER NOT NULL DEFAULT 0,
+            images_skipped INTEGER NOT NULL DEFAULT 0,
+            images_registered INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    return conn
+
+def staging_path(upload_id):
+    return os.path.join(STAGING_DIR, f"{upload_id}.part")
+
+def _update(upload_id, **fields):
+    conn = get_connection()
+    assignments = ", ".join(f"{column} = ?" for column in fields)
+    with conn:
+        conn.execute(f"UPDATE bulk_uploads SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE upload_id = ?",
+                     list(fields.values()) + [upload_id])
+    conn.close()
+
+# ==========================================
+# Receiving (chunked and resumable)
+# ==========================================
+def create_upload(total_bytes, filename=None, uploaded_by=None):
+    """
+    Start a bulk enrollment upload.
+    :param total_bytes: Size of the whole archive
+    :return: The new upload ID
+    """
+    if total_bytes <= 0:
+        raise ValueError("total_bytes must be positive")
+    if total_bytes > MAX_UPLOAD_BYTES:
+        raise ValueError(f"Archive is larger than the {MAX_UPLOAD_BYTES} byte limit")
+    upload_id = uuid.uuid4().hex
+    conn = get_connection()
+    with conn:
+        conn.execute("INSERT INTO bulk_uploads (upload_id, filename, uploaded_by, total_bytes) VALUES (?, ?, ?, ?)",
+                     (upload_id, filename, uploaded_by, total_bytes))
+    conn.close()
+    open(staging_path(upload_id), "wb").close()
+    return upload_id
+
+def get_upload(upload_id):
+    """Status and progress of an upload, or None if it does not exist"""
+    conn = get_connection()
+    row = conn.execute("SELECT * FROM bulk_uploads WHERE upload_id = ?", (upload_id,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+def forget_upload(upload_id):
+    """Drop the chunk lock of an upload that no longer receives chunks"""
+    with _locks_guard:
+        _locks.pop(upload_id, None)
+
+def _check_receiving(upload, upload_id):
+    """
+    :return: The upload, if it still accepts chunks
+    :raises KeyError: Unknown upload
+    :raises ValueError: Upload is no longer receiving
+    """
+    if upload is None:
+        forget_upload(upload_id)
+        raise KeyError(upload_id)
+    if upload["status"] != "receiving":
+        forget_upload(upload_id)
+        raise ValueError(f"Upload is already {upload['status']}")
+    return upload
+
+def append_chunk(upload_id, offset, stream, on_complete=None):
+    """
+    Append one chunk of the archive. Clients resume an interrupted upload by asking
+    for bytes_received and sending from there.
+    :param offset: Byte offset the chunk starts at; must equal bytes_received
+    :param stream: File-like object with the chunk bytes (read incrementally)
+    :param on_complete: Passed to process_upload once the last byte has arrived
+    :return: Upload dictionary after the chunk was written
+    :raises KeyError: Unknown upload
+    :raises ValueError: Offset does not match what has been received so far
+    """
+    _check_receiving(get_upload(upload_id), upload_id)
+
+    # One writer per upload: a second chunk arriving meanwhile (e.g. a client retry)
+    # is turned away and resumes from bytes_received, instead of interleaving writes
+    with _locks_guard:
+        lock = _locks.setdefault(upload_id, threading.Lock())
+    if not lock.acquire(blocking=False):
+        raise ValueError("Another chunk of this upload is being written")
+    try:
+        # Never created here: a late chunk after processing removed the file must not recreate it
+        try:
+            fd = os.open(staging_path(upload_id), os.O_WRONLY | os.O_APPEND)
+        except FileNotFoundError:
+            raise ValueError("Upload has no staging file; start a new upload")
+        with os.fdopen(fd, "ab") as f:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    raise ValueError("Another chunk of this upload is being written")
+
+            # Status and size are checked again once the lock is held
+            upload = _check_receiving(get_upload(upload_id), upload_id)
+            received = os.fstat(f.fileno()).st_size
+            if offset != received:
+                raise ValueError(f"Expected offset {received}")
+
+            remaining = upload["total_bytes"] - received
+            while remaining > 0:
+                chunk = stream.read(min(COPY_CHUNK_BYTES, remaining))
+                if not chunk:
+                    break
+                f.write(chunk)
+                remaining -= len(chunk)
+            f.flush()
+            received = os.fstat(f.fileno()).st_size
+
+            if received >= upload["total_bytes"]:
+                _update(upload_id, bytes_received=received, status="queued")
+                _executor.submit(process_upload, upload_id, on_complete)
+                forget_upload(upload_id)  # Later chunks see the status and are rejected
+            else:
+                _update(upload_id, bytes_received=received)
+    finally:
+        lock.release()
+    return get_upload(upload_id)
+
+# ==========================================
+# Processing
+# ==========================================
+def _archive_members(path):
+    """
+    Yield (member name, size, file object) for every regular file in a ZIP or tar archive.
+    Tar archives (optionally gzip/bz2/xz compressed) are read as a stream; ZIP members
+    are opened one at a time from the central directory.
+    """
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                with archive.open(info) as f:
+                    yield info.filename, info.file_size, f
+    else:
+        with tarfile.open(path, mode="r|*") as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                yield member.name, member.size, archive.extractfile(member)
+
+def parse_member_name(name):
+    """
+    Split an archive path into (class, student, filename), allowing one optional
+    top-level folder. Returns None for anything that is not class/student/image.
+    """
+    parts = [part for part in name.replace("\\", "/").split("/") if part and part != "."]
+    if len(parts) < 3 or len(parts) > 4 or ".." in parts:
+        return None
+    class_name, student_name, filename = parts[-3:]
+    for part in (class_name, student_name, filename):
+        if part == ".." or part.startswith(".") or part.startswith("__MACOSX"):
+            return None
+    if os.path.splitext(filename)[1].lower() not in IMAGE_SIGNATURES:
+        return None
+    return class_name, student_name, filename
+
+def _store_member(f, destination):
+    """Copy an archive member to destination unchanged. False if it is not a valid image."""
+    header = f.read(8)
+    if not header.startswith(IMAGE_SIGNATURES[os.path.splitext(destination)[1].lower()]):
+        return False
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    partial = f"{destination}.part"
+    with open(partial, "wb") as out:
+        out.write(header)
+        shutil.copyfileobj(f, out, COPY_CHUNK_BYTES)
+    os.replace(partial, destination)
+    return True
+
+def process_upload(upload_id, on_complete=None):
+    """
+    Unpack a received archive into database/photo/<class>/<student>/ and register
+    the new images in sample_images in one transaction. Images that are already
+    stored and registered are skipped, so re-processing an archive is harmless.
+    :param on_complete: Optional callback called with {class name: set of students}
+    :return: Upload dictionary with the final counts
+    """
+    upload = get_upload(upload_id)
+    path = staging_path(upload_id)
+    print(f"[INFO] Processing bulk enrollment upload {upload_id}")
+    _update(upload_id, status="processing")
+
+    registered = {}
+    def already_registered(class_name):
+        if class_name not in registered:
+            conn = get_connection()
+            registered[class_name] = {(row[0], row[1]) for row in conn.execute(
+                "SELECT student_name, image_filename FROM sample_images WHERE class_name = ?", (class_name,))}
+            conn.close()
+        return registered[class_name]
+
+    found = stored = skipped = 0
+    entries = []
+    affected = {}
+    try:
+        for name, size, f in _archive_members(path):
+            parsed = parse_member_name(name)
+            if parsed is None:
+                continue
+            class_name, student_name, filename = parsed
+            found += 1
+
+            destination = os.path.join(DATASET_DIR, class_name, student_name, filename)
+            if size > MAX_IMAGE_BYTES:
+                skipped += 1
+                print(f"[WARNING] Skipping {name}: larger than {MAX_IMAGE_BYTES} bytes")
+            elif os.path.exists(destination) and os.path.getsize(destination) == size:
+                skipped += 1  # Already stored by an earlier run of this archive
+            elif _store_member(f, destination):
+                stored += 1
+            else:
+                skipped += 1
+                print(f"[WARNING] Skipping {name}: not a valid image")
+                continue
+
+            if os.path.exists(destination) and (student_name, filename) not in already_registered(class_name):
+                entries.append((destination, student_name, class_name))
+                affected.setdefault(class_name, set()).add(student_name)
+
+            if found % PROGRESS_INTERVAL == 0:
+                _update(upload_id, images_found=found, images_stored=stored, images_skipped=skipped)
+
+        _update(upload_id, status="registering", images_found=found, images_stored=stored, images_skipped=skipped)
+        count = register_sample_entries(
+            entries, approved_by=upload["uploaded_by"],
+            progress=lambda scored: _update(upload_id, images_registered=scored))
+        _update(upload_id, status="done", images_registered=count)
+        os.remove(path)
+        print(f"[SUCCESS] Bulk enrollment {upload_id}: {stored} stored, {skipped} skipped, {count} registered")
+    except Exception as e:
+        _update(upload_id, status="failed", error=str(e),
+                images_found=found, images_stored=stored, images_skipped=skipped)
+        print(f"[ERROR] Bulk enrollment {upload_id} failed: {e}")
+        return get_upload(upload_id)
+
+    if on_complete is not None and affected:
+        on_complete(affected)
+    return get_upload(upload_id)
+
+def retry_upload(upload_id, on_complete=None):
+    """Queue a fully received upload whose processing failed for another attempt"""
+    upload = get_upload(upload_id)
+    if upload is None:
+        raise KeyError(upload_id)
+    if upload["status"] != "failed" or not os.path.exists(staging_path(upload_id)):
+        raise ValueError(f"Upload is {upload['status']} and cannot be retried")
+    _update(upload_id, status="queued", error=None)
+    _executor.submit(process_upload, upload_id, on_complete)
+    return get_upload(upload_id)
@@ -0,0 +1,177 @@
+import os
+import numpy as np
+import cv2
+
+# ==============================
+# CONFIGURATION
+# ==============================
+# Single-stage: 'mtcnn', 'dnn' (OpenCV res10 SSD), 'haar'.
+# Two-stage: '<cheap>+mtcnn' - the cheap detector proposes regions and MTCNN only runs on those.
+DETECTOR_BACKENDS = ('mtcnn', 'dnn', 'haar', 'dnn+mtcnn', 'haar+mtcnn')
+FACE_DETECTOR = os.environ.get("FACE_DETECTOR", "mtcnn")
+
+# res10 SSD files, registered with: python -m backend.model_registry add <name> <file>
+DNN_PROTOTXT = "opencv_res10_prototxt"      # deploy.prototxt
+DNN_WEIGHTS = "opencv_res10_caffemodel"     # res10_300x300_ssd_iter_140000.caffemodel
+DNN_INPUT_SIZE = (300, 300)
+DNN_MEAN = (104.0, 177.0, 123.0)
+DNN_CONFIDENCE = 0.5 # Minimum confidence when the SSD is the only detector
+PROPOSAL_CONFIDENCE = 0.3 # Lower bar for proposals, since MTCNN rejects false positives
+PROPOSAL_MARGIN = 0.4 # Proposal boxes are grown by this fraction of their size on each side
+MERGE_IOU = 0.5 # Refined boxes overlapping more than this are the same face
+MIN_REGION = 20 # Proposals smaller than MTCNN's minimum face size are dropped
+
+# ==========================================
+# Detector backends
+# ==========================================
+# Every detector takes a decoded RGB frame and returns (boxes, probs, landmarks):
+# boxes is N x 4 (x1, y1, x2, y2 in pixels) sorted by confidence, or None when no face
+# was found; landmarks is N x 5 x 2 (MTCNN order) or None if the backend has none.
+class FaceDetector:
+    def __init__(self, name, detect):
+        self.name = name
+        self._detect = detect
+
+    def __call__(self, img_rgb, landmarks=False):
+        return self._detect(img_rgb, landmarks)
+
+def _sorted(boxes, probs, landmarks=None):
+    if len(boxes) == 0:
+        return None, None, None
+    order = np.argsort(-probs)
+    return boxes[order], probs[order], None if landmarks is None else landmarks[order]
+
+def _mtcnn_detect(mtcnn):
+    def detect(img_rgb, landmarks=False):
+        if landmarks:
+            return mtcnn.detect(img_rgb, landmarks=True)
+        boxes, probs = mtcnn.detect(img_rgb)
+        return boxes, probs, None
+    return detect
+
+def _dnn_detect(confidence):
+    from backend import model_registry
+
+    prototxt = model_registry.verified_path(DNN_PROTOTXT)
+    weights = model_registry.verified_path(DNN_WEIGHTS)
+    if prototxt is None or weights is None:
+        raise RuntimeError(f"Register the res10 SSD files as {DNN_PROTOTXT} and {DNN_WEIGHTS}")
+    net = cv2.dnn.readNetFromCaffe(prototxt, weights)
+
+    def detect(img_rgb, landmarks=False):
+        height, width = img_rgb.shape[:2]
+        blob = cv2.dnn.blobFromImage(cv2.resize(img_rgb, DNN_INPUT_SIZE), 1.0, DNN_INPUT_SIZE,
+                                     DNN_MEAN, swapRB=True)  # The SSD was trained on BGR
+        net.setInput(blob)
+        detections = net.forward()[0, 0]
+        detections = detections[detections[:, 2] >= confidence]
+        boxes = detections[:, 3:7] * np.array([width, height, width, height], dtype=np.float32)
+        boxes = np.clip(boxes, 0, [width, height, width, height]).astype(np.float32)
+        keep = (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
+        return _sorted(boxes[keep], detections[keep, 2].astype(np.float32))
+    return detect
+
+def _haar_detect():
+    from sample_image_utils import get_face_cascade
+
+    cascade = get_face_cascade()
+    if cascade.empty():
+        raise RuntimeError("Haar cascade file could not be loaded")
+
+    def detect(img_rgb, landmarks=False):
+        gray = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2GRAY)
+        faces = np.asarray(cascade.detectMultiScale(gray, 1.1, 4), dtype=np.float32).reshape(-1, 4)
+        boxes = np.concatenate([faces[:, :2], faces[:, :2] + faces[:, 2:]], axis=1)
+        # Haar gives no confidence; larger faces first, like the most confident MTCNN face
+        return _sorted(boxes, faces[:, 2] * faces[:, 3])
+    return detect
+
+def _box_iou(box, boxes):
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = lambda b: (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return inter / np.maximum(area(box) + area(boxes) - inter, 1e-6)
+
+def _two_stage_detect(propose, refine):
+    """
+    Run the cheap detector on the whole frame and MTCNN only on the proposed regions.
+    Faces the cheap detector misses are missed; that recall cost is what the benchmark
+    reports for each combination.
+    """
+    def detect(img_rgb, landmarks=False):
+        proposals, _, _ = propose(img_rgb)
+        if proposals is None:
+            return None, None, None
+
+        height, width = img_rgb.shape[:2]
+        found_boxes, found_probs, found_landmarks = [], [], []
+        for x1, y1, x2, y2 in proposals:
+            margin_x, margin_y = (x2 - x1) * PROPOSAL_MARGIN, (y2 - y1) * PROPOSAL_MARGIN
+            left, top = int(max(x1 - margin_x, 0)), int(max(y1 - margin_y, 0))
+            right, bottom = int(min(x2 + margin_x, width)), int(min(y2 + margin_y, height))
+            if right - left < MIN_REGION or bottom - top < MIN_REGION:
+                continue
+            boxes, probs, points = refine(img_rgb[top:bottom, left:right], landmarks)
+            if boxes is None:
+                continue
+            offset = np.array([left, top], dtype=np.float32)
+            found_boxes.append(boxes + np.tile(offset, 2))
+            found_probs.append(probs)
+            if points is not None:
+                found_landmarks.append(points + offset)
+
+        if not found_boxes:
+            return None, None, None
+        boxes, probs, points = _sorted(np.concatenate(found_boxes).astype(np.float32),
+                                       np.concatenate(found_probs),
+                                       np.concatenate(found_landmarks) if found_landmarks else None)
+
+        # Overlapping proposals can find the same face twice; keep the most confident one
+        keep = []
+        for i in range(len(boxes)):
+            if not keep or _box_iou(boxes[i], boxes[keep]).max() <= MERGE_IOU:
+                keep.append(i)
+        return boxes[keep], probs[keep], None if points is None else points[keep]
+    return detect
+
+def _build(name, mtcnn, proposal=False):
+    if name == 'mtcnn':
+        return _mtcnn_detect(mtcnn)
+    if name == 'dnn':
+        return _dnn_detect(PROPOSAL_CONFIDENCE if proposal else DNN_CONFIDENCE)
+    if name == 'haar':
+        return _haar_detect()
+    raise ValueError(name)
+
+def load_detector(mtcnn, backend=FACE_DETECTOR):
+    """
+    Build the requested face detector.
+    An unknown backend, or one whose model files or OpenCV support are missing, falls
+    back to MTCNN with a warning, so a bad setting never stops the service.
+    :param mtcnn: Loaded MTCNN (used by 'mtcnn' and as the refiner of two-stage backends)
+    :param backend: One of DETECTOR_BACKENDS
+    :return: FaceDetector
+    """
+    if backend not in DETECTOR_BACKENDS:
+        print(f"[WARNING] Unknown face detector '{backend}' (choose from {', '.join(DETECTOR_BACKENDS)}); using mtcnn")
+        return load_detector(mtcnn, 'mtcnn')
+
+    try:
+        if '+' in backend:
+            proposer, refiner = backend.split('+')
+            detect = _two_stage_detect(_build(proposer, mtcnn, proposal=True), _build(refiner, mtcnn))
+        else:
+            detect = _build(backend, mtcnn)
+        detector = FaceDetector(backend, detect)
+        detector(np.zeros((64, 64, 3), dtype=np.uint8))  # Surface OpenCV errors at load
+    except Exception as e:
+        if backend == 'mtcnn':
+            raise
+        print(f"[WARNING] Face detector '{backend}' unavailable ({e}); using mtcnn")
+        return load_detector(mtcnn, 'mtcnn')
+
+    print(f"[INFO] Face detector: {backend}")
+    return detector
@@ -0,0 +1,204 @@
+import os
+import sys
+import copy
+import json
+import time
+import argparse
+import numpy as np
+import torch
+
+# ONNX Runtime is optional; every other backend only needs torch
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+# ==============================
+# CONFIGURATION
+# ==============================
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # project root
+MODEL_CACHE_DIR = os.path.join(BASE_DIR, "model_cache") # Exported ONNX graphs
+INFERENCE_BACKENDS = ('eager', 'int8', 'torchscript', 'compile', 'onnx')
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "eager")
+FACE_SHAPE = (3, 160, 160)
+MAX_COSINE_DRIFT = 0.02 # Parity check fails above this drift from fp32
+
+# ==========================================
+# Inference engines
+# ==========================================
+# Every engine takes a float32 face batch (N x 3 x 160 x 160, already normalised) and
+# returns numpy embeddings (N x 512), so callers never care which backend is active.
+class InferenceEngine:
+    def __init__(self, name, forward, device='cpu'):
+        self.name = name
+        self.device = device
+        self._forward = forward
+
+    def __call__(self, faces):
+        with torch.inference_mode():
+            return self._forward(faces)
+
+def _torch_forward(module):
+    return lambda faces: module(faces).cpu().numpy()
+
+def _build_eager(model, device):
+    return _torch_forward(model)
+
+def _build_int8(model, device):
+    """Dynamic int8 quantization (weights int8, activations quantised on the fly)"""
+    if device != 'cpu':
+        raise RuntimeError("int8 dynamic quantization is CPU only")
+    quantized = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return _torch_forward(quantized)
+
+def _build_torchscript(model, device):
+    """Traced, frozen and inference-optimised TorchScript graph"""
+    example = torch.zeros(1, *FACE_SHAPE, device=device)
+    with torch.inference_mode():
+        traced = torch.jit.trace(model, example)
+    frozen = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+    return _torch_forward(frozen)
+
+def _build_compile(model, device):
+    compiled = torch.compile(model, dynamic=True)
+    return _torch_forward(compiled)
+
+def _build_onnx(model, device):
+    """Export once to MODEL_CACHE_DIR and run with ONNX Runtime on the CPU"""
+    if ort is None:
+        raise RuntimeError("The onnx backend needs onnxruntime. Install it with: pip install onnxruntime")
+    os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+    onnx_path = os.path.join(MODEL_CACHE_DIR, f"{getattr(model, 'model_version', 'inception_resnet_v1')}.onnx")
+    if not os.path.exists(onnx_path):
+        partial_path = f"{onnx_path}.part"
+        # Export a CPU copy; moving the shared model would break every other user of it on CUDA
+        torch.onnx.export(copy.deepcopy(model).cpu(), torch.zeros(1, *FACE_SHAPE), partial_path,
+                          input_names=["faces"], output_names=["embeddings"],
+                          dynamic_axes={"faces": {0: "batch"}, "embeddings": {0: "batch"}},
+                          opset_version=18)
+        os.replace(partial_path, onnx_path)
+        print(f"[INFO] Exported ONNX model to {onnx_path}")
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = torch.get_num_threads()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+    return lambda faces: session.run(None, {"faces": faces.detach().cpu().numpy()})[0]
+
+_BUILDERS = {
+    'eager': _build_eager,
+    'int8': _build_int8,
+    'torchscript': _build_torchscript,
+    'compile': _build_compile,
+    'onnx': _build_onnx,
+}
+
+def load_engine(model, backend=INFERENCE_BACKEND, device='cpu'):
+    """
+    Wrap the recognition model in the requested inference backend.
+    A backend that cannot be built here (missing package, no compiler, ...) falls back
+    to eager fp32 with a warning, so a bad setting never stops the service.
+    :param model: InceptionResnetV1 in eval mode
+    :param backend: One of INFERENCE_BACKENDS
+    :return: InferenceEngine
+    """
+    if backend not in _BUILDERS:
+        raise ValueError(f"Unknown inference backend: {backend}. Choose from {', '.join(INFERENCE_BACKENDS)}")
+
+    try:
+        engine = InferenceEngine(backend, _BUILDERS[backend](model, device), device)
+        # Warm up single faces and both small- and large-batch shapes, so build errors and
+        # shape-specialised compilation happen at load instead of on the first request
+        for batch in (1, 2, 16):
+            engine(torch.zeros(batch, *FACE_SHAPE, device=device))
+    except Exception as e:
+        if backend == 'eager':
+            raise
+        print(f"[WARNING] Inference backend '{backend}' unavailable ({e}); using eager fp32")
+        return load_engine(model, 'eager', device)
+
+    print(f"[INFO] Inference backend: {backend}")
+    return engine
+
+# ==========================================
+# Parity and throughput check
+# ==========================================
+def cosine_drift(reference, candidate):
+    """Per-row cosine distance between two embedding batches"""
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    return 1.0 - np.sum(reference * candidate, axis=1)
+
+def enrollment_faces(class_name, limit=200):
+    """Cropped, normalised faces from a class's approved enrollment photos (one per photo)"""
+    from backend import main
+
+    faces = []
+    for images in main.get_enrollment_images(class_name).values():
+        for image_path, _ in images:
+            img = main.cv2.imread(image_path)
+            if img is None:
+                continue
+            img_rgb = main.cv2.cvtColor(img, main.cv2.COLOR_BGR2RGB)
+            boxes, landmarks = main.detect_faces(img_rgb)
+            if boxes is None:
+                continue
+            faces.append(main.preprocess.crop_faces(main.preprocess.image_to_tensor(img_rgb), boxes[:1],
+                                                    None if landmarks is None else landmarks[:1]))
+            if len(faces) >= limit:
+                return torch.cat(faces)
+    return torch.cat(faces) if faces else torch.empty(0, *FACE_SHAPE)
+
+def parity_check(class_name, backends=INFERENCE_BACKENDS, limit=200, batch_size=16):
+    """
+    Compare every backend with eager fp32 on a class's enrollment photos.
+    Throughput is measured with one torch thread, i.e. faces per second per core.
+    :return: Dictionary of backend -> drift and throughput summary
+    """
+    from backend import main
+
+    previous_threads = torch.get_num_threads()
+    torch.set_num_threads(1)
+    try:
+        faces = enrollment_faces(class_name, limit)
+        if len(faces) == 0:
+            raise RuntimeError(f"No enrollment faces found for class {class_name}")
+
+        def run(engine):
+            start = time.perf_counter()
+            outputs = [engine(faces[i:i + batch_size]) for i in range(0, len(faces), batch_size)]
+            return np.vstack(outputs), time.perf_counter() - start
+
+        reference, reference_time = run(load_engine(main.model, 'eager'))
+        results = {}
+        for backend in backends:
+            engine = load_engine(main.model, backend)
+            if engine.name != backend:
+                results[backend] = {"available": False}
+                continue
+            embeddings, elapsed = run(engine)
+            drift = cosine_drift(reference, embeddings)
+            results[backend] = {
+                "available": True,
+                "faces": len(faces),
+                "max_cosine_drift": round(float(drift.max()), 6),
+                "mean_cosine_drift": round(float(drift.mean()), 6),
+                "passes": bool(drift.max() <= MAX_COSINE_DRIFT),
+                "faces_per_s_per_core": round(len(faces) / elapsed, 2),
+                "speedup_vs_fp32": round(reference_time / elapsed, 2),
+            }
+    finally:
+        torch.set_num_threads(previous_threads)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embedding drift and throughput of each inference backend vs fp32")
+    parser.add_argument("class_name", help="Class whose enrollment photos are used")
+    parser.add_argument("--backends", default=",".join(INFERENCE_BACKENDS[1:]),
+                        help="Comma-separated backends to compare")
+    parser.add_argument("--limit", type=int, default=200, help="Maximum number of enrollment photos")
+    args = parser.parse_args()
+
+    report = parity_check(args.class_name, args.backends.split(","), args.limit)
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if all(r.get("passes", True) for r in report.values()) else 1)
@@ -1,20 +1,37 @@
 import os
+import sys
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # project root
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
 import numpy as np
 import cv2
 import torch
+import time
+import uuid
+import sqlite3
+import threading
 from datetime import datetime
-from PIL import Image
-from facenet_pytorch import MTCNN, InceptionResnetV1
-from openpyxl import Workbook
+from concurrent.futures import ThreadPoolExecutor
+
+from backend import metrics, reports, attendance_store, preprocess, inference, model_registry, detection, roster_sync, retention, scheduler
 
 # ==============================
 # CONFIGURATION
 # ==============================
 DATASET_DIR = os.path.join(BASE_DIR, "database", "photo") # Student images
 CLASSROOM_IMG_DIR = os.path.join(BASE_DIR, "database", "class_img") # Classroom images
+JOB_IMG_SUBDIR = "jobs" # CLASSROOM_IMG_DIR/jobs/<job id>/<image>, one folder per web submission
 OUTPUT_DIR = os.path.join(BASE_DIR, "roster_embeddings") # Where to save embeddings
 REPORTS_DIR = os.path.join(BASE_DIR, "reports") # Where to save reports
+DB_PATH = os.path.join(BASE_DIR, "attendance.db") # sample_images metadata
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+MIN_QUALITY_WEIGHT = 0.05 # Floor so unscored (0.0) approved images still count a little
+OUTLIER_COSINE_DISTANCE = 0.35 # Drop enrollment embeddings further than this from the median
+DEFAULT_MATCH_THRESHOLD = 0.9 # Euclidean distance threshold when a roster has no calibration
+THRESHOLD_RANGE = (0.6, 1.1) # Calibrated thresholds are clipped to this range
+MIN_SAMPLES_FOR_STUDENT_THRESHOLD = 3 # Fewer enrollment faces than this use the class threshold
+CLUSTER_DISTANCE = 0.8 # Faces from different classroom images closer than this are one person
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 os.makedirs(REPORTS_DIR, exist_ok=True)
@@ -22,9 +39,12 @@ os.makedirs(REPORTS_DIR, exist_ok=True)
 device = 'cuda' if torch.cuda.is_available() else 'cpu'
 print(f"[INFO] Using device: {device}")
 
-# Initialize models
-mtcnn = MTCNN(keep_all=True, device=device)  # Detect all faces
-model = InceptionResnetV1(pretrained='vggface2').eval().to(device)
+# Initialize models from the local, checksummed weight registry
+mtcnn, DETECTOR_VERSION = model_registry.load_detector(device, keep_all=True)  # Detect all faces
+model, MODEL_VERSION = model_registry.load_recognition_model(device)
+model.model_version = MODEL_VERSION  # Names the exported ONNX graph, so new weights are re-exported
+engine = inference.load_engine(model, inference.INFERENCE_BACKEND, device) # fp32, int8, TorchScript, ...
+detector = detection.load_detector(mtcnn, detection.FACE_DETECTOR) # MTCNN, OpenCV DNN, Haar or two-stage
 
 # ==========================================
 # Helper function for class report directory
@@ -40,6 +60,28 @@ def get_class_report_dir(class_name):
 # ==========================================
 # Generate face embedding for one image
 # ==========================================
+def embed_faces(image_tensor, boxes, landmarks=None):
+    """
+    Embed every face of one frame with a single model call.
+    :param image_tensor: uint8 frame tensor from preprocess.image_to_tensor
+    :param boxes: MTCNN face boxes (N x 4)
+    :param landmarks: Optional MTCNN landmarks, used when face alignment is enabled
+    :return: Array of embeddings (N x 512)
+    """
+    faces = preprocess.crop_faces(image_tensor, boxes, landmarks)
+    if len(faces) == 0:
+        return np.empty((0, 512), dtype=np.float32)
+    return engine(faces)
+
+def detect_faces(img_rgb):
+    """
+    Run the configured face detector on a decoded RGB frame.
+    :return: (boxes, landmarks); boxes is None when no face was found and landmarks is
+             None unless face alignment is enabled (and the detector provides them)
+    """
+    boxes, _, landmarks = detector(img_rgb, landmarks=preprocess.ALIGN_FACES)
+    return boxes, landmarks
+
 def generate_embedding(image_path):
     img = cv2.imread(image_path)
     if img is None:
@@ -47,31 +89,388 @@ def generate_embedding(image_path):
         return None
 
     img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    pil_img = Image.fromarray(img_rgb)
-
-    boxes, _ = mtcnn.detect(pil_img)
+    boxes, landmarks = detect_faces(img_rgb)
     if boxes is None:
         print(f"[WARNING] No face detected in: {image_path}")
         return None
 
-    x1, y1, x2, y2 = [int(v) for v in boxes[0]]
-    face_crop = pil_img.crop((x1, y1, x2, y2)).resize((160, 160))
+    # Enrollment photos hold one student; use the most confident face
+    return embed_faces(preprocess.image_to_tensor(img_rgb, device), boxes[:1],
+                       None if landmarks is None else landmarks[:1])[0]
+
+# ==========================================
+# Per-image embedding cache
+# ==========================================
+# Enrollment embeddings are cached in SQLite keyed by path, size and mtime, so roster
+# updates only run the model on images that are new or changed. Images with no
+# detectable face are cached too (NULL embedding) so they are not retried.
+def embedding_variant():
+    """
+    Identifies the weights, detector, preprocessing and inference backend behind an embedding.
+    Cached embeddings and saved rosters carry it, so embeddings from different
+    models are never compared.
+    """
+    return f"{MODEL_VERSION};det={detector.name};align={int(preprocess.ALIGN_FACES)};engine={engine.name}"
+
+def _ensure_embedding_cache(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS image_embeddings (
+            image_path TEXT PRIMARY KEY,
+            file_size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            embedding BLOB,
+            variant TEXT NOT NULL DEFAULT ''
+        )
+    """)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(image_embeddings)")}
+    if "variant" not in columns:
+        conn.execute("ALTER TABLE image_embeddings ADD COLUMN variant TEXT NOT NULL DEFAULT ''")
+
+def get_cached_embeddings(image_paths):
+    """
+    Embeddings for many enrollment images, computing only the ones not cached yet.
+    :return: Dictionary of image path -> embedding (None when no face was found)
+    """
+    stats = {}
+    for path in set(image_paths):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        stats[path] = (stat.st_size, stat.st_mtime_ns)
+
+    conn = sqlite3.connect(DB_PATH, timeout=10)
+    _ensure_embedding_cache(conn)
+    variant = embedding_variant()
+    results = {}
+    paths = list(stats)
+    for start in range(0, len(paths), 500):
+        chunk = paths[start:start + 500]
+        placeholders = ','.join('?' for _ in chunk)
+        for path, file_size, mtime_ns, blob, cached_variant in conn.execute(
+                f"SELECT image_path, file_size, mtime_ns, embedding, variant FROM image_embeddings "
+                f"WHERE image_path IN ({placeholders})", chunk):
+            if stats[path] == (file_size, mtime_ns) and cached_variant == variant:
+                results[path] = np.frombuffer(blob, dtype=np.float32).copy() if blob is not None else None
+
+    missing = [path for path in paths if path not in results]
+    metrics.inc("attendance_cache_hits_total", len(results), cache="embedding")
+    metrics.inc("attendance_cache_misses_total", len(missing), cache="embedding")
+    rows = []
+    for path in missing:
+        embedding = generate_embedding(path)
+        results[path] = None if embedding is None else embedding.astype(np.float32)
+        rows.append((path, *stats[path], None if embedding is None else results[path].tobytes(), variant))
+
+    if rows:
+        with conn:
+            conn.executemany("""
+                INSERT OR REPLACE INTO image_embeddings (image_path, file_size, mtime_ns, embedding, variant)
+                VALUES (?, ?, ?, ?, ?)
+            """, rows)
+    conn.close()
+    return results
+
+# ==========================================
+# Collect enrollment images for a class
+# ==========================================
+def get_enrollment_images(class_folder, min_quality=0.0, student_names=None):
+    """
+    Collect enrollment images per student for a class.
+    Students registered in sample_images use only their approved rows, weighted by
+    quality_score. Students that only exist on disk (no rows at all) fall back to
+    every image in their folder with equal weight.
+    :param class_folder: Class to collect images for
+    :param min_quality: Skip approved images scoring below this
+    :param student_names: Only collect these students (default: everyone)
+    :return: Dictionary of student name -> list of (image_path, weight)
+    """
+    class_path = os.path.join(DATASET_DIR, class_folder)
+    students = {}
+    registered = set()
+
+    if os.path.exists(DB_PATH):
+        conn = sqlite3.connect(DB_PATH)
+        try:
+            rows = conn.execute("""
+                SELECT student_name, image_filename, image_path, status, quality_score
+                FROM sample_images
+                WHERE class_name = ?
+            """, (class_folder,)).fetchall()
+        except sqlite3.OperationalError:
+            rows = []
+        conn.close()
+
+        for student_name, image_filename, image_path, status, quality_score in rows:
+            if student_names is not None and student_name not in student_names:
+                continue
+            registered.add(student_name)
+            if status != 'approved':
+                continue
+            quality = quality_score or 0.0
+            if quality < min_quality:
+                continue
+            if not image_path or not os.path.exists(image_path):
+                image_path = os.path.join(class_path, student_name, image_filename)
+                if not os.path.exists(image_path):
+                    continue
+            students.setdefault(student_name, []).append((image_path, max(quality, MIN_QUALITY_WEIGHT)))
+
+    student_folders = os.listdir(class_path) if student_names is None else student_names
+    for student_name in student_folders:
+        student_folder = os.path.join(class_path, student_name)
+        if student_name in registered or not os.path.isdir(student_folder):
+            continue
+        for img_file in os.listdir(student_folder):
+            if img_file.lower().endswith(IMAGE_EXTENSIONS):
+                students.setdefault(student_name, []).append((os.path.join(student_folder, img_file), 1.0))
+
+    return students
+
+# ==========================================
+# Robust per-student centroid and prototypes
+# ==========================================
+def l2_normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def reject_outliers(embeddings, weights, max_distance=OUTLIER_COSINE_DISTANCE):
+    """
+    Drop embeddings whose cosine distance to the element-wise median exceeds max_distance.
+    Always keeps at least the closest half so a student is never emptied out.
+    :return: Filtered (embeddings, weights)
+    """
+    embeddings = l2_normalize(embeddings)
+    if len(embeddings) < 3:
+        return embeddings, weights
+
+    median = l2_normalize(np.median(embeddings, axis=0))
+    distances = 1.0 - embeddings @ median
+    keep = distances <= max_distance
+    min_keep = (len(embeddings) + 1) // 2
+    if keep.sum() < min_keep:
+        keep = np.zeros(len(embeddings), dtype=bool)
+        keep[np.argsort(distances)[:min_keep]] = True
+    return embeddings[keep], weights[keep]
+
+def weighted_centroid(embeddings, weights):
+    """Quality-weighted mean of unit embeddings, re-normalised to unit length"""
+    return l2_normalize(np.average(embeddings, axis=0, weights=weights))
+
+def compute_prototypes(embeddings, weights, num_prototypes, iterations=10):
+    """
+    Weighted spherical k-means over one student's embeddings.
+    :return: Array of up to num_prototypes unit-length prototype embeddings
+    """
+    k = min(num_prototypes, len(embeddings))
+    if k <= 1:
+        return weighted_centroid(embeddings, weights)[None, :]
+
+    # Deterministic farthest-point initialisation starting from the best-quality image
+    centers = [embeddings[np.argmax(weights)]]
+    for _ in range(k - 1):
+        similarity = np.max(embeddings @ np.array(centers).T, axis=1)
+        centers.append(embeddings[np.argmin(similarity)])
+    centers = np.array(centers)
+
+    for _ in range(iterations):
+        assignment = np.argmax(embeddings @ centers.T, axis=1)
+        new_centers = []
+        for j in range(k):
+            members = assignment == j
+            if members.any():
+                new_centers.append(weighted_centroid(embeddings[members], weights[members]))
+        new_centers = np.array(new_centers)
+        if new_centers.shape == centers.shape and np.allclose(new_centers, centers):
+            break
+        centers = new_centers
+
+    return centers
+
+# ==========================================
+# Calibrate match thresholds from enrollment photos
+# ==========================================
+def nearest_prototype_distances(embeddings, prototypes, owners, num_students):
+    """
+    Euclidean distance from each embedding to the closest prototype of every student.
+    Every student must own at least one prototype.
+    :return: Array of shape (len(embeddings), num_students)
+    """
+    # Prototypes are grouped per student, so one reduceat takes the per-student maximum
+    order = np.argsort(owners, kind='stable')
+    starts = np.searchsorted(owners[order], np.arange(num_students))
+    similarity = embeddings @ prototypes[order].T
+    per_student = np.maximum.reduceat(similarity, starts, axis=1)
+    return np.sqrt(np.clip(2.0 - 2.0 * per_student, 0.0, None))
+
+def _threshold_between(intra, inter):
+    """Midpoint between the 95th percentile genuine and 5th percentile impostor distance"""
+    genuine = np.percentile(intra, 95)
+    impostor = np.percentile(inter, 5)
+    # When the distributions overlap, favour rejecting impostors
+    threshold = (genuine + impostor) / 2 if genuine < impostor else impostor
+    return float(np.clip(threshold, *THRESHOLD_RANGE))
+
+def calibrate_thresholds(student_embeddings, prototypes, owners, per_student=True):
+    """
+    Calibrate distance thresholds from intra- and inter-student enrollment distances.
+    :param student_embeddings: List (one entry per student) of unit enrollment embeddings
+    :param prototypes: Roster prototypes (M x D)
+    :param owners: Student index of each prototype
+    :param per_student: Calibrate each student separately; otherwise one class threshold
+    :return: Array of one distance threshold per student
+    """
+    num_students = len(student_embeddings)
+    thresholds = np.full(num_students, DEFAULT_MATCH_THRESHOLD, dtype=np.float32)
+    if num_students < 2:
+        return thresholds
+
+    intra_by_student = []
+    inter_by_student = []
+    for student_idx, embeddings in enumerate(student_embeddings):
+        distances = nearest_prototype_distances(embeddings, prototypes, owners, num_students)
+        intra_by_student.append(distances[:, student_idx])
+        inter_by_student.append(np.delete(distances, student_idx, axis=1).ravel())
+
+    class_threshold = _threshold_between(np.concatenate(intra_by_student), np.concatenate(inter_by_student))
+    thresholds[:] = class_threshold
+    if per_student:
+        for student_idx, intra in enumerate(intra_by_student):
+            if len(intra) >= MIN_SAMPLES_FOR_STUDENT_THRESHOLD:
+                thresholds[student_idx] = _threshold_between(intra, inter_by_student[student_idx])
+
+    return thresholds
+
+# ==========================================
+# Roster files
+# ==========================================
+# Each class roster is a single .npz (names, centroid embeddings, thresholds and
+# optional prototypes/owners) written under a temporary name and renamed into place,
+# so readers always see a complete roster even while it is being updated. Every saved
+# roster is also published as a versioned snapshot for other app servers (roster_sync).
+ROSTER_SUFFIX = roster_sync.ROSTER_SUFFIX
+LEGACY_ROSTER_SUFFIXES = ("_embeddings.npy", "_names.npy", "_prototypes.npy", "_prototype_owners.npy", "_thresholds.npy")
 
-    face_tensor = torch.tensor(np.array(face_crop)).permute(2, 0, 1).unsqueeze(0).float().to(device)
-    face_tensor = (face_tensor - 127.5) / 128.0
+_roster_lock = threading.RLock()
 
-    with torch.no_grad():
-        embedding = model(face_tensor).cpu().numpy()[0]
+def roster_path(class_name):
+    return os.path.join(OUTPUT_DIR, f"{class_name}{ROSTER_SUFFIX}")
 
-    return embedding
+def list_roster_classes():
+    """Classes with a saved roster (single-file or legacy .npy set)"""
+    classes = set()
+    for file in os.listdir(OUTPUT_DIR):
+        if file.endswith(ROSTER_SUFFIX):
+            classes.add(file[:-len(ROSTER_SUFFIX)])
+        elif file.endswith("_names.npy"):
+            classes.add(file[:-len("_names.npy")])
+    return sorted(classes)
+
+def save_class_roster(class_name, names, embeddings, thresholds, prototypes=None, owners=None):
+    """Write a class roster and swap it into place in one rename"""
+    arrays = {
+        "names": np.array(names),
+        "embeddings": np.asarray(embeddings, dtype=np.float32),
+        "thresholds": np.asarray(thresholds, dtype=np.float32),
+        "model_version": np.array(embedding_variant()),
+    }
+    if prototypes is not None:
+        arrays["prototypes"] = np.asarray(prototypes, dtype=np.float32)
+        arrays["owners"] = np.asarray(owners, dtype=np.int64)
+
+    path = roster_path(class_name)
+    partial_path = f"{path}.part"
+    with open(partial_path, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(partial_path, path)
+    try:
+        roster_sync.publish(class_name, path)
+    except Exception as e:
+        print(f"[WARNING] Could not publish roster snapshot for {class_name}: {e}")
+
+    # The .npz supersedes any roster saved as separate .npy files
+    for suffix in LEGACY_ROSTER_SUFFIXES:
+        legacy_path = os.path.join(OUTPUT_DIR, f"{class_name}{suffix}")
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+
+def read_class_roster(class_name):
+    """
+    Read a class roster, falling back to the older separate .npy files.
+    :return: Dictionary with names, embeddings, thresholds, prototypes and owners
+             (prototypes/owners are None for centroid-only rosters) and model_version
+             (None for rosters saved before versions were recorded)
+    """
+    path = roster_path(class_name)
+    if os.path.exists(path):
+        with np.load(path) as data:
+            roster = {key: data[key] for key in data.files}
+    else:
+        emb_path = os.path.join(OUTPUT_DIR, f"{class_name}_embeddings.npy")
+        names_path = os.path.join(OUTPUT_DIR, f"{class_name}_names.npy")
+        if not os.path.exists(emb_path) or not os.path.exists(names_path):
+            raise RuntimeError(f"No embeddings found for class {class_name}. Run build_class_embeddings('{class_name}') first.")
+        roster = {"embeddings": np.load(emb_path), "names": np.load(names_path)}
+        for key, suffix in (("prototypes", "_prototypes.npy"), ("owners", "_prototype_owners.npy"),
+                            ("thresholds", "_thresholds.npy")):
+            legacy_path = os.path.join(OUTPUT_DIR, f"{class_name}{suffix}")
+            if os.path.exists(legacy_path):
+                roster[key] = np.load(legacy_path)
+
+    if "prototypes" not in roster or "owners" not in roster:
+        roster["prototypes"] = roster["owners"] = None
+    thresholds = roster.get("thresholds")
+    if thresholds is None or len(thresholds) != len(roster["names"]):
+        roster["thresholds"] = np.full(len(roster["names"]), DEFAULT_MATCH_THRESHOLD, dtype=np.float32)
+    roster["model_version"] = str(roster["model_version"]) if "model_version" in roster else None
+    return roster
+
+def roster_is_current(class_name):
+    """True if the class has a roster built with the current model, preprocessing and backend"""
+    try:
+        return read_class_roster(class_name)["model_version"] == embedding_variant()
+    except RuntimeError:
+        return False
 
 # ==========================================
 # Step 1: Build embeddings for specific class or all classes
 # ==========================================
-def build_class_embeddings(class_name=None):
+def summarize_student(images, cached_embeddings, num_prototypes):
+    """
+    Turn one student's weighted enrollment images into roster entries.
+    :param images: List of (image_path, weight)
+    :param cached_embeddings: Dictionary of image path -> embedding from get_cached_embeddings
+    :return: Dictionary with centroid, prototypes, kept embeddings and face count, or None
+             when no image has a usable face
+    """
+    student_embeddings = []
+    student_weights = []
+    for image_path, weight in images:
+        embedding = cached_embeddings.get(image_path)
+        if embedding is not None:
+            student_embeddings.append(embedding)
+            student_weights.append(weight)
+
+    if len(student_embeddings) == 0:
+        return None
+
+    kept, kept_weights = reject_outliers(np.array(student_embeddings), np.array(student_weights))
+    prototypes = compute_prototypes(kept, kept_weights, num_prototypes) if num_prototypes > 1 else None
+    return {
+        "centroid": weighted_centroid(kept, kept_weights),
+        "prototypes": prototypes,
+        "kept": kept,
+        "faces": len(student_embeddings),
+    }
+
+def build_class_embeddings(class_name=None, num_prototypes=1, min_quality=0.0, per_student_thresholds=True):
     """
     Build embeddings for a specific class or all classes
     :param class_name: Specific class to process, or None for all classes
+    :param num_prototypes: Prototype embeddings to keep per student (1 = centroid only)
+    :param min_quality: Skip approved images with a quality score below this
+    :param per_student_thresholds: Calibrate a threshold per student instead of per class
     """
     if class_name:
         # Process only the specified class
@@ -89,39 +488,165 @@ def build_class_embeddings(class_name=None):
         print(f"\n[INFO] Processing class: {class_folder}")
         embeddings = []
         names = []
-
-        for student_name in os.listdir(class_path):
-            student_folder = os.path.join(class_path, student_name)
-            if not os.path.isdir(student_folder):
-                continue
-
-            print(f"  → Generating average embedding for: {student_name}")
-            student_embeddings = []
-
-            for img_file in os.listdir(student_folder):
-                if img_file.lower().endswith(('.jpg', '.jpeg', '.png')):
-                    image_path = os.path.join(student_folder, img_file)
-                    embedding = generate_embedding(image_path)
-                    if embedding is not None:
-                        student_embeddings.append(embedding)
-
-            if len(student_embeddings) == 0:
+        prototypes = []
+        prototype_owners = []
+        student_sets = []
+
+        enrollment = get_enrollment_images(class_folder, min_quality=min_quality)
+        cached = get_cached_embeddings([path for images in enrollment.values() for path, _ in images])
+        for student_name in sorted(enrollment):
+            print(f"  → Generating weighted embedding for: {student_name}")
+            entry = summarize_student(enrollment[student_name], cached, num_prototypes)
+            if entry is None:
                 print(f"[WARNING] No valid faces for {student_name}, skipping...")
                 continue
 
-            avg_embedding = np.mean(student_embeddings, axis=0)
-            embeddings.append(avg_embedding)
+            embeddings.append(entry["centroid"])
             names.append(student_name)
+            student_sets.append(entry["kept"])
+            if entry["prototypes"] is not None:
+                prototypes.extend(entry["prototypes"])
+                prototype_owners.extend([len(names) - 1] * len(entry["prototypes"]))
 
-            print(f"     ✓ {len(student_embeddings)} images used for {student_name}")
+            print(f"     ✓ {len(entry['kept'])}/{entry['faces']} images used for {student_name}")
 
         if len(embeddings) > 0:
-            np.save(os.path.join(OUTPUT_DIR, f"{class_folder}_embeddings.npy"), np.array(embeddings))
-            np.save(os.path.join(OUTPUT_DIR, f"{class_folder}_names.npy"), np.array(names))
+            if num_prototypes > 1:
+                thresholds = calibrate_thresholds(student_sets, np.array(prototypes), np.array(prototype_owners),
+                                                  per_student=per_student_thresholds)
+            else:
+                thresholds = calibrate_thresholds(student_sets, np.array(embeddings), np.arange(len(embeddings)),
+                                                  per_student=per_student_thresholds)
+            with _roster_lock:
+                save_class_roster(class_folder, names, embeddings, thresholds,
+                                  prototypes if num_prototypes > 1 else None,
+                                  prototype_owners if num_prototypes > 1 else None)
             print(f"[SUCCESS] Saved embeddings for {class_folder} in '{OUTPUT_DIR}'")
         else:
             print(f"[WARNING] No embeddings generated for class: {class_folder}")
 
+def _build_if_stale(class_name):
+    # Re-checked on the worker: an identical request queued earlier may have built it
+    if not roster_is_current(class_name):
+        build_class_embeddings(class_name)
+
+def ensure_class_embeddings(class_name):
+    """
+    Build a class roster only if it is missing or was built with a different model;
+    moderation keeps existing rosters current. The build runs on the inference
+    scheduler like every other model job, so call this from a request thread, not a job.
+    :raises scheduler.SchedulerBusy: The class's queue is full
+    """
+    if class_name and not roster_is_current(class_name):
+        scheduler.run(class_name, _build_if_stale, class_name)
+
+# ==========================================
+# Incremental roster updates after moderation
+# ==========================================
+def update_student_embeddings(class_name, student_names, min_quality=0.0):
+    """
+    Recompute the roster entries of a few students and swap the class roster in one step.
+    Other students keep their centroids, prototypes and thresholds; the updated students
+    are recalibrated against the new prototypes. Students left without a usable face are
+    dropped. Builds the whole class when it has no roster yet or the roster was built
+    with a different model.
+    :param student_names: Students whose approved images changed
+    """
+    student_names = set(student_names)
+    with _roster_lock:
+        try:
+            roster = read_class_roster(class_name)
+        except RuntimeError:
+            roster = None
+        if roster is None or roster["model_version"] != embedding_variant():
+            build_class_embeddings(class_name, min_quality=min_quality)
+            return
+
+        multi = roster["prototypes"] is not None
+        num_prototypes = int(np.bincount(roster["owners"]).max()) if multi else 1
+        enrollment = get_enrollment_images(class_name, min_quality=min_quality, student_names=student_names)
+        cached = get_cached_embeddings([path for images in enrollment.values() for path, _ in images])
+
+        entries = {}
+        for idx, name in enumerate(roster["names"]):
+            name = str(name)
+            if name in student_names:
+                continue
+            student_prototypes = roster["prototypes"][roster["owners"] == idx] if multi else None
+            entries[name] = (roster["embeddings"][idx], student_prototypes, float(roster["thresholds"][idx]), None)
+        fallback_threshold = float(np.median([entry[2] for entry in entries.values()])) if entries \
+            else DEFAULT_MATCH_THRESHOLD
+
+        for name in student_names:
+            entry = summarize_student(enrollment.get(name, []), cached, num_prototypes)
+            if entry is None:
+                if name in roster["names"]:
+                    print(f"[INFO] Removed {name} from the {class_name} roster")
+                continue
+            student_prototypes = None
+            if multi:
+                student_prototypes = entry["prototypes"] if entry["prototypes"] is not None else entry["centroid"][None, :]
+            entries[name] = (entry["centroid"], student_prototypes, None, entry["kept"])
+
+        if not entries:
+            print(f"[WARNING] No students left in the {class_name} roster, keeping the old one")
+            return
+
+        names = sorted(entries)
+        embeddings = np.array([entries[name][0] for name in names])
+        if multi:
+            prototypes = np.vstack([entries[name][1] for name in names])
+            owners = np.concatenate([[idx] * len(entries[name][1]) for idx, name in enumerate(names)]).astype(np.int64)
+        else:
+            prototypes, owners = embeddings, np.arange(len(names))
+
+        thresholds = np.array([entries[name][2] if entries[name][2] is not None else fallback_threshold
+                               for name in names], dtype=np.float32)
+        if len(names) > 1:
+            for idx, name in enumerate(names):
+                kept = entries[name][3]
+                if kept is None or len(kept) < MIN_SAMPLES_FOR_STUDENT_THRESHOLD:
+                    continue
+                distances = nearest_prototype_distances(kept, prototypes, owners, len(names))
+                thresholds[idx] = _threshold_between(distances[:, idx], np.delete(distances, idx, axis=1).ravel())
+
+        save_class_roster(class_name, names, embeddings, thresholds,
+                          prototypes if multi else None, owners if multi else None)
+    print(f"[SUCCESS] Updated {len(student_names)} student(s) in the {class_name} roster")
+
+_update_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="roster")
+_queued_updates = {}
+_queued_lock = threading.Lock()
+
+def _run_queued_update(class_name):
+    with _queued_lock:
+        student_names = _queued_updates.pop(class_name)
+    while True:
+        try:
+            scheduler.run(class_name, update_student_embeddings, class_name, student_names)
+            return
+        except scheduler.SchedulerBusy as e:
+            time.sleep(e.retry_after)  # A moderation update is never dropped, only delayed
+        except Exception as e:
+            print(f"[ERROR] Roster update failed for {class_name}: {e}")
+            return
+
+def queue_roster_update(class_name, student_names):
+    """
+    Schedule an incremental roster update off the request thread; it runs on the
+    inference scheduler. Students queued for a class while its update is still waiting
+    are merged into that same update.
+    """
+    if not class_name or not student_names:
+        return
+    with _queued_lock:
+        waiting = _queued_updates.get(class_name)
+        if waiting is not None:
+            waiting.update(student_names)
+            return
+        _queued_updates[class_name] = set(student_names)
+    _update_executor.submit(_run_queued_update, class_name)
+
 # ==========================================
 # Load embeddings for specific class
 # ==========================================
@@ -131,16 +656,8 @@ def load_class_embeddings(class_name):
     :param class_name: The class to load embeddings for
     :return: embeddings array and names array
     """
-    emb_path = os.path.join(OUTPUT_DIR, f"{class_name}_embeddings.npy")
-    names_path = os.path.join(OUTPUT_DIR, f"{class_name}_names.npy")
-    
-    if not os.path.exists(emb_path) or not os.path.exists(names_path):
-        raise RuntimeError(f"No embeddings found for class {class_name}. Run build_class_embeddings('{class_name}') first.")
-    
-    embeddings = np.load(emb_path)
-    names = np.load(names_path)
-    
-    return embeddings, names
+    roster = read_class_roster(class_name)
+    return roster["embeddings"], roster["names"]
 
 # ==========================================
 # Load all saved embeddings (fallback for backward compatibility)
@@ -148,39 +665,105 @@ def load_class_embeddings(class_name):
 def load_all_embeddings():
     all_embeddings = []
     all_names = []
-    for file in os.listdir(OUTPUT_DIR):
-        if file.endswith("_embeddings.npy"):
-            class_name = file.replace("_embeddings.npy", "")
-            emb_path = os.path.join(OUTPUT_DIR, file)
-            names_path = os.path.join(OUTPUT_DIR, f"{class_name}_names.npy")
-
-            if not os.path.exists(names_path):
-                print(f"[WARNING] Missing names file for {class_name}")
-                continue
-
-            embeddings = np.load(emb_path)
-            names = np.load(names_path)
-            all_embeddings.append(embeddings)
-            all_names.extend(names)
+    for class_name in list_roster_classes():
+        try:
+            embeddings, names = load_class_embeddings(class_name)
+        except RuntimeError:
+            print(f"[WARNING] Missing names file for {class_name}")
+            continue
+        all_embeddings.append(embeddings)
+        all_names.extend(names)
 
     if len(all_embeddings) == 0:
         raise RuntimeError("No embeddings found. Run build_class_embeddings() first.")
 
     return np.vstack(all_embeddings), all_names
 
+# ==========================================
+# Load the multi-prototype matching roster
+# ==========================================
+def _load_class_roster(class_name):
+    roster = read_class_roster(class_name)
+    if roster["model_version"] != embedding_variant():
+        raise RuntimeError(f"Roster for {class_name} was built with model {roster['model_version']}, "
+                           f"not {embedding_variant()}. Run build_class_embeddings('{class_name}') again.")
+    names, embeddings = roster["names"], roster["embeddings"]
+    if roster["prototypes"] is not None:
+        prototypes, owners = roster["prototypes"], roster["owners"]
+    else:
+        prototypes, owners = embeddings, np.arange(len(names))
+    return list(names), l2_normalize(prototypes), owners.astype(np.int64), roster["thresholds"].astype(np.float32)
+
+_roster_cache = {}
+
+def _roster_signature(class_names):
+    """Modification times of every roster file involved, so a rebuild invalidates the cache"""
+    signature = []
+    for roster_class in class_names:
+        for suffix in (ROSTER_SUFFIX,) + LEGACY_ROSTER_SUFFIXES:
+            path = os.path.join(OUTPUT_DIR, f"{roster_class}{suffix}")
+            signature.append(os.stat(path).st_mtime_ns if os.path.exists(path) else None)
+    return tuple(signature)
+
+def load_roster(class_name=None):
+    """
+    Load the matching roster for a class, or for every class when class_name is None.
+    Rosters are cached in memory until one of their files changes on disk.
+    :return: Dictionary with names, prototypes (M x D unit vectors), owners (student index
+             of each prototype) and thresholds (one distance threshold per student)
+    """
+    if class_name:
+        class_names = [class_name]
+    else:
+        class_names = list_roster_classes()
+
+    cache_key = (OUTPUT_DIR, class_name)
+    signature = _roster_signature(class_names)
+    cached = _roster_cache.get(cache_key)
+    if cached is not None and cached[0] == signature:
+        metrics.inc("attendance_cache_hits_total", cache="roster")
+        return cached[1]
+    metrics.inc("attendance_cache_misses_total", cache="roster")
+
+    names, prototypes, owners, thresholds = [], [], [], []
+    for roster_class in class_names:
+        try:
+            class_names_list, class_prototypes, class_owners, class_thresholds = _load_class_roster(roster_class)
+        except RuntimeError:
+            if class_name:
+                raise
+            print(f"[WARNING] Incomplete roster for {roster_class}")
+            continue
+        owners.append(class_owners + len(names))
+        names.extend(class_names_list)
+        prototypes.append(class_prototypes)
+        thresholds.append(class_thresholds)
+
+    if len(names) == 0:
+        raise RuntimeError("No embeddings found. Run build_class_embeddings() first.")
+
+    roster = {
+        'names': names,
+        'prototypes': np.vstack(prototypes),
+        'owners': np.concatenate(owners),
+        'thresholds': np.concatenate(thresholds),
+    }
+    _roster_cache[cache_key] = (signature, roster)
+    return roster
+
 # ==========================================
 # Generate embedding for detected face
 # ==========================================
 def get_face_embedding(face_img):
-    face_tensor = torch.tensor(np.array(face_img)).permute(2, 0, 1).unsqueeze(0).float().to(device)
-    face_tensor = (face_tensor - 127.5) / 128.0
-    with torch.no_grad():
-        return model(face_tensor).cpu().numpy()[0]
+    """Embed one already cropped 160x160 RGB face (see embed_faces for whole frames)"""
+    face_tensor = preprocess.image_to_tensor(np.asarray(face_img), device).unsqueeze(0).float()
+    face_tensor.sub_(127.5).div_(128.0)
+    return engine(face_tensor)[0]
 
 # ==========================================
 # Match a face with known roster
 # ==========================================
-def match_face(face_embedding, roster_embeddings, roster_names, threshold=0.9):
+def match_face(face_embedding, roster_embeddings, roster_names, threshold=DEFAULT_MATCH_THRESHOLD):
     distances = np.linalg.norm(roster_embeddings - face_embedding, axis=1)
     min_idx = np.argmin(distances)
     min_dist = distances[min_idx]
@@ -189,191 +772,342 @@ def match_face(face_embedding, roster_embeddings, roster_names, threshold=0.9):
     return "Unknown", min_dist
 
 # ==========================================
-# Step 2: Process single classroom image (original function)
+# Match a batch of faces with a multi-prototype roster
 # ==========================================
-def process_classroom_images(class_name=None):
+def match_faces(face_embeddings, roster):
     """
-    Process classroom images for attendance (single image mode)
-    :param class_name: Specific class to process, or None for all classes
-    :return: Set of recognized students
+    Match every face against every student in one matmul, taking the best prototype
+    per student and applying that student's calibrated threshold.
+    :param face_embeddings: Array of face embeddings (F x D)
+    :param roster: Roster dictionary from load_roster()
+    :return: List of (name, distance) per face
     """
-    if class_name:
-        # Load embeddings for specific class only
-        roster_embeddings, roster_names = load_class_embeddings(class_name)
-        print(f"[INFO] Loaded embeddings for class: {class_name}")
-    else:
-        # Load all embeddings (fallback)
-        roster_embeddings, roster_names = load_all_embeddings()
-        print("[INFO] Loaded embeddings for all classes")
-    
-    recognized_students = set()
-
-    for img_file in os.listdir(CLASSROOM_IMG_DIR):
-        if not img_file.lower().endswith(('.jpg', '.jpeg', '.png')):
-            continue
-
-        img_path = os.path.join(CLASSROOM_IMG_DIR, img_file)
-        print(f"\n[INFO] Processing classroom image: {img_path}")
+    face_embeddings = l2_normalize(np.atleast_2d(face_embeddings))
+    if len(face_embeddings) == 0:
+        return []
+
+    distances = nearest_prototype_distances(face_embeddings, roster['prototypes'],
+                                            roster['owners'], len(roster['names']))
+    best = np.argmin(distances, axis=1)
+    best_dist = distances[np.arange(len(best)), best]
+
+    matches = []
+    for student_idx, dist in zip(best, best_dist):
+        if dist < roster['thresholds'][student_idx]:
+            matches.append((roster['names'][student_idx], float(dist)))
+        else:
+            matches.append(("Unknown", float(dist)))
+    return matches
 
+# ==========================================
+# Recognise all faces in one classroom image
+# ==========================================
+def analyze_image(img_path):
+    """
+    Decode one classroom image, detect faces and embed them as one batch.
+    :return: (BGR image, list of face boxes, embeddings F x D); the image is None when
+             it could not be read
+    """
+    with metrics.span("decode"):
         img = cv2.imread(img_path)
         if img is None:
             print(f"[ERROR] Could not read image: {img_path}")
-            continue
-
+            return None, [], np.empty((0, 512), dtype=np.float32)
         img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        pil_img = Image.fromarray(img_rgb)
+    metrics.inc("attendance_images_processed_total")
 
-        boxes, _ = mtcnn.detect(pil_img)
-        if boxes is None:
-            print("[WARNING] No faces detected in this image.")
-            continue
+    with metrics.span("detect"):
+        boxes, landmarks = detect_faces(img_rgb)
+    if boxes is None:
+        print("[WARNING] No faces detected in this image.")
+        return img, [], np.empty((0, 512), dtype=np.float32)
 
-        for box in boxes:
-            x1, y1, x2, y2 = [int(b) for b in box]
-            face_crop = pil_img.crop((x1, y1, x2, y2)).resize((160, 160))
+    face_boxes = [[int(b) for b in box] for box in boxes]
+    with metrics.span("embed"):
+        face_embeddings = embed_faces(preprocess.image_to_tensor(img_rgb, device), boxes, landmarks)
+    metrics.inc("attendance_faces_detected_total", len(face_boxes))
+    return img, face_boxes, face_embeddings
 
-            face_embedding = get_face_embedding(face_crop)
-            name, dist = match_face(face_embedding, roster_embeddings, roster_names)
+def recognize_image(img_path, roster):
+    """
+    Decode one classroom image, detect faces, embed them as one batch and match them.
+    :return: (BGR image, list of face boxes, list of (name, distance)); the image is None
+             when it could not be read
+    """
+    img, face_boxes, face_embeddings = analyze_image(img_path)
+    if not face_boxes:
+        return img, [], []
 
-            if name != "Unknown":
-                recognized_students.add(name)
+    with metrics.span("match"):
+        matches = match_faces(face_embeddings, roster)
+    metrics.inc("attendance_faces_unknown_total", sum(1 for name, _ in matches if name == "Unknown"))
+    return img, face_boxes, matches
+
+# ==========================================
+# Cluster faces across the images of one session
+# ==========================================
+def cluster_faces(embeddings, image_ids, max_distance=CLUSTER_DISTANCE):
+    """
+    Group faces of the same person across classroom images with union-find.
+    Pairs are merged closest first, and two clusters are never merged if they hold
+    faces from the same image, since one person appears at most once per photo.
+    :param embeddings: Face embeddings (F x D)
+    :param image_ids: Index of the image each face came from
+    :return: Array of cluster labels (0..C-1), one per face
+    """
+    embeddings = l2_normalize(np.atleast_2d(embeddings))
+    count = len(embeddings)
+    if count == 0:
+        return np.empty(0, dtype=np.int64)
+
+    # One batched pass over all pairs; only pairs from different images can be merged
+    image_ids = np.asarray(image_ids)
+    distances = np.sqrt(np.clip(2.0 - 2.0 * (embeddings @ embeddings.T), 0.0, None))
+    first, second = np.triu_indices(count, k=1)
+    candidate = (distances[first, second] < max_distance) & (image_ids[first] != image_ids[second])
+    first, second = first[candidate], second[candidate]
+    order = np.argsort(distances[first, second], kind='stable')
+
+    parent = np.arange(count)
+    images = [{int(image_id)} for image_id in image_ids]
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in zip(first[order], second[order]):
+        root_i, root_j = find(i), find(j)
+        if root_i == root_j or images[root_i] & images[root_j]:
+            continue
+        parent[root_j] = root_i
+        images[root_i] |= images[root_j]
+
+    roots = np.array([find(i) for i in range(count)])
+    return np.unique(roots, return_inverse=True)[1]
 
-            # Draw bounding box
+def match_clusters(embeddings, labels, roster):
+    """
+    Match one mean embedding per cluster instead of every face.
+    :return: List of (name, distance) per cluster
+    """
+    embeddings = l2_normalize(np.atleast_2d(embeddings))
+    num_clusters = int(labels.max()) + 1 if len(labels) else 0
+    means = np.zeros((num_clusters, embeddings.shape[1]), dtype=np.float32)
+    np.add.at(means, labels, embeddings)
+    return match_faces(means, roster)
+
+def save_annotated_image(img, img_file, face_boxes, matches):
+    """Draw labelled boxes and save the result next to the classroom image"""
+    with metrics.span("render"):
+        for (x1, y1, x2, y2), (name, dist) in zip(face_boxes, matches):
             cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
             cv2.putText(img, f"{name} ({dist:.2f})", (x1, y1 - 10),
                         cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
 
-        output_img_path = os.path.join(CLASSROOM_IMG_DIR, f"result_{img_file}")
+        output_img_path = os.path.join(CLASSROOM_IMG_DIR, os.path.dirname(img_file),
+                                       f"result_{os.path.basename(img_file)}")
         cv2.imwrite(output_img_path, img)
-        print(f"[INFO] Saved processed image: {output_img_path}")
+    return output_img_path
 
-    return recognized_students
+def new_job_dir():
+    """
+    Create a folder for the photos of one submission, so concurrent submissions never
+    read each other's photos.
+    :return: Folder relative to CLASSROOM_IMG_DIR, as the process_* functions expect
+    """
+    job_dir = os.path.join(JOB_IMG_SUBDIR, uuid.uuid4().hex)
+    os.makedirs(os.path.join(CLASSROOM_IMG_DIR, job_dir))
+    return job_dir
+
+def classroom_images(image_dir=""):
+    """Classroom photos (not annotated result_* copies) in a folder relative to CLASSROOM_IMG_DIR"""
+    return [os.path.join(image_dir, img_file)
+            for img_file in sorted(os.listdir(os.path.join(CLASSROOM_IMG_DIR, image_dir)))
+            if img_file.lower().endswith(IMAGE_EXTENSIONS) and not img_file.startswith("result_")]
 
 # ==========================================
-# Step 2: Process multiple classroom images (enhanced accuracy)
+# Step 2: Process single classroom image (original function)
 # ==========================================
-def process_multiple_classroom_images(class_name=None):
+def process_classroom_images(class_name=None, image_dir=""):
     """
-    Process multiple classroom images for enhanced attendance accuracy
+    Process classroom images for attendance (single image mode)
     :param class_name: Specific class to process, or None for all classes
-    :return: Set of recognized students with confidence scores
+    :param image_dir: Folder of photos relative to CLASSROOM_IMG_DIR (see new_job_dir)
+    :return: Set of recognized students
     """
+    roster = load_roster(class_name)
     if class_name:
-        # Load embeddings for specific class only
-        roster_embeddings, roster_names = load_class_embeddings(class_name)
-        print(f"[INFO] Loaded embeddings for class: {class_name}")
+        print(f"[INFO] Loaded roster for class: {class_name}")
     else:
-        # Load all embeddings (fallback)
-        roster_embeddings, roster_names = load_all_embeddings()
-        print("[INFO] Loaded embeddings for all classes")
+        print("[INFO] Loaded roster for all classes")
     
-    # Dictionary to track student recognition across multiple images
-    student_detections = {}
-    for name in roster_names:
-        student_detections[name] = []
-    
-    total_images = 0
-    
-    # Process each classroom image
-    for img_file in os.listdir(CLASSROOM_IMG_DIR):
-        if not img_file.lower().endswith(('.jpg', '.jpeg', '.png')):
-            continue
+    recognized_students = set()
 
+    for img_file in classroom_images(image_dir):
         img_path = os.path.join(CLASSROOM_IMG_DIR, img_file)
         print(f"\n[INFO] Processing classroom image: {img_path}")
-        total_images += 1
 
-        img = cv2.imread(img_path)
-        if img is None:
-            print(f"[ERROR] Could not read image: {img_path}")
+        img, face_boxes, matches = recognize_image(img_path, roster)
+        if not face_boxes:
             continue
 
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        pil_img = Image.fromarray(img_rgb)
-
-        boxes, _ = mtcnn.detect(pil_img)
-        if boxes is None:
-            print("[WARNING] No faces detected in this image.")
-            continue
-
-        faces_in_image = 0
-        for box in boxes:
-            x1, y1, x2, y2 = [int(b) for b in box]
-            face_crop = pil_img.crop((x1, y1, x2, y2)).resize((160, 160))
-
-            face_embedding = get_face_embedding(face_crop)
-            name, dist = match_face(face_embedding, roster_embeddings, roster_names)
-
+        for name, dist in matches:
             if name != "Unknown":
-                student_detections[name].append({
-                    'distance': dist,
-                    'image': img_file,
-                    'confidence': max(0, 1 - dist)  # Convert distance to confidence
-                })
-                faces_in_image += 1
-
-            # Draw bounding box on image
-            cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
-            cv2.putText(img, f"{name} ({dist:.2f})", (x1, y1 - 10),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+                recognized_students.add(name)
 
-        print(f"[INFO] Detected {faces_in_image} faces in {img_file}")
+        output_img_path = save_annotated_image(img, img_file, face_boxes, matches)
+        print(f"[INFO] Saved processed image: {output_img_path}")
 
-        # Save processed image
-        output_img_path = os.path.join(CLASSROOM_IMG_DIR, f"result_{img_file}")
-        cv2.imwrite(output_img_path, img)
+    return recognized_students
+
+def decide_from_faces(analyzed, roster, annotate=None):
+    """
+    Cluster the faces of all images, match each cluster once and save the annotated images.
+    :param analyzed: List of (image file, face boxes, face embeddings) per classroom image;
+                     image files are relative to CLASSROOM_IMG_DIR
+    :param annotate: Image files to save annotated copies of (None for all)
+    :return: Dictionary of student name -> list of cluster detections, each with the
+             cluster distance, confidence, face count and the images it appears in
+    """
+    student_detections = {name: [] for name in roster['names']}
+    faces = [(image_idx, face_idx) for image_idx, (_, face_boxes, _) in enumerate(analyzed)
+             for face_idx in range(len(face_boxes))]
+    if not faces:
+        return student_detections
+
+    embeddings = np.vstack([face_embeddings for _, face_boxes, face_embeddings in analyzed if face_boxes])
+    image_ids = np.array([image_idx for image_idx, _ in faces])
+    with metrics.span("match"):
+        labels = cluster_faces(embeddings, image_ids)
+        cluster_matches = match_clusters(embeddings, labels, roster)
+    print(f"[INFO] {len(faces)} faces grouped into {len(cluster_matches)} people")
+    metrics.inc("attendance_faces_unknown_total",
+                sum(1 for label in labels if cluster_matches[label][0] == "Unknown"))
+
+    for cluster, (name, dist) in enumerate(cluster_matches):
+        if name == "Unknown":
+            continue
+        members = np.flatnonzero(labels == cluster)
+        student_detections[name].append({
+            'distance': dist,
+            'images': {analyzed[image_ids[i]][0] for i in members},
+            'faces': len(members),
+            'confidence': max(0, 1 - dist)  # Convert distance to confidence
+        })
+
+    # Every face is labelled with its cluster's match
+    offset = 0
+    for img_file, face_boxes, _ in analyzed:
+        if face_boxes:
+            matches = [cluster_matches[label] for label in labels[offset:offset + len(face_boxes)]]
+            offset += len(face_boxes)
+            if annotate is not None and img_file not in annotate:
+                continue
+            img = cv2.imread(os.path.join(CLASSROOM_IMG_DIR, img_file))
+            if img is not None:
+                save_annotated_image(img, img_file, face_boxes, matches)
+    return student_detections
 
+def attendance_decision(student_detections, total_images):
+    """
+    Decide who is present from the per-student cluster detections of decide_from_faces.
+    :return: (set of present students, dictionary of student -> confidence, frequency,
+             number of images seen in and present flag)
+    """
     # Determine final attendance based on multiple detections
     print(f"\n[INFO] Analyzing attendance across {total_images} images...")
     recognized_students = set()
-    
+    summary = {}
+
     for student_name, detections in student_detections.items():
         if len(detections) > 0:
-            # Calculate average confidence and detection frequency
+            # Calculate average confidence and detection frequency (one vote per person cluster)
             avg_confidence = sum(d['confidence'] for d in detections) / len(detections)
-            detection_frequency = len(detections) / total_images
-            
+            seen_in = set().union(*(d['images'] for d in detections))
+            detection_frequency = len(seen_in) / total_images
+
             # Student is considered present if:
             # 1. Average confidence > 0.6, OR
             # 2. Detected in at least 30% of images with confidence > 0.5
-            if avg_confidence > 0.6 or (detection_frequency >= 0.3 and avg_confidence > 0.5):
+            present = avg_confidence > 0.6 or (detection_frequency >= 0.3 and avg_confidence > 0.5)
+            summary[student_name] = {
+                'confidence': round(float(avg_confidence), 4),
+                'frequency': round(detection_frequency, 4),
+                'images': len(seen_in),
+                'present': present,
+            }
+            if present:
                 recognized_students.add(student_name)
                 print(f"[PRESENT] {student_name} - Avg confidence: {avg_confidence:.3f}, "
-                      f"Frequency: {detection_frequency:.2f} ({len(detections)}/{total_images})")
+                      f"Frequency: {detection_frequency:.2f} ({len(seen_in)}/{total_images})")
             else:
                 print(f"[UNCERTAIN] {student_name} - Low confidence/frequency: "
                       f"{avg_confidence:.3f}, {detection_frequency:.2f}")
 
+    return recognized_students, summary
+
+# ==========================================
+# Step 2: Process multiple classroom images (enhanced accuracy)
+# ==========================================
+def process_multiple_classroom_images(class_name=None, image_dir=""):
+    """
+    Process multiple classroom images for enhanced attendance accuracy
+    :param class_name: Specific class to process, or None for all classes
+    :param image_dir: Folder of photos relative to CLASSROOM_IMG_DIR (see new_job_dir)
+    :return: Set of recognized students with confidence scores
+    """
+    roster = load_roster(class_name)
+    if class_name:
+        print(f"[INFO] Loaded roster for class: {class_name}")
+    else:
+        print("[INFO] Loaded roster for all classes")
+    
+    # Detect and embed every image first; matching happens once per person below
+    analyzed = []
+    for img_file in classroom_images(image_dir):
+        img_path = os.path.join(CLASSROOM_IMG_DIR, img_file)
+        print(f"\n[INFO] Processing classroom image: {img_path}")
+        img, face_boxes, face_embeddings = analyze_image(img_path)
+        if img is None:
+            continue
+        analyzed.append((img_file, face_boxes, face_embeddings))
+        print(f"[INFO] Detected {len(face_boxes)} faces in {img_file}")
+
+    total_images = len(analyzed)
+    student_detections = decide_from_faces(analyzed, roster)
+
+    recognized_students, _ = attendance_decision(student_detections, total_images)
+
     print(f"\n[SUMMARY] {len(recognized_students)} students marked present from {total_images} images")
     return recognized_students
 
 # ==========================================
 # Step 3: Generate Excel Report for specific class
 # ==========================================
-def generate_excel_report(students_present, class_name=None):
+def generate_excel_report(students_present, class_name=None, background=False, export_formats=(), confidences=None):
     """
     Generate Excel attendance report with Present and Absent status.
     :param students_present: Set of names of students detected as present.
     :param class_name: Specific class name for report generation
+    :param background: Write the files on the report pool instead of the calling thread
+    :param export_formats: Extra formats written alongside the .xlsx ('csv', 'parquet')
+    :param confidences: Optional dictionary of student name -> confidence stored with the records
     :return: Dictionary of results and filename
     """
     # --- Load student names for specific class or all classes ---
     if class_name:
         # Load names for specific class only
-        names_path = os.path.join(OUTPUT_DIR, f"{class_name}_names.npy")
-        if os.path.exists(names_path):
-            all_students = list(np.load(names_path))
-        else:
+        try:
+            all_students = [str(name) for name in read_class_roster(class_name)["names"]]
+        except RuntimeError:
             print(f"[ERROR] No student names found for class: {class_name}")
             all_students = []
     else:
         # Load all student names (fallback)
         all_students = []
-        for file in os.listdir(OUTPUT_DIR):
-            if file.endswith("_names.npy"):
-                names_path = os.path.join(OUTPUT_DIR, file)
-                class_students = np.load(names_path)
-                all_students.extend(class_students)
+        for roster_class in list_roster_classes():
+            all_students.extend(str(name) for name in read_class_roster(roster_class)["names"])
 
     # --- Prepare results dictionary ---
     results = {}
@@ -381,20 +1115,13 @@ def generate_excel_report(students_present, class_name=None):
         status = "Present" if student in students_present else "Absent"
         results[student] = status
 
-    # --- Generate Excel file ---
-    workbook = Workbook()
-    sheet = workbook.active
-    sheet.title = "Attendance Report"
-    
-    # Add headers
-    sheet.append(["Student Name", "Status"])
-    
-    # Fill attendance data
-    for student, status in results.items():
-        sheet.append([student, status])
+    # --- Record the session so consolidated reports can be built from the database ---
+    session_time = datetime.now()
+    if class_name:
+        attendance_store.record_session(class_name, results, session_time, confidences)
 
     # --- Save report with class-specific naming and location ---
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    timestamp = session_time.strftime("%Y-%m-%d_%H-%M-%S")
     
     if class_name:
         filename = f"attendance_{class_name}_{timestamp}.xlsx"
@@ -403,20 +1130,31 @@ def generate_excel_report(students_present, class_name=None):
         filename = f"attendance_{timestamp}.xlsx"
         report_dir = REPORTS_DIR
     
+    # --- Write the Excel file (and any extra formats) with the streaming writers ---
+    header = ["Student Name", "Status"]
+    rows = list(results.items())
     report_path = os.path.join(report_dir, filename)
-    workbook.save(report_path)
-    print(f"[SUCCESS] Attendance report saved at: {report_path}")
+    base_path = os.path.splitext(report_path)[0]
+    present_count = sum(1 for status in results.values() if status == "Present")
+
+    def register(path):
+        attendance_store.register_report(os.path.relpath(path, REPORTS_DIR), class_name, session_time,
+                                         os.path.getsize(path), present_count, len(results) - present_count)
+
+    for fmt in ('xlsx',) + tuple(f for f in export_formats if f != 'xlsx'):
+        path = f"{base_path}.{fmt}"
+        on_complete = register if fmt == 'xlsx' else None
+        if background:
+            reports.submit_report(path, header, rows, fmt, on_complete)
+        else:
+            reports.write_report(path, header, rows, fmt, on_complete)
 
-    return results, filename
+    if background:
+        print(f"[INFO] Attendance report queued: {report_path}")
+    else:
+        print(f"[SUCCESS] Attendance report saved at: {report_path}")
 
-# ==========================================
-# Clear old results
-# ==========================================
-def clear_old_results():
-    for file in os.listdir(CLASSROOM_IMG_DIR):
-        if file.startswith("result_"):
-            os.remove(os.path.join(CLASSROOM_IMG_DIR, file))
-            print(f"[INFO] Removed old result file: {file}")
+    return results, filename
 
 # ==========================================
 # MAIN (for testing purposes)
@@ -425,7 +1163,7 @@ if __name__ == "__main__":
     print("[STEP 1] Building class embeddings...")
     build_class_embeddings()
 
-    clear_old_results()
+    retention.clear_result_images()
     
     print("\n[STEP 2] Processing classroom images...")
     students_present = process_classroom_images()
@@ -0,0 +1,114 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# ==============================
+# CONFIGURATION
+# ==============================
+# Optional JSON-lines log of every timing span (one object per line)
+JSON_LOG_PATH = os.environ.get("ATTENDANCE_METRICS_LOG")
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Metrics live in process memory, so each gunicorn worker reports its own numbers
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_help = {
+    "attendance_stage_seconds": "Time spent in each attendance pipeline stage",
+    "attendance_faces_detected_total": "Faces detected in classroom images",
+    "attendance_faces_unknown_total": "Detected faces that matched no student",
+    "attendance_images_processed_total": "Classroom images run through the pipeline",
+    "attendance_cache_hits_total": "Lookups served from an in-process cache",
+    "attendance_cache_misses_total": "Lookups that had to load or compute the value",
+    "attendance_queue_wait_seconds": "Time recognition jobs waited for an inference worker",
+    "attendance_requests_rejected_total": "Recognition requests turned away with 429 because the queue was full",
+    "storage_retention_seconds": "Time spent applying each storage retention policy",
+    "storage_bytes_reclaimed_total": "Bytes deleted by storage retention policies",
+}
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+# ==========================================
+# Recording
+# ==========================================
+def inc(name, value=1, **labels):
+    """Increase a counter"""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def observe(name, seconds, **labels):
+    """Record one duration in a latency histogram"""
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {"buckets": [0] * len(LATENCY_BUCKETS), "count": 0, "sum": 0.0}
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                histogram["buckets"][i] += 1
+        histogram["count"] += 1
+        histogram["sum"] += seconds
+
+def _write_json_log(entry):
+    try:
+        with _lock, open(JSON_LOG_PATH, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+    except OSError as e:
+        print(f"[WARNING] Could not write metrics log: {e}")
+
+@contextmanager
+def span(stage, **labels):
+    """
+    Time a pipeline stage and record it under attendance_stage_seconds.
+    :param stage: Stage name (decode, detect, embed, match, render, excel_write, ...)
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        observe("attendance_stage_seconds", elapsed, stage=stage, **labels)
+        if JSON_LOG_PATH:
+            _write_json_log({"ts": time.time(), "stage": stage, "seconds": round(elapsed, 6), **labels})
+
+# ==========================================
+# Export
+# ==========================================
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+def render_prometheus():
+    """Render all metrics in the Prometheus text exposition format"""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: {"buckets": list(h["buckets"]), "count": h["count"], "sum": h["sum"]}
+                      for key, h in _histograms.items()}
+
+    lines = []
+    seen = set()
+    for (name, labels), value in sorted(counters.items()):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# HELP {name} {_help.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    for (name, labels), histogram in sorted(histograms.items()):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# HELP {name} {_help.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+        for bound, count in zip(LATENCY_BUCKETS, histogram["buckets"]):
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+        lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']:.6f}")
+        lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+
+    return "\n".join(lines) + "\n"
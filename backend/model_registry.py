@@ -0,0 +1,181 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+import zipfile
+import argparse
+import torch
+from facenet_pytorch import MTCNN, InceptionResnetV1
+
+# ==============================
+# CONFIGURATION
+# ==============================
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # project root
+MODEL_DIR = os.environ.get("MODEL_DIR", os.path.join(BASE_DIR, "models")) # Local weight files
+MANIFEST_FILE = "manifest.json" # name -> {"file", "sha256", "version"}
+# Refuse to download weights when they are not registered locally (air-gapped servers)
+MODEL_OFFLINE = os.environ.get("MODEL_OFFLINE", "0") == "1"
+
+RECOGNITION_MODEL = "inception_resnet_v1"
+MTCNN_NETS = ("pnet", "rnet", "onet")
+FACENET_PACKAGE_DIR = os.path.dirname(os.path.abspath(sys.modules[MTCNN.__module__].__file__))
+
+class ModelRegistryError(RuntimeError):
+    pass
+
+# ==========================================
+# Manifest and checksums
+# ==========================================
+def manifest_path():
+    return os.path.join(MODEL_DIR, MANIFEST_FILE)
+
+def load_manifest():
+    path = manifest_path()
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+def save_manifest(manifest):
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    partial_path = f"{manifest_path()}.part"
+    with open(partial_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(partial_path, manifest_path())
+
+def file_sha256(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def verified_path(name):
+    """
+    Path of a registered weight file after checking its SHA-256.
+    :return: Path, or None if the model is not registered
+    :raises ModelRegistryError: File missing or checksum mismatch
+    """
+    entry = load_manifest().get(name)
+    if entry is None:
+        return None
+    path = os.path.join(MODEL_DIR, entry["file"])
+    if not os.path.exists(path):
+        raise ModelRegistryError(f"Weights for {name} are registered but missing: {path}")
+    digest = file_sha256(path)
+    if digest != entry["sha256"]:
+        raise ModelRegistryError(f"Checksum mismatch for {name}: expected {entry['sha256']}, got {digest}")
+    return path
+
+def load_state_dict(name):
+    """
+    Load a registered state dict memory-mapped, so worker processes share its pages.
+    Files in torch's legacy (non-zip) format cannot be mapped and are read normally.
+    :return: State dict, or None if the model is not registered
+    """
+    path = verified_path(name)
+    if path is None:
+        return None
+    if zipfile.is_zipfile(path):
+        return torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    return torch.load(path, map_location="cpu", weights_only=True)
+
+def model_version(name):
+    entry = load_manifest().get(name)
+    if entry is None:
+        return None
+    return entry.get("version") or entry["sha256"][:12]
+
+# ==========================================
+# Model construction
+# ==========================================
+def load_recognition_model(device="cpu"):
+    """
+    Build InceptionResnetV1 from the locally registered weights.
+    Without a registered copy it falls back to facenet-pytorch's download (unless
+    MODEL_OFFLINE is set).
+    :return: (model in eval mode, model version string)
+    """
+    state_dict = load_state_dict(RECOGNITION_MODEL)
+    if state_dict is None:
+        if MODEL_OFFLINE:
+            raise ModelRegistryError(
+                f"No local weights for {RECOGNITION_MODEL} in {MODEL_DIR}. "
+                f"Register them with: python -m backend.model_registry add {RECOGNITION_MODEL} <file>")
+        print(f"[WARNING] No local weights for {RECOGNITION_MODEL} in {MODEL_DIR}; downloading vggface2")
+        return InceptionResnetV1(pretrained='vggface2').eval().to(device), "vggface2-download"
+
+    # The classification layer is not used for embeddings
+    state_dict = {key: value for key, value in state_dict.items() if not key.startswith("logits.")}
+    model = InceptionResnetV1(pretrained=None, classify=False)
+    model.load_state_dict(state_dict, assign=True)  # Keep the memory-mapped tensors
+    return model.eval().to(device), model_version(RECOGNITION_MODEL)
+
+def load_detector(device="cpu", **kwargs):
+    """
+    Build MTCNN, replacing the P/R/O-net weights with registered local copies when present.
+    :return: (MTCNN, version string)
+    """
+    mtcnn = MTCNN(device=device, **kwargs)
+    versions = []
+    for net in MTCNN_NETS:
+        state_dict = load_state_dict(f"mtcnn_{net}")
+        if state_dict is not None:
+            getattr(mtcnn, net).load_state_dict(state_dict)
+            versions.append(model_version(f"mtcnn_{net}"))
+    return mtcnn, "+".join(dict.fromkeys(versions)) if versions else "facenet-bundled"
+
+# ==========================================
+# Command line: register and verify weights
+# ==========================================
+def add_model(name, source_path, version=None):
+    """Copy a weight file into MODEL_DIR and record its checksum in the manifest"""
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    filename = os.path.basename(source_path)
+    destination = os.path.join(MODEL_DIR, filename)
+    if os.path.abspath(source_path) != os.path.abspath(destination):
+        shutil.copyfile(source_path, destination)
+
+    manifest = load_manifest()
+    manifest[name] = {"file": filename, "sha256": file_sha256(destination), "version": version}
+    save_manifest(manifest)
+    print(f"[SUCCESS] Registered {name} -> {destination}")
+
+def bootstrap():
+    """Register weights already on this machine: the torch hub cache and facenet's bundled MTCNN"""
+    hub_file = os.path.join(torch.hub.get_dir(), "checkpoints", "20180402-114759-vggface2.pt")
+    if os.path.exists(hub_file):
+        add_model(RECOGNITION_MODEL, hub_file, "vggface2-20180402")
+    else:
+        print(f"[WARNING] {hub_file} not found; copy the vggface2 weights here and use 'add'")
+    for net in MTCNN_NETS:
+        bundled = os.path.join(FACENET_PACKAGE_DIR, "..", "data", f"{net}.pt")
+        if os.path.exists(bundled):
+            add_model(f"mtcnn_{net}", bundled, "facenet-pytorch")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage locally stored model weights")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add_parser = commands.add_parser("add", help="Register a weight file")
+    add_parser.add_argument("name", help=f"{RECOGNITION_MODEL} or mtcnn_pnet/mtcnn_rnet/mtcnn_onet")
+    add_parser.add_argument("path", help="Weight file (.pt state dict)")
+    add_parser.add_argument("--version", default=None, help="Version label recorded with rosters")
+    commands.add_parser("bootstrap", help="Register weights found in the torch hub cache and facenet-pytorch")
+    commands.add_parser("verify", help="Check every registered file against its checksum")
+    args = parser.parse_args()
+
+    if args.command == "add":
+        add_model(args.name, args.path, args.version)
+    elif args.command == "bootstrap":
+        bootstrap()
+    else:
+        failed = False
+        for name in sorted(load_manifest()):
+            try:
+                verified_path(name)
+                print(f"[SUCCESS] {name} ({model_version(name)})")
+            except ModelRegistryError as e:
+                failed = True
+                print(f"[ERROR] {e}")
+        sys.exit(1 if failed else 0)
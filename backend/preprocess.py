@@ -0,0 +1,115 @@
+import os
+import math
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+# ==============================
+# CONFIGURATION
+# ==============================
+FACE_SIZE = 160 # InceptionResnetV1 input size
+MAX_SUPERSAMPLE = 4 # Cap on the anti-aliasing factor for large faces
+# Rotate crops so the eyes are level (uses MTCNN landmarks). Enrollment and recognition
+# must agree, so changing this re-embeds enrollment photos on the next roster build.
+ALIGN_FACES = os.environ.get("ALIGN_FACES", "0") == "1"
+
+# ==========================================
+# Tensor-native face preprocessing
+# ==========================================
+# The frame is decoded once into a uint8 tensor; every face is then cropped, rotated
+# (optionally) and resized with one grid_sample call per supersampling factor, and
+# normalised in place. No per-face PIL images or numpy copies are made.
+
+def image_to_tensor(img_rgb, device='cpu'):
+    """
+    Wrap a decoded RGB uint8 image (H x W x 3 numpy array) as a 3 x H x W tensor.
+    The numpy buffer is shared, not copied; only the device transfer copies.
+    """
+    img_rgb = np.ascontiguousarray(img_rgb)
+    if not img_rgb.flags.writeable:
+        img_rgb = img_rgb.copy()  # e.g. np.asarray(PIL image); torch cannot share read-only buffers
+    return torch.from_numpy(img_rgb).permute(2, 0, 1).to(device)
+
+def _crop_transforms(boxes, landmarks, height, width, align):
+    """
+    2x3 affine matrices mapping each output crop (in [-1, 1]) onto its face box in the
+    normalised input frame, rotated about the box centre when aligning.
+    """
+    x1, y1, x2, y2 = boxes.unbind(1)
+    cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+    half_w, half_h = (x2 - x1) / 2, (y2 - y1) / 2
+
+    angle = torch.zeros_like(cx)
+    if align and landmarks is not None:
+        # MTCNN landmarks: left eye, right eye, nose, mouth left, mouth right
+        eyes = landmarks[:, 1] - landmarks[:, 0]
+        angle = torch.atan2(eyes[:, 1], eyes[:, 0])
+    cos, sin = angle.cos(), angle.sin()
+
+    theta = torch.empty(len(boxes), 2, 3, dtype=torch.float32, device=boxes.device)
+    theta[:, 0, 0] = cos * half_w / (width / 2)
+    theta[:, 0, 1] = -sin * half_h / (width / 2)
+    theta[:, 0, 2] = cx / (width / 2) - 1
+    theta[:, 1, 0] = sin * half_w / (height / 2)
+    theta[:, 1, 1] = cos * half_h / (height / 2)
+    theta[:, 1, 2] = cy / (height / 2) - 1
+    return theta
+
+def crop_faces(image, boxes, landmarks=None, align=ALIGN_FACES, size=FACE_SIZE):
+    """
+    Crop and resize every face from one frame in a single batched operation.
+    :param image: uint8 tensor (3 x H x W) from image_to_tensor
+    :param boxes: Face boxes (N x 4: x1, y1, x2, y2 in pixels) as returned by MTCNN
+    :param landmarks: Optional MTCNN landmarks (N x 5 x 2), used when align is set
+    :param align: Rotate each crop about its centre so the eyes are horizontal
+    :param size: Output side length
+    :return: float32 tensor (N x 3 x size x size), normalised as (x - 127.5) / 128
+    """
+    boxes = torch.as_tensor(np.asarray(boxes, dtype=np.float32), dtype=torch.float32, device=image.device).reshape(-1, 4)
+    count = len(boxes)
+    if count == 0:
+        return torch.empty(0, 3, size, size, dtype=torch.float32, device=image.device)
+    if landmarks is not None:
+        landmarks = torch.as_tensor(np.asarray(landmarks, dtype=np.float32), dtype=torch.float32, device=image.device)
+
+    height, width = image.shape[-2:]
+    x1, y1, x2, y2 = boxes.unbind(1)
+    cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+    half_w, half_h = (x2 - x1) / 2, (y2 - y1) / 2
+    if align and landmarks is not None:
+        half_w = half_h = torch.hypot(half_w, half_h)  # A rotated crop stays inside its circumcircle
+
+    # Each face is sampled from its own region of the frame (plus a margin for bilinear
+    # taps), so only the face regions are converted to float, never the whole frame
+    left = (cx - half_w).floor().sub(2).clamp(0, width).long().tolist()
+    right = (cx + half_w).ceil().add(2).clamp(0, width).long().tolist()
+    top = (cy - half_h).floor().sub(2).clamp(0, height).long().tolist()
+    bottom = (cy + half_h).ceil().add(2).clamp(0, height).long().tolist()
+    offsets = torch.tensor(list(zip(left, top)), dtype=torch.float32, device=image.device)
+
+    # Large faces are sampled on a finer grid and averaged down so downscaling does not
+    # alias; the factor is per face, so one close-up does not enlarge every other crop
+    sides = torch.max(boxes[:, 2:] - boxes[:, :2], dim=1).values
+    factors = (sides / size).ceil().clamp(1, MAX_SUPERSAMPLE).long().tolist()
+
+    faces = torch.empty(count, 3, size, size, dtype=torch.float32, device=image.device)
+    for factor in sorted(set(factors)):
+        members = [i for i in range(count) if factors[i] == factor]
+        region_h = max(max(bottom[i] - top[i] for i in members), 1)
+        region_w = max(max(right[i] - left[i] for i in members), 1)
+        # Regions are padded with zeros to a common size; the padding lies outside the
+        # frame or outside every sampling footprint, so it reads as the frame border would
+        regions = torch.zeros(len(members), 3, region_h, region_w, dtype=torch.float32, device=image.device)
+        for j, i in enumerate(members):
+            regions[j, :, :bottom[i] - top[i], :right[i] - left[i]] = image[:, top[i]:bottom[i], left[i]:right[i]]
+
+        index = torch.tensor(members, device=image.device)
+        local_boxes = boxes[index] - offsets[index].repeat(1, 2)
+        local_landmarks = None if landmarks is None else landmarks[index] - offsets[index].unsqueeze(1)
+        theta = _crop_transforms(local_boxes, local_landmarks, region_h, region_w, align)
+        grid_size = size * factor
+        grid = F.affine_grid(theta, (len(members), 3, grid_size, grid_size), align_corners=False)
+        sampled = F.grid_sample(regions, grid, mode='bilinear', padding_mode='zeros', align_corners=False)
+        faces[index] = F.avg_pool2d(sampled, factor) if factor > 1 else sampled
+
+    return faces.sub_(127.5).div_(128.0)
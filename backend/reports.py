@@ -0,0 +1,138 @@
+import os
+import csv
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, wait
+from openpyxl import Workbook
+
+from backend import metrics
+
+# Parquet export is optional; everything else works without pyarrow
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# ==============================
+# CONFIGURATION
+# ==============================
+REPORT_FORMATS = ('xlsx', 'csv', 'parquet')
+REPORT_WORKERS = int(os.environ.get("REPORT_WORKERS", 2)) # Background report writer threads
+PARQUET_BATCH_ROWS = 10000 # Rows buffered per Parquet row group
+
+_executor = ThreadPoolExecutor(max_workers=REPORT_WORKERS, thread_name_prefix="report")
+_pending = {}
+_pending_lock = threading.Lock()
+
+# ==========================================
+# Streaming writers (rows are consumed one at a time)
+# ==========================================
+def write_xlsx(path, header, rows, title="Attendance Report"):
+    """Write rows with openpyxl's write-only mode so memory stays flat for long reports"""
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    sheet.append(list(header))
+    for row in rows:
+        sheet.append(list(row))
+    workbook.save(path)
+
+def write_csv(path, header, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for row in rows:
+            writer.writerow(row)
+
+def write_parquet(path, header, rows):
+    """Write rows as Parquet in row groups of PARQUET_BATCH_ROWS"""
+    if pq is None:
+        raise RuntimeError("Parquet export needs pyarrow. Install it with: pip install pyarrow")
+
+    header = list(header)
+    writer = None
+    batch = []
+
+    def flush():
+        nonlocal writer
+        columns = {name: [row[i] for row in batch] for i, name in enumerate(header)}
+        if writer is None:
+            table = pa.Table.from_pydict(columns)
+            writer = pq.ParquetWriter(path, table.schema)
+        else:
+            table = pa.Table.from_pydict(columns, schema=writer.schema)
+        writer.write_table(table)
+        batch.clear()
+
+    try:
+        for row in rows:
+            batch.append(list(row))
+            if len(batch) >= PARQUET_BATCH_ROWS:
+                flush()
+        if batch or writer is None:
+            flush()
+    finally:
+        if writer is not None:
+            writer.close()
+
+_WRITERS = {'xlsx': write_xlsx, 'csv': write_csv, 'parquet': write_parquet}
+
+def write_report(path, header, rows, fmt=None, on_complete=None):
+    """
+    Write a report file, choosing the writer from fmt or the file extension.
+    The file is written under a temporary name and renamed into place, so readers
+    never see a half-written report.
+    :param on_complete: Optional callback called with the path once the file is in place
+    :return: The report path
+    """
+    fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower()
+    if fmt not in _WRITERS:
+        raise ValueError(f"Unsupported report format: {fmt}")
+
+    partial_path = f"{path}.{uuid.uuid4().hex}.part"  # Unique, so concurrent writers of one path never share it
+    with metrics.span("excel_write" if fmt == 'xlsx' else f"{fmt}_write"):
+        try:
+            _WRITERS[fmt](partial_path, header, rows)
+            os.replace(partial_path, path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+    if on_complete is not None:
+        on_complete(path)
+    return path
+
+# ==========================================
+# Background generation off the request thread
+# ==========================================
+def submit_report(path, header, rows, fmt=None, on_complete=None):
+    """
+    Write a report on the background pool and return a Future.
+    rows must be safe to consume from another thread (e.g. a list, not a cursor on
+    a request-owned sqlite connection).
+    """
+    key = os.path.abspath(path)
+    future = _executor.submit(write_report, path, header, rows, fmt, on_complete)
+    with _pending_lock:
+        _pending[key] = future
+
+    def _done(finished):
+        with _pending_lock:
+            if _pending.get(key) is finished:
+                del _pending[key]
+        if finished.exception() is not None:
+            print(f"[ERROR] Report generation failed for {path}: {finished.exception()}")
+
+    future.add_done_callback(_done)
+    return future
+
+def wait_for_report(path, timeout=60):
+    """
+    Block until a report still being written in the background is finished.
+    A failed write is logged by the pool and simply leaves no file at path.
+    :raises concurrent.futures.TimeoutError: The report is still being written after timeout seconds
+    """
+    with _pending_lock:
+        future = _pending.get(os.path.abspath(path))
+    if future is not None and not wait([future], timeout=timeout).done:
+        raise TimeoutError(f"Report {path} is still being written")
@@ -0,0 +1,174 @@
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+from contextlib import contextmanager
+from concurrent.futures import TimeoutError
+
+from backend import main, metrics, reports, thumbnails
+
+# ==============================
+# CONFIGURATION
+# ==============================
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 8 * 1024 * 1024)) # Stored result JSON
+RESULT_CACHE_TTL = int(os.environ.get("RESULT_CACHE_TTL", 300)) # Seconds a stored result can be replayed
+
+# ==========================================
+# Idempotent attendance results
+# ==========================================
+# Re-submitting the same photos (double-click, retry after a timeout, page refresh)
+# returns the stored result and report instead of running the pipeline again. The
+# key covers the image contents, the roster file (names, prototypes, thresholds and
+# model version) and the matching settings, so any change produces a fresh run.
+# Results expire after RESULT_CACHE_TTL: the cache is meant for retries, and a class
+# photographed again later (same seating, same photo) should be a new attendance record.
+# claim() only serialises submissions within one process; identical requests handled
+# by different workers can still both run the pipeline.
+_inflight = {}
+_inflight_guard = threading.Lock()
+
+def get_connection():
+    conn = sqlite3.connect(main.DB_PATH, timeout=10)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS attendance_result_cache (
+            cache_key CHAR(64) PRIMARY KEY,
+            class_name VARCHAR(50) NOT NULL,
+            results TEXT NOT NULL,
+            report_file TEXT NOT NULL,
+            image_count INTEGER NOT NULL,
+            size_bytes INTEGER NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            last_used_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_result_cache_used ON attendance_result_cache (last_used_at)")
+    return conn
+
+def stream_digest(stream):
+    """SHA-256 of an uploaded file stream, rewound afterwards so it can still be saved"""
+    sha = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(1024 * 1024), b""):
+        sha.update(chunk)
+    stream.seek(0)
+    return sha.hexdigest()
+
+def make_key(mode, class_name, image_digests):
+    """
+    Cache key for one submission.
+    :param mode: 'single' or 'multi' (the two pipelines decide differently)
+    :param image_digests: SHA-256 of every submitted image; order does not matter
+    :return: Key, or None when the class has no single-file roster to version against
+    """
+    roster_file = main.roster_path(class_name)
+    if not os.path.exists(roster_file):
+        return None
+    parts = [mode, class_name, thumbnails.content_digest(roster_file),
+             f"cluster={main.CLUSTER_DISTANCE}", *sorted(image_digests)]
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+@contextmanager
+def claim(key):
+    """Serialise identical submissions, so a double-click waits for the first run and then hits"""
+    if key is None:
+        yield
+        return
+    with _inflight_guard:
+        entry = _inflight.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _inflight_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                _inflight.pop(key, None)
+
+def _expiry():
+    return f"-{RESULT_CACHE_TTL} seconds"
+
+def get(key, reports_dir):
+    """
+    Stored (results, report file) for a key, or None. Entries older than
+    RESULT_CACHE_TTL or whose report has been deleted since are dropped.
+    """
+    if key is None:
+        return None
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM attendance_result_cache WHERE cache_key = ? AND created_at < datetime('now', ?)",
+                     (key, _expiry()))
+    row = conn.execute("SELECT results, report_file FROM attendance_result_cache WHERE cache_key = ?",
+                       (key,)).fetchone()
+    if row is None:
+        conn.close()
+        metrics.inc("attendance_cache_misses_total", cache="result")
+        return None
+
+    results, report_file = row
+    report_path = os.path.join(reports_dir, report_file)
+    try:
+        reports.wait_for_report(report_path)  # A retry can arrive while the report is still being written
+    except TimeoutError:
+        # Not a hit yet, but the entry stays for the next retry; a failed write shows up as a missing file below
+        print(f"[WARNING] Cached report {report_file} is still being written; processing again")
+        conn.close()
+        metrics.inc("attendance_cache_misses_total", cache="result")
+        return None
+    with conn:
+        if os.path.exists(report_path):
+            conn.execute("UPDATE attendance_result_cache SET last_used_at = CURRENT_TIMESTAMP WHERE cache_key = ?",
+                         (key,))
+        else:
+            print(f"[WARNING] Cached report {report_file} is missing; dropping the cached result")
+            conn.execute("DELETE FROM attendance_result_cache WHERE cache_key = ?", (key,))
+            row = None
+    conn.close()
+    if row is None:
+        metrics.inc("attendance_cache_misses_total", cache="result")
+        return None
+    metrics.inc("attendance_cache_hits_total", cache="result")
+    return json.loads(results), report_file
+
+def put(key, class_name, results, report_file, image_count):
+    """Store a finished result, then evict least recently used entries over RESULT_CACHE_MAX_BYTES"""
+    if key is None:
+        return
+    payload = json.dumps(results)
+    conn = get_connection()
+    with conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO attendance_result_cache
+            (cache_key, class_name, results, report_file, image_count, size_bytes)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (key, class_name, payload, report_file, image_count, len(payload)))
+    evict(conn)
+    conn.close()
+
+def evict(conn=None, max_bytes=RESULT_CACHE_MAX_BYTES):
+    """
+    Remove expired results, then least recently used ones until the stored JSON fits
+    in max_bytes.
+    :return: Number of entries removed
+    """
+    own_connection = conn is None
+    conn = conn or get_connection()
+    with conn:
+        expired = conn.execute("DELETE FROM attendance_result_cache WHERE created_at < datetime('now', ?)",
+                               (_expiry(),)).rowcount
+    total = 0
+    stale = []
+    for key, size_bytes in conn.execute(
+            "SELECT cache_key, size_bytes FROM attendance_result_cache ORDER BY last_used_at DESC, created_at DESC"):
+        total += size_bytes
+        if total > max_bytes:
+            stale.append((key,))
+    if stale:
+        with conn:
+            conn.executemany("DELETE FROM attendance_result_cache WHERE cache_key = ?", stale)
+    if stale or expired:
+        print(f"[INFO] Evicted {len(stale) + expired} cached attendance results")
+    if own_connection:
+        conn.close()
+    return len(stale) + expired
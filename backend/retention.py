@@ -0,0 +1,330 @@
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import threading
+from datetime import datetime, timedelta
+from itertools import islice
+
+from backend import metrics, thumbnails, attendance_store
+
+# ==============================
+# CONFIGURATION
+# ==============================
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # project root
+CLASSROOM_IMG_DIR = os.path.join(BASE_DIR, "database", "class_img") # Classroom uploads and result_* images
+SESSION_IMG_DIR = os.path.join(CLASSROOM_IMG_DIR, "sessions") # Incremental session photos
+JOB_IMG_DIR = os.path.join(CLASSROOM_IMG_DIR, "jobs") # One folder of photos per web submission
+REPORTS_DIR = os.path.join(BASE_DIR, "reports") # Per-session attendance reports
+BULK_STAGING_DIR = os.path.join(BASE_DIR, "database", "bulk_uploads") # Bulk enrollment archives being received
+DB_PATH = os.path.join(BASE_DIR, "attendance.db")
+
+RETENTION_INTERVAL = float(os.environ.get("RETENTION_INTERVAL", 3600)) # Seconds between background runs; 0 disables
+BATCH_SIZE = int(os.environ.get("RETENTION_BATCH_SIZE", 500)) # Files/rows deleted per transaction
+BATCH_PAUSE = float(os.environ.get("RETENTION_BATCH_PAUSE", 0.05)) # Seconds between batches, keeps disk I/O smooth
+# Days to keep each kind of data; 0 keeps it forever
+RETENTION_DAYS = {
+    "classroom_uploads": float(os.environ.get("RETAIN_CLASSROOM_UPLOADS_DAYS", 1)),
+    "result_images": float(os.environ.get("RETAIN_RESULT_IMAGES_DAYS", 7)),
+    "sessions": float(os.environ.get("RETAIN_SESSIONS_DAYS", 30)),
+    "reports": float(os.environ.get("RETAIN_REPORTS_DAYS", 365)),
+    "consolidated_reports": float(os.environ.get("RETAIN_CONSOLIDATED_REPORTS_DAYS", 30)),
+    "rejected_samples": float(os.environ.get("RETAIN_REJECTED_SAMPLES_DAYS", 30)),
+    "abandoned_uploads": float(os.environ.get("RETAIN_ABANDONED_UPLOADS_DAYS", 2)),
+}
+CLASSROOM_UPLOAD_PREFIXES = ("classroom_", "captured_")
+REPORT_VARIANT_SUFFIXES = (".csv", ".csv.gz", ".csv.zst", ".parquet") # Written next to the indexed .xlsx
+
+# ==========================================
+# Storage lifecycle
+# ==========================================
+# Every kind of generated data has a retention policy. A policy finds expired items
+# without materialising whole directories or tables, then deletes them BATCH_SIZE at
+# a time: files first, then their rows in one transaction, so an interrupted run
+# leaves nothing behind that the next run cannot finish. Each run reports the files,
+# rows and bytes it reclaimed.
+_run_lock = threading.Lock()
+_scheduler = None
+
+def _chunks(items, size=None):
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size or BATCH_SIZE))
+        if not chunk:
+            return
+        yield chunk
+
+def _remove(path):
+    """Delete a file if it exists. :return: Bytes reclaimed"""
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
+    except OSError as e:
+        print(f"[WARNING] Could not remove {path}: {e}")
+        return 0
+
+def _remove_tree(directory):
+    """Delete a directory tree bottom-up. :return: (files removed, bytes reclaimed)"""
+    files, reclaimed = 0, 0
+    for root, dirs, names in os.walk(directory, topdown=False):
+        for name in names:
+            reclaimed += _remove(os.path.join(root, name))
+            files += 1
+        try:
+            os.rmdir(root)
+        except OSError:
+            pass
+    return files, reclaimed
+
+def _expired_files(directory, cutoff, prefixes=None, recursive=False):
+    """Yield paths of files under directory last modified before cutoff (epoch seconds)"""
+    try:
+        entries = os.scandir(directory)
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if recursive:
+                    yield from _expired_files(entry.path, cutoff, prefixes, recursive)
+            elif (prefixes is None or entry.name.startswith(prefixes)) and entry.stat().st_mtime < cutoff:
+                yield entry.path
+
+def _delete_files(paths):
+    """Delete files in batches. :return: (files removed, bytes reclaimed)"""
+    files, reclaimed = 0, 0
+    for chunk in _chunks(paths):
+        for path in chunk:
+            reclaimed += _remove(path)
+        files += len(chunk)
+        time.sleep(BATCH_PAUSE)
+    return files, reclaimed
+
+def _forget(module_name, function_name, rows):
+    """
+    Let a module drop in-memory state (e.g. locks) of deleted items. Only done when the
+    module is already loaded in this process; otherwise it holds nothing to drop.
+    """
+    module = sys.modules.get(module_name)
+    if module is not None:
+        for row in rows:
+            getattr(module, function_name)(row[0])
+
+def _delete_rows(select_sql, params, delete_files, delete_rows):
+    """
+    Select expired rows BATCH_SIZE at a time, delete their files, then their rows.
+    :param select_sql: Query returning the oldest expired rows; LIMIT ? is appended
+    :param delete_files: Function(rows) -> (files removed, bytes reclaimed)
+    :param delete_rows: Function(conn, rows) deleting the rows inside the open transaction
+    :return: (files removed, rows deleted, bytes reclaimed)
+    """
+    files, deleted, reclaimed = 0, 0, 0
+    conn = sqlite3.connect(DB_PATH, timeout=10)
+    try:
+        while True:
+            rows = conn.execute(f"{select_sql} LIMIT ?", params + [BATCH_SIZE]).fetchall()
+            if not rows:
+                break
+            removed, size = delete_files(rows)
+            with conn:
+                delete_rows(conn, rows)
+            files += removed
+            deleted += len(rows)
+            reclaimed += size
+            time.sleep(BATCH_PAUSE)
+    except sqlite3.OperationalError as e:
+        if "no such table" not in str(e):  # Feature never used on this install
+            raise
+    finally:
+        conn.close()
+    return files, deleted, reclaimed
+
+def clear_result_images():
+    """Remove every annotated result_* image. :return: (files removed, bytes reclaimed)"""
+    return _delete_files(_expired_files(CLASSROOM_IMG_DIR, float("inf"), ("result_",), recursive=True))
+
+# ==========================================
+# Policies
+# ==========================================
+# Each takes the retention period in days and returns (files removed, rows deleted, bytes reclaimed)
+def _expired_dirs(directory, cutoff):
+    """Yield subdirectories of directory last modified before cutoff (epoch seconds)"""
+    try:
+        entries = os.scandir(directory)
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False) and entry.stat().st_mtime < cutoff:
+                yield entry.path
+
+def expire_classroom_uploads(days):
+    """Uploads left behind by command-line runs, and submission folders with their annotated copies"""
+    cutoff = time.time() - days * 86400
+    files, reclaimed = _delete_files(_expired_files(CLASSROOM_IMG_DIR, cutoff, CLASSROOM_UPLOAD_PREFIXES))
+    for chunk in _chunks(_expired_dirs(JOB_IMG_DIR, cutoff)):
+        for job_dir in chunk:
+            removed, size = _remove_tree(job_dir)
+            files += removed
+            reclaimed += size
+        time.sleep(BATCH_PAUSE)
+    return files, 0, reclaimed
+
+def expire_result_images(days):
+    """Annotated result_* images, including those inside session folders"""
+    files, reclaimed = _delete_files(_expired_files(CLASSROOM_IMG_DIR, time.time() - days * 86400,
+                                                    ("result_",), recursive=True))
+    return files, 0, reclaimed
+
+def expire_sessions(days):
+    """Incremental sessions (open or closed) not touched for the retention period, with their photos and faces"""
+    def delete_files(rows):
+        files, reclaimed = 0, 0
+        for (session_id,) in rows:
+            removed, size = _remove_tree(os.path.join(SESSION_IMG_DIR, session_id))
+            files += removed
+            reclaimed += size
+        return files, reclaimed
+
+    def delete_rows(conn, rows):
+        conn.executemany("""
+            DELETE FROM session_faces WHERE image_id IN (SELECT id FROM session_images WHERE session_id = ?)
+        """, rows)
+        conn.executemany("DELETE FROM session_images WHERE session_id = ?", rows)
+        conn.executemany("DELETE FROM attendance_sessions WHERE session_id = ?", rows)
+        _forget("backend.sessions", "forget_session", rows)
+
+    return _delete_rows("""
+        SELECT session_id FROM attendance_sessions
+        WHERE updated_at < datetime('now', ?) ORDER BY updated_at
+    """, [f"-{days} days"], delete_files, delete_rows)
+
+def expire_reports(days):
+    """Per-session report files and their report_index rows (attendance records are kept)"""
+    def delete_files(rows):
+        files, reclaimed = 0, 0
+        for _, path in rows:
+            full_path = os.path.join(REPORTS_DIR, path)
+            base_path = os.path.splitext(full_path)[0]
+            for variant in (full_path,) + tuple(base_path + suffix for suffix in REPORT_VARIANT_SUFFIXES):
+                if os.path.exists(variant):
+                    reclaimed += _remove(variant)
+                    files += 1
+        return files, reclaimed
+
+    def delete_rows(conn, rows):
+        conn.executemany("DELETE FROM report_index WHERE id = ?", [(row_id,) for row_id, _ in rows])
+
+    # created_at is local time (written from datetime.now())
+    cutoff = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+    return _delete_rows("SELECT id, path FROM report_index WHERE created_at < ? ORDER BY created_at",
+                        [cutoff], delete_files, delete_rows)
+
+def expire_consolidated_reports(days):
+    """Cached term reports for date ranges nobody has downloaded recently (rebuilt on demand)"""
+    files, reclaimed = _delete_files(_expired_files(attendance_store.CONSOLIDATED_CACHE_DIR,
+                                                    time.time() - days * 86400, recursive=True))
+    return files, 0, reclaimed
+
+def expire_rejected_samples(days):
+    """Rejected student sample images and their sample_images rows"""
+    def delete_files(rows):
+        reclaimed = 0
+        for _, image_path, class_name, student_name, image_filename in rows:
+            reclaimed += _remove(thumbnails.resolve_sample_path(image_path, class_name, student_name, image_filename))
+        return len(rows), reclaimed
+
+    def delete_rows(conn, rows):
+        conn.executemany("DELETE FROM sample_images WHERE id = ?", [(row[0],) for row in rows])
+
+    return _delete_rows("""
+        SELECT id, image_path, class_name, student_name, image_filename FROM sample_images
+        WHERE status = 'rejected' AND upload_date < date('now', ?) ORDER BY id
+    """, [f"-{days} days"], delete_files, delete_rows)
+
+def expire_abandoned_uploads(days):
+    """Bulk enrollment uploads that stopped receiving chunks, with their partial archives"""
+    def delete_files(rows):
+        reclaimed = sum(_remove(os.path.join(BULK_STAGING_DIR, f"{upload_id}.part")) for (upload_id,) in rows)
+        return len(rows), reclaimed
+
+    def delete_rows(conn, rows):
+        conn.executemany("DELETE FROM bulk_uploads WHERE upload_id = ?", rows)
+        _forget("backend.bulk_enrollment", "forget_upload", rows)
+
+    return _delete_rows("""
+        SELECT upload_id FROM bulk_uploads
+        WHERE status = 'receiving' AND updated_at < datetime('now', ?) ORDER BY updated_at
+    """, [f"-{days} days"], delete_files, delete_rows)
+
+POLICIES = {
+    "classroom_uploads": expire_classroom_uploads,
+    "result_images": expire_result_images,
+    "sessions": expire_sessions,
+    "reports": expire_reports,
+    "consolidated_reports": expire_consolidated_reports,
+    "rejected_samples": expire_rejected_samples,
+    "abandoned_uploads": expire_abandoned_uploads,
+}
+
+def run_retention(policies=None):
+    """
+    Apply retention policies (default: all with a non-zero retention period), then
+    trim the thumbnail cache to its size limit.
+    :return: Dictionary of policy -> {"files", "rows", "bytes"}
+    """
+    summary = {}
+    with _run_lock:
+        for name in policies or POLICIES:
+            days = RETENTION_DAYS[name]
+            if days <= 0:
+                continue
+            start = time.perf_counter()
+            try:
+                files, rows, reclaimed = POLICIES[name](days)
+            except Exception as e:
+                print(f"[ERROR] Retention policy {name} failed: {e}")
+                continue
+            summary[name] = {"files": files, "rows": rows, "bytes": reclaimed}
+            metrics.observe("storage_retention_seconds", time.perf_counter() - start, policy=name)
+            metrics.inc("storage_bytes_reclaimed_total", reclaimed, policy=name)
+            if files or rows:
+                print(f"[INFO] Retention {name}: removed {files} files and {rows} rows, "
+                      f"reclaimed {reclaimed / (1024 * 1024):.1f} MB")
+
+        if policies is None:
+            reclaimed = thumbnails.evict_thumbnails()
+            summary["thumbnails"] = {"files": None, "rows": 0, "bytes": reclaimed}
+            metrics.inc("storage_bytes_reclaimed_total", reclaimed, policy="thumbnails")
+    return summary
+
+def start_scheduler(interval=RETENTION_INTERVAL):
+    """Run every retention policy in a background thread every interval seconds"""
+    global _scheduler
+    if interval <= 0 or _scheduler is not None:
+        return
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                run_retention()
+            except Exception as e:
+                print(f"[ERROR] Retention run failed: {e}")
+
+    _scheduler = threading.Thread(target=loop, name="retention", daemon=True)
+    _scheduler.start()
+    print(f"[INFO] Storage retention runs every {interval}s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete expired classroom images, sessions, reports and samples")
+    parser.add_argument("--policy", action="append", choices=sorted(POLICIES), help="Policy to run (repeatable; default: all)")
+    args = parser.parse_args()
+
+    summary = run_retention(args.policy)
+    total = sum(entry["bytes"] for entry in summary.values())
+    print(f"[SUCCESS] Reclaimed {total / (1024 * 1024):.1f} MB")
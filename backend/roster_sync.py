@@ -0,0 +1,288 @@
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import socket
+import hashlib
+import zipfile
+import argparse
+import threading
+from datetime import datetime
+
+import numpy as np
+
+# fcntl is POSIX only; without it manifest updates are not locked across processes
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# ==============================
+# CONFIGURATION
+# ==============================
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # project root
+# Point every app server at the same directory (e.g. an NFS mount) to share rosters
+SNAPSHOT_DIR = os.environ.get("ROSTER_SNAPSHOT_DIR", os.path.join(BASE_DIR, "roster_snapshots"))
+MANIFEST_FILE = "manifest.json"
+SNAPSHOTS_TO_KEEP = int(os.environ.get("ROSTER_SNAPSHOTS_TO_KEEP", 5)) # Older versions per class are pruned
+SYNC_INTERVAL = float(os.environ.get("ROSTER_SYNC_INTERVAL", 0)) # Seconds between manifest checks; 0 disables
+ROSTER_SUFFIX = "_roster.npz"
+SHA256_PATTERN = re.compile(r"[0-9a-f]{64}")
+NODE_NAME = os.environ.get("NODE_NAME", socket.gethostname())
+
+# ==========================================
+# Content-addressed snapshot store
+# ==========================================
+# A snapshot is a class roster .npz stored as <class>/<sha256>.npz. The manifest maps
+# each class to its current snapshot and a version number that increases with every
+# publish. Nodes compare the manifest with their local rosters and copy in whatever
+# changed; load_roster notices the new file and reloads it on the next request.
+def manifest_path():
+    return os.path.join(SNAPSHOT_DIR, MANIFEST_FILE)
+
+def snapshot_path(class_name, digest):
+    return os.path.join(SNAPSHOT_DIR, class_name, f"{digest}.npz")
+
+def local_roster_path(output_dir, class_name):
+    return os.path.join(output_dir, f"{class_name}{ROSTER_SUFFIX}")
+
+def file_sha256(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def load_manifest():
+    try:
+        with open(manifest_path(), "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+class _ManifestLock:
+    """Exclusive lock for read-modify-write of the manifest across processes and nodes"""
+    def __enter__(self):
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        self._file = open(os.path.join(SNAPSHOT_DIR, ".lock"), "w")
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+
+def _save_manifest(manifest):
+    partial_path = f"{manifest_path()}.{os.getpid()}.part"
+    with open(partial_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(partial_path, manifest_path())
+
+def _copy_atomic(source, destination):
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    partial_path = f"{destination}.{os.getpid()}.part"
+    shutil.copyfile(source, partial_path)
+    os.replace(partial_path, destination)
+
+def _roster_model_version(path):
+    with np.load(path) as data:
+        return str(data["model_version"]) if "model_version" in data.files else None
+
+def _prune(class_name, keep):
+    class_dir = os.path.join(SNAPSHOT_DIR, class_name)
+    snapshots = sorted((os.path.join(class_dir, file) for file in os.listdir(class_dir) if file.endswith(".npz")),
+                       key=os.path.getmtime, reverse=True)
+    for path in snapshots[SNAPSHOTS_TO_KEEP:]:
+        if os.path.basename(path)[:-len(".npz")] not in keep:
+            os.remove(path)
+
+def publish(class_name, roster_file):
+    """
+    Store a class roster as a new snapshot and point the manifest at it.
+    Publishing the roster the manifest already points at is a no-op.
+    :return: Manifest entry for the class
+    """
+    digest = file_sha256(roster_file)
+    with _ManifestLock():
+        manifest = load_manifest()
+        entry = manifest.get(class_name)
+        if entry is not None and entry["sha256"] == digest:
+            return entry
+
+        destination = snapshot_path(class_name, digest)
+        if not os.path.exists(destination):
+            _copy_atomic(roster_file, destination)
+        else:
+            os.utime(destination)  # Re-published older snapshot counts as newest for pruning
+        entry = {
+            "version": (entry["version"] + 1) if entry else 1,
+            "sha256": digest,
+            "model_version": _roster_model_version(roster_file),
+            "published_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "published_by": NODE_NAME,
+        }
+        manifest[class_name] = entry
+        _save_manifest(manifest)
+        _prune(class_name, {digest})
+
+    print(f"[INFO] Published roster snapshot for {class_name} (version {entry['version']})")
+    return entry
+
+def _checked_digest(class_name, entry):
+    """
+    Snapshot hash of a manifest entry. Both values end up in file paths, so anything
+    other than a plain class name and a hex SHA-256 is rejected.
+    :raises ValueError: Invalid class name or hash
+    """
+    if os.path.basename(class_name) != class_name or class_name.startswith("."):
+        raise ValueError(f"Invalid class name: {class_name}")
+    digest = entry.get("sha256") if isinstance(entry, dict) else None
+    if not isinstance(digest, str) or not SHA256_PATTERN.fullmatch(digest):
+        raise ValueError(f"Invalid snapshot hash for {class_name}")
+    return digest
+
+def pull(output_dir, model_version=None, class_names=None):
+    """
+    Copy every snapshot that differs from the local roster into output_dir.
+    :param model_version: Skip snapshots built with a different model/detector/backend
+    :param class_names: Limit to these classes (default: every class in the manifest)
+    :return: List of classes updated
+    """
+    updated = []
+    for class_name, entry in sorted(load_manifest().items()):
+        if class_names is not None and class_name not in class_names:
+            continue
+        try:
+            _checked_digest(class_name, entry)
+        except ValueError as e:
+            print(f"[ERROR] Skipping manifest entry: {e}")
+            continue
+        local_path = local_roster_path(output_dir, class_name)
+        if os.path.exists(local_path) and file_sha256(local_path) == entry["sha256"]:
+            continue
+        if model_version is not None and entry.get("model_version") != model_version:
+            print(f"[WARNING] Roster snapshot for {class_name} was built with {entry.get('model_version')}; "
+                  f"this node uses {model_version}")
+            continue
+
+        source = snapshot_path(class_name, entry["sha256"])
+        if not os.path.exists(source) or file_sha256(source) != entry["sha256"]:
+            print(f"[ERROR] Roster snapshot for {class_name} is missing or corrupt: {source}")
+            continue
+        _copy_atomic(source, local_path)
+        updated.append(class_name)
+        print(f"[INFO] Loaded roster snapshot for {class_name} (version {entry['version']})")
+    return updated
+
+# ==========================================
+# Export / import for nodes without shared storage
+# ==========================================
+def export_snapshots(archive, class_names=None):
+    """
+    Write the current snapshots (and their manifest entries) to a ZIP archive.
+    :param archive: Path or writable binary file object
+    :return: Number of classes exported
+    """
+    manifest = load_manifest()
+    selected = {name: entry for name, entry in manifest.items() if class_names is None or name in class_names}
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_STORED) as out:  # .npz is already compressed
+        out.writestr(MANIFEST_FILE, json.dumps(selected, indent=2, sort_keys=True))
+        for class_name, entry in selected.items():
+            out.write(snapshot_path(class_name, entry["sha256"]), f"{class_name}/{entry['sha256']}.npz")
+    return len(selected)
+
+def import_snapshots(archive):
+    """
+    Publish every snapshot in an exported archive after checking its hash.
+    :param archive: Path or readable binary file object
+    :return: List of classes imported
+    :raises ValueError: Archive has no manifest, or a snapshot is missing, invalid or does not match its hash
+    """
+    imported = []
+    with zipfile.ZipFile(archive) as source:
+        try:
+            entries = json.loads(source.read(MANIFEST_FILE))
+        except KeyError:
+            raise ValueError("Archive has no manifest.json")
+
+        staging_dir = os.path.join(SNAPSHOT_DIR, ".import")
+        os.makedirs(staging_dir, exist_ok=True)
+        for class_name, entry in sorted(entries.items()):
+            digest = _checked_digest(class_name, entry)
+            staged = os.path.join(staging_dir, f"{digest}.npz")
+            try:
+                with source.open(f"{class_name}/{digest}.npz") as f, open(staged, "wb") as out:
+                    shutil.copyfileobj(f, out)
+            except KeyError:
+                raise ValueError(f"Archive has no snapshot for {class_name}")
+            try:
+                if file_sha256(staged) != digest:
+                    raise ValueError(f"Snapshot for {class_name} does not match its hash")
+                publish(class_name, staged)
+            finally:
+                os.remove(staged)
+            imported.append(class_name)
+    return imported
+
+# ==========================================
+# Hot reload
+# ==========================================
+_watcher = None
+
+def start_watcher(output_dir_getter, model_version_getter, interval=SYNC_INTERVAL):
+    """
+    Poll the manifest every interval seconds and pull changed snapshots.
+    The getters are called on each pull, so callers can swap directories at runtime.
+    """
+    global _watcher
+    if interval <= 0 or _watcher is not None:
+        return
+
+    def watch():
+        last_seen = None
+        while True:
+            try:
+                stat = os.stat(manifest_path())
+                signature = (stat.st_mtime_ns, stat.st_size)
+                if signature != last_seen:
+                    pull(output_dir_getter(), model_version_getter())
+                    last_seen = signature
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"[ERROR] Roster sync failed: {e}")
+            time.sleep(interval)
+
+    _watcher = threading.Thread(target=watch, name="roster-sync", daemon=True)
+    _watcher.start()
+    print(f"[INFO] Watching {manifest_path()} for roster updates every {interval}s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export, import and pull versioned roster snapshots")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Write snapshots to a ZIP archive")
+    export_parser.add_argument("archive")
+    export_parser.add_argument("--classes", default="", help="Comma-separated classes (default: all)")
+    import_parser = commands.add_parser("import", help="Publish the snapshots in a ZIP archive")
+    import_parser.add_argument("archive")
+    pull_parser = commands.add_parser("pull", help="Copy changed snapshots into the local roster folder")
+    pull_parser.add_argument("--output-dir", default=os.path.join(BASE_DIR, "roster_embeddings"))
+    commands.add_parser("show", help="Print the manifest")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        count = export_snapshots(args.archive, [name for name in args.classes.split(",") if name] or None)
+        print(f"[SUCCESS] Exported {count} class rosters to {args.archive}")
+    elif args.command == "import":
+        classes = import_snapshots(args.archive)
+        print(f"[SUCCESS] Imported rosters for: {', '.join(classes) or 'nothing'}")
+    elif args.command == "pull":
+        updated = pull(args.output_dir)
+        print(f"[SUCCESS] Updated rosters: {', '.join(updated) or 'none'}")
+    else:
+        json.dump(load_manifest(), sys.stdout, indent=2, sort_keys=True)
+        print()
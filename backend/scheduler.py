@@ -0,0 +1,114 @@
+import os
+import math
+import time
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+import torch
+
+from backend import metrics
+
+# ==============================
+# CONFIGURATION
+# ==============================
+CPU_COUNT = os.cpu_count() or 1
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", max(1, min(4, CPU_COUNT // 2)))) # Jobs run at once
+# torch's intra-op thread count is process-wide, so every job gets the same share of the cores
+THREADS_PER_JOB = int(os.environ.get("INFERENCE_THREADS_PER_JOB", max(1, CPU_COUNT // INFERENCE_WORKERS)))
+MAX_QUEUED = int(os.environ.get("INFERENCE_MAX_QUEUED", 4 * INFERENCE_WORKERS)) # Waiting jobs, all classes
+MAX_QUEUED_PER_CLASS = int(os.environ.get("INFERENCE_MAX_QUEUED_PER_CLASS", 2)) # Waiting jobs per class
+INITIAL_JOB_SECONDS = 5.0 # Duration estimate for Retry-After until real jobs have been timed
+
+class SchedulerBusy(Exception):
+    """Raised when a job cannot be admitted; retry_after is a suggested wait in seconds"""
+    def __init__(self, retry_after, reason):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+# ==========================================
+# Fair admission-controlled job queue
+# ==========================================
+# Recognition jobs (detection + embedding of classroom photos) run on a fixed set of
+# worker threads instead of on request threads. Each class has its own queue and the
+# workers take from the classes in turn, so one class submitting many photos cannot
+# starve the others. When the queues are full, submit raises SchedulerBusy and the
+# request gets 429 with Retry-After instead of piling up behind the model.
+_condition = threading.Condition()
+_queues = OrderedDict() # class name -> deque of (future, fn, args, kwargs, queued at)
+_queued = 0
+_running = 0
+_average_seconds = INITIAL_JOB_SECONDS
+_workers = []
+
+def _start_workers():
+    torch.set_num_threads(THREADS_PER_JOB)
+    for i in range(INFERENCE_WORKERS):
+        worker = threading.Thread(target=_worker_loop, name=f"inference-{i}", daemon=True)
+        worker.start()
+        _workers.append(worker)
+    print(f"[INFO] Inference scheduler: {INFERENCE_WORKERS} workers x {THREADS_PER_JOB} torch threads")
+
+def _next_job():
+    """Pop the oldest job of the class at the front, then move that class to the back"""
+    global _queued
+    class_name, queue = next(iter(_queues.items()))
+    job = queue.popleft()
+    del _queues[class_name]
+    if queue:
+        _queues[class_name] = queue
+    _queued -= 1
+    return class_name, job
+
+def _worker_loop():
+    global _running, _average_seconds
+    while True:
+        with _condition:
+            while not _queues:
+                _condition.wait()
+            class_name, (future, fn, args, kwargs, queued_at) = _next_job()
+            _running += 1
+
+        metrics.observe("attendance_queue_wait_seconds", time.perf_counter() - queued_at, class_name=class_name)
+        start = time.perf_counter()
+        if future.set_running_or_notify_cancel():
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+        elapsed = time.perf_counter() - start
+
+        with _condition:
+            _running -= 1
+            _average_seconds = 0.8 * _average_seconds + 0.2 * elapsed
+
+def _estimated_wait():
+    """Seconds until a newly queued job would likely start (call with _condition held)"""
+    return max(1, math.ceil(_average_seconds * (_queued + _running) / INFERENCE_WORKERS))
+
+def submit(class_name, fn, *args, **kwargs):
+    """
+    Queue a recognition job for a class.
+    :return: Future with the job's result
+    :raises SchedulerBusy: All queues, or this class's queue, are full
+    """
+    global _queued
+    with _condition:
+        if not _workers:
+            _start_workers()
+        queue = _queues.get(class_name)
+        if _queued >= MAX_QUEUED or (queue is not None and len(queue) >= MAX_QUEUED_PER_CLASS):
+            metrics.inc("attendance_requests_rejected_total", class_name=class_name)
+            raise SchedulerBusy(_estimated_wait(), "Recognition is busy; please retry shortly")
+
+        future = Future()
+        if queue is None:
+            queue = _queues[class_name] = deque()
+        queue.append((future, fn, args, kwargs, time.perf_counter()))
+        _queued += 1
+        _condition.notify()
+    return future
+
+def run(class_name, fn, *args, **kwargs):
+    """Queue a job and wait for its result on the calling (request) thread"""
+    return submit(class_name, fn, *args, **kwargs).result()
@@ -0,0 +1,211 @@
+import os
+import json
+import uuid
+import sqlite3
+import threading
+import numpy as np
+
+from backend import main
+
+# ==============================
+# CONFIGURATION
+# ==============================
+SESSION_IMG_DIR = os.path.join(main.CLASSROOM_IMG_DIR, "sessions") # <session id>/<image>
+
+# ==========================================
+# Incremental attendance sessions
+# ==========================================
+# A session collects classroom photos one at a time. Each photo is decoded, detected
+# and embedded once when it is added; its boxes and embeddings are kept in SQLite, so
+# later photos only pay for themselves. The decision is then re-derived from the stored
+# embeddings (clustering and matching only, no model calls).
+_locks = {}
+_locks_guard = threading.Lock()
+
+def _session_lock(session_id):
+    with _locks_guard:
+        return _locks.setdefault(session_id, threading.Lock())
+
+def forget_session(session_id):
+    """Drop the lock of a session that was closed or deleted"""
+    with _locks_guard:
+        _locks.pop(session_id, None)
+
+def get_connection():
+    conn = sqlite3.connect(main.DB_PATH, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS attendance_sessions (
+            session_id VARCHAR(32) PRIMARY KEY,
+            class_name VARCHAR(50) NOT NULL,
+            created_by VARCHAR(50),
+            status VARCHAR(20) NOT NULL DEFAULT 'open',
+            variant TEXT NOT NULL,
+            image_count INTEGER NOT NULL DEFAULT 0,
+            decision TEXT,
+            report_file TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS session_images (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id VARCHAR(32) NOT NULL,
+            image_file TEXT NOT NULL,
+            face_count INTEGER NOT NULL DEFAULT 0,
+            added_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (session_id, image_file)
+        );
+        CREATE TABLE IF NOT EXISTS session_faces (
+            image_id INTEGER NOT NULL,
+            face_index INTEGER NOT NULL,
+            x1 INTEGER, y1 INTEGER, x2 INTEGER, y2 INTEGER,
+            embedding BLOB NOT NULL,
+            PRIMARY KEY (image_id, face_index)
+        );
+    """)
+    return conn
+
+def create_session(class_name, created_by=None):
+    """
+    Open a new attendance session for a class.
+    :return: Session ID
+    """
+    session_id = uuid.uuid4().hex
+    conn = get_connection()
+    with conn:
+        conn.execute("INSERT INTO attendance_sessions (session_id, class_name, created_by, variant) VALUES (?, ?, ?, ?)",
+                     (session_id, class_name, created_by, main.embedding_variant()))
+    conn.close()
+    os.makedirs(os.path.join(SESSION_IMG_DIR, session_id), exist_ok=True)
+    return session_id
+
+def get_session(session_id):
+    """Session row with its decision decoded, or None if it does not exist"""
+    conn = get_connection()
+    row = conn.execute("SELECT * FROM attendance_sessions WHERE session_id = ?", (session_id,)).fetchone()
+    conn.close()
+    if row is None:
+        return None
+    session = dict(row)
+    session["decision"] = json.loads(session["decision"]) if session["decision"] else {}
+    return session
+
+def get_open_session(session_id):
+    """Session row, raising KeyError if it does not exist and ValueError if it is no longer open"""
+    session = get_session(session_id)
+    if session is None:
+        raise KeyError(session_id)
+    if session["status"] != "open":
+        raise ValueError(f"Session is {session['status']}")
+    return session
+
+def image_path(session_id, filename):
+    return os.path.join(SESSION_IMG_DIR, session_id, filename)
+
+def _relative(session_id, filename):
+    # Image files relative to CLASSROOM_IMG_DIR, as main.decide_from_faces expects
+    return os.path.relpath(image_path(session_id, filename), main.CLASSROOM_IMG_DIR)
+
+def _store_image(conn, session_id, filename, face_boxes, face_embeddings):
+    row = conn.execute("SELECT id FROM session_images WHERE session_id = ? AND image_file = ?",
+                       (session_id, filename)).fetchone()
+    if row is None:
+        image_id = conn.execute("INSERT INTO session_images (session_id, image_file, face_count) VALUES (?, ?, ?)",
+                                (session_id, filename, len(face_boxes))).lastrowid
+    else:
+        image_id = row[0]
+        conn.execute("UPDATE session_images SET face_count = ? WHERE id = ?", (len(face_boxes), image_id))
+        conn.execute("DELETE FROM session_faces WHERE image_id = ?", (image_id,))
+    conn.executemany("""
+        INSERT INTO session_faces (image_id, face_index, x1, y1, x2, y2, embedding) VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, [(image_id, i, *box, np.asarray(embedding, dtype=np.float32).tobytes())
+          for i, (box, embedding) in enumerate(zip(face_boxes, face_embeddings))])
+
+def _load_faces(conn, session_id):
+    """Stored (image file, face boxes, embeddings) for every image of a session"""
+    analyzed = []
+    for image_id, filename in conn.execute(
+            "SELECT id, image_file FROM session_images WHERE session_id = ? ORDER BY id", (session_id,)).fetchall():
+        rows = conn.execute("SELECT x1, y1, x2, y2, embedding FROM session_faces WHERE image_id = ? ORDER BY face_index",
+                            (image_id,)).fetchall()
+        boxes = [[row[0], row[1], row[2], row[3]] for row in rows]
+        embeddings = np.array([np.frombuffer(row[4], dtype=np.float32) for row in rows]).reshape(len(rows), -1)
+        analyzed.append((_relative(session_id, filename), boxes, embeddings))
+    return analyzed
+
+def _reanalyze(conn, session_id):
+    """Re-embed every stored image after the model, detector or backend changed"""
+    print(f"[INFO] Session {session_id} was embedded with another model; re-processing its images")
+    for (filename,) in conn.execute("SELECT image_file FROM session_images WHERE session_id = ?",
+                                    (session_id,)).fetchall():
+        _, face_boxes, face_embeddings = main.analyze_image(image_path(session_id, filename))
+        _store_image(conn, session_id, filename, face_boxes, face_embeddings)
+    conn.execute("UPDATE attendance_sessions SET variant = ? WHERE session_id = ?",
+                 (main.embedding_variant(), session_id))
+
+def add_image(session_id, filename):
+    """
+    Process one photo saved under image_path(session_id, filename) and update the
+    session decision. Photos added earlier are not decoded or embedded again.
+    :return: Updated session dictionary
+    :raises KeyError: Unknown session
+    :raises ValueError: Session is already closed
+    """
+    get_open_session(session_id)
+
+    # The expensive part runs outside the lock, so photos of one session can overlap
+    img, face_boxes, face_embeddings = main.analyze_image(image_path(session_id, filename))
+    if img is None:
+        raise ValueError(f"Could not read image {filename}")
+    print(f"[INFO] Session {session_id}: {len(face_boxes)} faces in {filename}")
+
+    with _session_lock(session_id):
+        # Re-read under the lock: the session may have been closed or re-embedded meanwhile
+        session = get_open_session(session_id)
+        conn = get_connection()
+        with conn:
+            if session["variant"] != main.embedding_variant():
+                _reanalyze(conn, session_id)
+            _store_image(conn, session_id, filename, face_boxes, face_embeddings)
+        conn.close()
+        return _update_decision(session_id, annotate={_relative(session_id, filename)})
+
+def _update_decision(session_id, annotate=None):
+    session = get_session(session_id)
+    roster = main.load_roster(session["class_name"])
+    conn = get_connection()
+    analyzed = _load_faces(conn, session_id)
+    student_detections = main.decide_from_faces(analyzed, roster, annotate=annotate)
+    _, summary = main.attendance_decision(student_detections, len(analyzed))
+    with conn:
+        conn.execute("""
+            UPDATE attendance_sessions SET image_count = ?, decision = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE session_id = ?
+        """, (len(analyzed), json.dumps(summary), session_id))
+    conn.close()
+    return get_session(session_id)
+
+def close_session(session_id):
+    """
+    Close a session and write its attendance report.
+    :return: (report results, report filename)
+    :raises KeyError: Unknown session
+    :raises ValueError: Session is already closed
+    """
+    with _session_lock(session_id):
+        # Status and decision are read under the lock, after any photo still being added
+        session = get_open_session(session_id)
+        decision = session["decision"]
+        present = {name for name, entry in decision.items() if entry["present"]}
+        confidences = {name: entry["confidence"] for name, entry in decision.items()}
+        results, report_filename = main.generate_excel_report(present, session["class_name"], background=True,
+                                                              confidences=confidences)
+        conn = get_connection()
+        with conn:
+            conn.execute("""
+                UPDATE attendance_sessions SET status = 'closed', report_file = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE session_id = ?
+            """, (os.path.join(session["class_name"], report_filename), session_id))
+        conn.close()
+    forget_session(session_id)
+    return results, report_filename
@@ -0,0 +1,148 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from PIL import Image, ImageOps
+
+# ==============================
+# CONFIGURATION
+# ==============================
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # project root
+DATASET_DIR = os.path.join(BASE_DIR, "database", "photo") # Student images
+THUMBNAIL_DIR = os.path.join(BASE_DIR, "thumbnail_cache") # Content-addressed thumbnails
+THUMBNAIL_SIZES = (64, 256, 512) # Longest edge in pixels
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_CACHE_MAX_BYTES = int(os.environ.get("THUMBNAIL_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+EVICTION_CHECK_INTERVAL = 200 # Check the cache size every this many new thumbnails
+DIGEST_CACHE_SIZE = 4096 # Source files whose content digest is remembered (least recently used dropped)
+
+os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+
+_digest_cache = OrderedDict() # path -> (size, mtime, digest)
+_lock = threading.Lock()
+_generated_since_eviction = 0
+
+def resolve_sample_path(image_path, class_name, student_name, image_filename):
+    """Stored image_path if it still exists, else the conventional photo/<class>/<student>/<file>"""
+    if image_path and os.path.exists(image_path):
+        return image_path
+    fallback = os.path.join(DATASET_DIR, class_name or "", student_name or "", image_filename or "")
+    return fallback if os.path.isfile(fallback) else None
+
+def content_digest(source_path):
+    """
+    SHA-256 of a source image, memoised per path on (size, mtime) so files are hashed once.
+    Only the DIGEST_CACHE_SIZE most recently used paths are remembered.
+    """
+    stat = os.stat(source_path)
+    with _lock:
+        entry = _digest_cache.get(source_path)
+        if entry is not None and entry[:2] == (stat.st_size, stat.st_mtime_ns):
+            _digest_cache.move_to_end(source_path)
+            return entry[2]
+
+    sha = hashlib.sha256()
+    with open(source_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+    with _lock:
+        _digest_cache[source_path] = (stat.st_size, stat.st_mtime_ns, digest)
+        _digest_cache.move_to_end(source_path)
+        while len(_digest_cache) > DIGEST_CACHE_SIZE:
+            _digest_cache.popitem(last=False)
+    return digest
+
+def source_version(source_path):
+    """Short token that changes whenever a source image is replaced, for cache-busting URLs"""
+    try:
+        stat = os.stat(source_path)
+    except (TypeError, FileNotFoundError):
+        return "0"
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+def thumbnail_relpath(digest, size):
+    return os.path.join(digest[:2], f"{digest}_{size}.jpg")
+
+# ==========================================
+# Generation
+# ==========================================
+def _render(source_path, targets):
+    """Decode the source once and write every requested size, largest first"""
+    with Image.open(source_path) as img:
+        # JPEG draft mode lets the decoder skip most of the full-resolution work
+        img.draft("RGB", (max(targets), max(targets)))
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        for size, path in sorted(targets.items(), reverse=True):
+            img.thumbnail((size, size))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            partial = f"{path}.part"
+            img.save(partial, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+            os.replace(partial, path)
+
+def get_thumbnail(source_path, size):
+    """
+    Return the cached thumbnail for a source image, generating it on first request.
+    :return: Path relative to THUMBNAIL_DIR
+    """
+    global _generated_since_eviction
+    if size not in THUMBNAIL_SIZES:
+        raise ValueError(f"Unsupported thumbnail size: {size}")
+
+    relpath = thumbnail_relpath(content_digest(source_path), size)
+    full_path = os.path.join(THUMBNAIL_DIR, relpath)
+    if os.path.exists(full_path):
+        os.utime(full_path)  # Mark as recently used for eviction
+        return relpath
+
+    _render(source_path, {size: full_path})
+    with _lock:
+        _generated_since_eviction += 1
+        check = _generated_since_eviction >= EVICTION_CHECK_INTERVAL
+        if check:
+            _generated_since_eviction = 0
+    if check:
+        evict_thumbnails()
+    return relpath
+
+def generate_thumbnails(source_path):
+    """Pre-generate every thumbnail size for a newly uploaded image"""
+    digest = content_digest(source_path)
+    targets = {size: os.path.join(THUMBNAIL_DIR, thumbnail_relpath(digest, size)) for size in THUMBNAIL_SIZES}
+    missing = {size: path for size, path in targets.items() if not os.path.exists(path)}
+    if missing:
+        _render(source_path, missing)
+
+# ==========================================
+# Eviction
+# ==========================================
+def evict_thumbnails(max_bytes=THUMBNAIL_CACHE_MAX_BYTES):
+    """
+    Remove least recently used thumbnails until the cache fits in max_bytes.
+    :return: Bytes reclaimed
+    """
+    entries = []
+    total = 0
+    for root, dirs, files in os.walk(THUMBNAIL_DIR):
+        for file in files:
+            path = os.path.join(root, file)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+    reclaimed = 0
+    for _, file_size, path in sorted(entries):
+        if total - reclaimed <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            reclaimed += file_size
+        except FileNotFoundError:
+            pass
+
+    if reclaimed:
+        print(f"[INFO] Evicted {reclaimed} bytes of thumbnails")
+    return reclaimed
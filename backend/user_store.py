@@ -0,0 +1,158 @@
+import os
+import json
+import sqlite3
+from datetime import datetime
+from werkzeug.security import generate_password_hash
+
+from backend.attendance_store import DB_PATH
+
+# ==============================
+# User accounts in SQLite (replaces database/users/users.json)
+# ==============================
+DEFAULT_USERS = {
+    "admin1": {"password": "adminpass", "role": "admin"},
+    "teacher1": {"password": "teachpass", "role": "teacher", "class": "class101"},
+}
+
+def get_connection():
+    # A busy timeout lets concurrent logins from several workers queue instead of failing
+    # The table is created by init_db at startup, so a login runs no DDL
+    conn = sqlite3.connect(DB_PATH, timeout=10)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def ensure_schema(conn):
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS users (
+            userid VARCHAR(50) PRIMARY KEY,
+            password_hash TEXT NOT NULL,
+            role VARCHAR(20) NOT NULL,
+            class_name VARCHAR(50),
+            last_login DATETIME,
+            login_count INTEGER NOT NULL DEFAULT 0,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_users_role ON users (role);
+    """)
+
+def _to_dict(row):
+    """Row -> the dictionary shape the routes used with users.json"""
+    if row is None:
+        return None
+    user = {
+        "userid": row["userid"],
+        "password": row["password_hash"],
+        "role": row["role"],
+        "last_login": row["last_login"] or "",
+        "login_count": row["login_count"],
+    }
+    if row["class_name"]:
+        user["class"] = row["class_name"]
+    return user
+
+# ==========================================
+# Migration
+# ==========================================
+def migrate_from_json(users_file):
+    """
+    Import users.json into the users table the first time the table is empty.
+    Entries without a password are skipped. Falls back to the default admin/teacher
+    accounts when there is nothing to import.
+    :return: Number of users imported
+    """
+    conn = get_connection()
+    ensure_schema(conn)
+    # WAL lets logins in other workers read while one of them writes
+    conn.execute("PRAGMA journal_mode=WAL")
+    if conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]:
+        conn.close()
+        return 0
+
+    users = {}
+    if os.path.exists(users_file):
+        try:
+            with open(users_file, "r") as f:
+                data = f.read().strip()
+            users = json.loads(data) if data else {}
+        except (OSError, ValueError) as e:
+            print(f"[WARNING] Could not read {users_file}: {e}")
+
+    if not isinstance(users, dict):
+        print(f"[WARNING] {users_file} does not map user IDs to accounts; ignoring it")
+        users = {}
+
+    rows = []
+    for userid, data in users.items():
+        # One malformed entry must not stop the app from starting
+        if not isinstance(data, dict) or not data.get("password"):
+            print(f"[WARNING] Skipping user {userid} in {users_file}: no password")
+            continue
+        rows.append((userid, data["password"], data.get("role", "teacher"), data.get("class"),
+                     data.get("last_login") or None, data.get("login_count", 0)))
+    if not rows:
+        rows = [(userid, generate_password_hash(data["password"]), data["role"], data.get("class"), None, 0)
+                for userid, data in DEFAULT_USERS.items()]
+
+    with conn:
+        conn.executemany("""
+            INSERT OR IGNORE INTO users (userid, password_hash, role, class_name, last_login, login_count)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, rows)
+    conn.close()
+    print(f"[INFO] Imported {len(rows)} users into the database")
+    return len(rows)
+
+# ==========================================
+# Queries and updates
+# ==========================================
+def get_user(userid):
+    conn = get_connection()
+    row = conn.execute("SELECT * FROM users WHERE userid = ?", (userid,)).fetchone()
+    conn.close()
+    return _to_dict(row)
+
+def list_users(order_by_login=False):
+    """
+    List all users.
+    :param order_by_login: Most recent login first (never-logged-in users last) instead of by user ID
+    :return: User dictionaries, each with seconds_since_login computed by SQLite (None if never)
+    """
+    order = "last_login IS NULL, last_login DESC, userid" if order_by_login else "userid"
+    conn = get_connection()
+    rows = conn.execute(f"""
+        SELECT *, CAST(ROUND((julianday('now', 'localtime') - julianday(last_login)) * 86400) AS INTEGER)
+               AS seconds_since_login
+        FROM users ORDER BY {order}
+    """).fetchall()
+    conn.close()
+    return [dict(_to_dict(row), seconds_since_login=row["seconds_since_login"]) for row in rows]
+
+def record_login(userid, login_time=None):
+    """Update last_login and login_count for one user with a single UPDATE"""
+    login_time = (login_time or datetime.now()).strftime('%Y-%m-%d %H:%M:%S')
+    conn = get_connection()
+    with conn:
+        conn.execute("""
+            UPDATE users SET last_login = ?, login_count = login_count + 1
+            WHERE userid = ?
+        """, (login_time, userid))
+    conn.close()
+    return login_time
+
+def add_user(userid, password_hash, role, class_name=None):
+    """
+    Create a user account.
+    :return: False if the user ID is already taken
+    """
+    conn = get_connection()
+    try:
+        with conn:
+            conn.execute("""
+                INSERT INTO users (userid, password_hash, role, class_name)
+                VALUES (?, ?, ?, ?)
+            """, (userid, password_hash, role, class_name))
+        return True
+    except sqlite3.IntegrityError:
+        return False
+    finally:
+        conn.close()
@@ -1,6 +1,9 @@
 import sqlite3
 import os
 
+from backend.attendance_store import ensure_schema
+from backend import user_store, aggregates
+
 DB_PATH = 'attendance.db'
 PHOTO_ROOT = os.path.join('database', 'photo')
 
@@ -25,9 +28,20 @@ def initialize_database():
         approval_date DATETIME
     );
     """)
+    # One row per stored file: drop duplicates left by re-uploads, then enforce it
+    cursor.execute("""
+    DELETE FROM sample_images
+    WHERE image_path IS NOT NULL AND id NOT IN (
+        SELECT MAX(id) FROM sample_images WHERE image_path IS NOT NULL GROUP BY image_path
+    )
+    """)
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_sample_image_path ON sample_images (image_path)")
+    ensure_schema(conn)
+    user_store.ensure_schema(conn)
     conn.commit()
+    aggregates.install_aggregates(conn)
     conn.close()
-    print("sample_images table created!")
+    print("sample_images, attendance, users and summary tables created!")
 
 def populate_sample_images():
     conn = sqlite3.connect(DB_PATH)
@@ -4,8 +4,23 @@ import cv2
 import numpy as np
 import sqlite3
 import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
+DB_PATH = 'attendance.db'
+PHOTO_ROOT = os.path.join('database', 'photo')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+_face_cascade = None
+
+def get_face_cascade():
+    """Load the Haar face cascade once per process"""
+    global _face_cascade
+    if _face_cascade is None:
+        _face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    return _face_cascade
+
 def calculate_image_quality(image_path):
     """Calculate image quality score based on various factors"""
     try:
@@ -28,8 +43,7 @@ def calculate_image_quality(image_path):
         contrast_score = min(contrast / 64, 1.0)
 
         # Face detection
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        faces = face_cascade.detectMultiScale(gray, 1.1, 4)
+        faces = get_face_cascade().detectMultiScale(gray, 1.1, 4)
         face_score = 1.0 if len(faces) == 1 else 0.5
 
         # Composite score
@@ -68,6 +82,56 @@ def process_uploaded_image(file_path, student_id, student_name, class_name):
         print(f"Error processing image: {e}")
         return False
 
+def register_sample_entries(entries, status='approved', approved_by=None, progress=None):
+    """
+    Score a batch of saved sample images and insert them in a single transaction.
+    A file that is already registered (same path, e.g. a re-upload under the same name)
+    has its row updated instead of gaining a duplicate.
+    :param entries: List of (file_path, student_name, class_name) for images already under database/photo
+    :param status: Initial review status (admin uploads are approved straight away)
+    :param approved_by: User ID recorded as the approver for approved uploads
+    :param progress: Optional callback called with the number of images scored so far
+    :return: Number of rows inserted or updated
+    """
+    approval_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S') if status == 'approved' else None
+    rows = []
+    for file_path, student_name, class_name in entries:
+        rows.append((student_name, os.path.basename(file_path), os.path.abspath(file_path),
+                     calculate_image_quality(file_path), os.path.getsize(file_path), class_name, status,
+                     approved_by if approval_date else None, approval_date))
+        if progress is not None and len(rows) % 50 == 0:
+            progress(len(rows))
+    if not rows:
+        return 0
+
+    # Update-then-insert rather than INSERT ... ON CONFLICT: an upsert's conflict clause
+    # overrides the INSERT OR IGNORE inside the summary-table triggers (see aggregates)
+    conn = sqlite3.connect(DB_PATH, timeout=10)
+    with conn:
+        for row in rows:
+            student_name, image_filename, image_path = row[:3]
+            updated = conn.execute("""
+                UPDATE sample_images SET
+                    student_name = ?, image_filename = ?, quality_score = ?, file_size = ?, class_name = ?,
+                    status = ?, approved_by = ?, approval_date = ?, rejection_reason = NULL,
+                    upload_date = CURRENT_DATE
+                WHERE image_path = ?
+            """, (student_name, image_filename) + row[3:] + (image_path,)).rowcount
+            if not updated:
+                conn.execute("""
+                    INSERT INTO sample_images
+                    (student_name, image_filename, image_path, quality_score, file_size,
+                     class_name, status, approved_by, approval_date)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, row)
+    conn.close()
+    return len(rows)
+
+def register_sample_images(file_paths, student_name, class_name, status='approved', approved_by=None):
+    """Register several images of one student (see register_sample_entries)"""
+    return register_sample_entries([(path, student_name, class_name) for path in file_paths],
+                                   status=status, approved_by=approved_by)
+
 def get_sample_statistics():
     """Get statistics about sample images"""
     conn = sqlite3.connect('attendance.db')
@@ -96,26 +160,92 @@ def get_sample_statistics():
         'average_quality': avg_quality or 0
     }
 
-def cleanup_rejected_images():
-    """Remove rejected images from filesystem"""
-    conn = sqlite3.connect('attendance.db')
-    cursor = conn.execute("""
-        SELECT image_path FROM sample_images 
-        WHERE status = 'rejected' AND upload_date < date('now', '-30 days')
-    """)
+def _score_image(item):
+    """Worker entry point for backfill_quality_scores: (row id, path) -> (score, size, row id)"""
+    row_id, image_path = item
+    file_size = os.path.getsize(image_path) if os.path.exists(image_path) else 0
+    return calculate_image_quality(image_path), file_size, row_id
+
+def _ensure_scored_at(conn):
+    """Add the scored_at column marking rows the backfill has already attempted"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(sample_images)")}
+    if "scored_at" not in columns:
+        conn.execute("ALTER TABLE sample_images ADD COLUMN scored_at DATETIME")
+        conn.commit()
 
-    for (image_path,) in cursor.fetchall():
-        try:
-            if os.path.exists(image_path):
-                os.remove(image_path)
-                print(f"Removed old rejected image: {image_path}")
-        except Exception as e:
-            print(f"Error removing {image_path}: {e}")
-
-    # Delete database records
-    conn.execute("""
-        DELETE FROM sample_images 
-        WHERE status = 'rejected' AND upload_date < date('now', '-30 days')
-    """)
-    conn.commit()
-    conn.close()
\ No newline at end of file
+def backfill_quality_scores(photo_root=PHOTO_ROOT, workers=None, batch_size=200, rescore=False):
+    """
+    Score every sample image under photo_root and write the results back.
+    Only rows that are still unscored (quality_score 0 or NULL, and never attempted) are
+    processed unless rescore is set. Each row is stamped with scored_at, so images that
+    are missing or cannot be decoded (score 0.0) are not decoded again on every resume,
+    and results are committed batch by batch, so an interrupted run simply picks up
+    where it stopped.
+    :param photo_root: Root of the class/student/image tree to walk
+    :param workers: Number of scoring processes (defaults to CPU count)
+    :param batch_size: Number of rows per UPDATE transaction
+    :param rescore: Re-score rows that already have a quality score
+    :return: Number of rows updated
+    """
+    conn = sqlite3.connect(DB_PATH)
+    _ensure_scored_at(conn)
+
+    query = "SELECT id, class_name, student_name, image_filename FROM sample_images"
+    if not rescore:
+        query += " WHERE scored_at IS NULL AND (quality_score IS NULL OR quality_score = 0)"
+    pending = {}
+    for row_id, class_name, student_name, image_filename in conn.execute(query):
+        pending.setdefault((class_name, student_name, image_filename), []).append(row_id)
+
+    work = []
+    for class_name in sorted(os.listdir(photo_root)):
+        class_dir = os.path.join(photo_root, class_name)
+        if not os.path.isdir(class_dir):
+            continue
+        for student_name in sorted(os.listdir(class_dir)):
+            student_dir = os.path.join(class_dir, student_name)
+            if not os.path.isdir(student_dir):
+                continue
+            for imgfile in sorted(os.listdir(student_dir)):
+                if not imgfile.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                for row_id in pending.get((class_name, student_name, imgfile), []):
+                    work.append((row_id, os.path.join(student_dir, imgfile)))
+
+    total = len(work)
+    if total == 0:
+        conn.close()
+        print("[INFO] No unscored sample images found.")
+        return 0
+
+    print(f"[INFO] Scoring {total} sample images...")
+    update_sql = "UPDATE sample_images SET quality_score = ?, file_size = ?, scored_at = CURRENT_TIMESTAMP WHERE id = ?"
+    updated = 0
+    batch = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for result in executor.map(_score_image, work, chunksize=16):
+            batch.append(result)
+            if len(batch) >= batch_size:
+                conn.executemany(update_sql, batch)
+                conn.commit()
+                updated += len(batch)
+                batch = []
+                print(f"[INFO] Scored {updated}/{total} images")
+
+    if batch:
+        conn.executemany(update_sql, batch)
+        conn.commit()
+        updated += len(batch)
+        print(f"[INFO] Scored {updated}/{total} images")
+
+    conn.close()
+    print(f"[SUCCESS] Quality scores backfilled for {updated} sample images.")
+    return updated
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill quality scores for sample images")
+    parser.add_argument("--workers", type=int, default=None, help="Number of scoring processes")
+    parser.add_argument("--batch-size", type=int, default=200, help="Rows per UPDATE transaction")
+    parser.add_argument("--rescore", action="store_true", help="Re-score images that already have a score")
+    args = parser.parse_args()
+    backfill_quality_scores(workers=args.workers, batch_size=args.batch_size, rescore=args.rescore)
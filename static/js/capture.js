@@ -0,0 +1,51 @@
+// static/js/capture.js
+// Webcam frames are downscaled in the browser and sent as binary JPEG files
+// (multipart) instead of base64 data URLs in form fields.
+
+// Draw the current video frame scaled so its longest edge is at most maxEdge
+function drawScaledFrame(video, canvas, maxEdge) {
+    const width = video.videoWidth;
+    const height = video.videoHeight;
+    if (!width || !height) return false;
+
+    const scale = Math.min(1, maxEdge / Math.max(width, height));
+    canvas.width = Math.round(width * scale);
+    canvas.height = Math.round(height * scale);
+    canvas.getContext("2d").drawImage(video, 0, 0, canvas.width, canvas.height);
+    return true;
+}
+
+// Encode a canvas as a JPEG Blob; resolves to null if the browser cannot
+function canvasToJpeg(canvas, quality) {
+    return new Promise(resolve => {
+        if (!canvas.toBlob) {
+            resolve(null);
+            return;
+        }
+        canvas.toBlob(blob => resolve(blob), "image/jpeg", quality);
+    });
+}
+
+// Put Blobs into a file input so a normal form submit sends them as multipart files.
+// Returns false where DataTransfer cannot be constructed (older browsers).
+function setInputFiles(input, blobs, prefix) {
+    try {
+        const transfer = new DataTransfer();
+        blobs.forEach((blob, i) => {
+            transfer.items.add(new File([blob], `${prefix}_${i + 1}.jpg`, { type: "image/jpeg" }));
+        });
+        input.files = transfer.files;
+        return input.files.length === blobs.length;
+    } catch (err) {
+        return false;
+    }
+}
+
+function supportsBinaryCapture() {
+    try {
+        new DataTransfer();
+        return !!HTMLCanvasElement.prototype.toBlob;
+    } catch (err) {
+        return false;
+    }
+}
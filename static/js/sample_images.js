@@ -374,7 +374,7 @@ function showStudentDetail(studentId, studentName) {
                                         return `
                                             <tr>
                                                 <td>
-                                                    <img src="/uploads/samples/${img.image_filename}" 
+                                                    <img src="${img.thumbnail_url}" loading="lazy" 
                                                          style="width: 50px; height: 50px; object-fit: cover; border-radius: 4px;">
                                                 </td>
                                                 <td>${new Date(img.upload_date).toLocaleDateString()}</td>
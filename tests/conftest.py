@@ -0,0 +1,30 @@
+import os
+import sys
+import tempfile
+
+import pytest
+import torch
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# backend.main loads its models at import time. Register randomly initialised
+# recognition weights in a scratch model registry so the tests run offline and never
+# touch models/; the functions under test only do numpy math on embeddings.
+os.environ["MODEL_DIR"] = tempfile.mkdtemp(prefix="attendance_test_models_")
+os.environ["MODEL_OFFLINE"] = "1"
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+
+@pytest.fixture(scope="session")
+def main():
+    from facenet_pytorch import InceptionResnetV1
+    from backend import model_registry
+
+    weights = os.path.join(model_registry.MODEL_DIR, "random_inception_resnet_v1.pt")
+    torch.manual_seed(0)
+    torch.save(InceptionResnetV1(pretrained=None).state_dict(), weights)
+    model_registry.add_model(model_registry.RECOGNITION_MODEL, weights, "test-random")
+
+    from backend import main
+    return main
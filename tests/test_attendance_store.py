@@ -0,0 +1,108 @@
+import csv
+import time
+import threading
+from datetime import datetime
+
+import pytest
+
+from backend import attendance_store, reports
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(attendance_store, "DB_PATH", str(tmp_path / "attendance.db"))
+    monkeypatch.setattr(attendance_store, "CONSOLIDATED_CACHE_DIR", str(tmp_path / "reports_cache"))
+    return attendance_store
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))
+
+def test_consolidated_report_is_built_on_the_report_pool(store, monkeypatch):
+    store.record_session("10A", {"alice": "Present", "bob": "Absent"}, datetime(2026, 9, 1, 9, 0))
+    store.record_session("10A", {"alice": "Present", "bob": "Present"}, datetime(2026, 9, 1, 9, 0))
+    writer_threads = []
+    write_report = reports.write_report
+
+    def recording_write_report(*args, **kwargs):
+        writer_threads.append(threading.current_thread().name)
+        return write_report(*args, **kwargs)
+
+    monkeypatch.setattr(reports, "write_report", recording_write_report)
+    path = store.get_consolidated_report("10A", fmt="csv")
+
+    assert writer_threads and writer_threads[0].startswith("report")
+    assert read_csv(path) == [
+        ["Student Name", "2026-09-01 09:00:00", "2026-09-01 09:00:00 (2)", "Present", "Sessions", "Attendance %"],
+        ["alice", "Present", "Present", "2", "2", "100.0"],
+        ["bob", "Absent", "Present", "1", "2", "50.0"],
+    ]
+
+def test_consolidated_report_is_reused_until_new_attendance_is_recorded(store):
+    store.record_session("10A", {"alice": "Present"}, datetime(2026, 9, 1, 9, 0))
+    first = store.get_consolidated_report("10A", fmt="csv")
+    assert store.get_consolidated_report("10A", fmt="csv") == first
+
+    store.record_session("10A", {"alice": "Absent"}, datetime(2026, 9, 2, 9, 0))
+    second = store.get_consolidated_report("10A", fmt="csv")
+    assert second != first
+    assert read_csv(second)[1] == ["alice", "Present", "Absent", "1", "2", "50.0"]
+
+def test_invalid_requests_are_rejected(store):
+    with pytest.raises(ValueError):
+        store.get_consolidated_report("../10A", fmt="csv")
+    with pytest.raises(ValueError):
+        store.get_consolidated_report("10A", date_from="01/09/2026", fmt="csv")
+    with pytest.raises(ValueError):
+        store.get_consolidated_report("10A", fmt="pdf")
+
+def test_concurrent_requests_share_one_build(store, monkeypatch):
+    store.record_session("10A", {"alice": "Present"}, datetime(2026, 9, 1, 9, 0))
+    release = threading.Event()
+    builds = []
+    write_report = reports.write_report
+
+    def slow_write_report(*args, **kwargs):
+        builds.append(args[0])
+        release.wait(10)
+        return write_report(*args, **kwargs)
+
+    monkeypatch.setattr(reports, "write_report", slow_write_report)
+    paths, errors = [], []
+
+    def download():
+        try:
+            paths.append(store.get_consolidated_report("10A", fmt="csv"))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=download) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)  # Every request arrives while the first build is still running
+    release.set()
+    for thread in threads:
+        thread.join(10)
+
+    assert errors == []
+    assert len(builds) == 1
+    assert len(set(paths)) == 1 and len(paths) == 4
+
+def test_concurrent_writers_of_one_path_do_not_share_a_partial_file(tmp_path):
+    path = str(tmp_path / "report.csv")
+    errors = []
+
+    def write():
+        try:
+            reports.write_report(path, ["a"], ([i] for i in range(2000)))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert errors == []
+    assert len(read_csv(path)) == 2001
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["report.csv"]
@@ -0,0 +1,64 @@
+import io
+import os
+import sqlite3
+
+import pytest
+
+from backend import bulk_enrollment, retention
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    monkeypatch.setattr(bulk_enrollment, "DB_PATH", str(tmp_path / "attendance.db"))
+    monkeypatch.setattr(bulk_enrollment, "STAGING_DIR", str(tmp_path / "bulk_uploads"))
+    monkeypatch.setattr(retention, "DB_PATH", str(tmp_path / "attendance.db"))
+    monkeypatch.setattr(retention, "BULK_STAGING_DIR", str(tmp_path / "bulk_uploads"))
+    monkeypatch.setattr(retention, "BATCH_PAUSE", 0)
+    os.makedirs(bulk_enrollment.STAGING_DIR)
+    return bulk_enrollment
+
+def test_chunks_are_appended_at_the_received_offset(uploads):
+    upload_id = uploads.create_upload(10)
+    uploads.append_chunk(upload_id, 0, io.BytesIO(b"abcd"))
+
+    with pytest.raises(ValueError, match="Expected offset 4"):
+        uploads.append_chunk(upload_id, 0, io.BytesIO(b"abcd"))
+    assert uploads.get_upload(upload_id)["bytes_received"] == 4
+
+def test_late_chunk_does_not_recreate_the_staging_file(uploads):
+    upload_id = uploads.create_upload(4)
+    uploads._update(upload_id, status="done")
+    os.remove(uploads.staging_path(upload_id))
+
+    with pytest.raises(ValueError, match="already done"):
+        uploads.append_chunk(upload_id, 4, io.BytesIO(b"more"))
+    assert not os.path.exists(uploads.staging_path(upload_id))
+    assert upload_id not in uploads._locks
+
+def test_missing_staging_file_is_reported_not_recreated(uploads):
+    upload_id = uploads.create_upload(4)
+    os.remove(uploads.staging_path(upload_id))
+
+    with pytest.raises(ValueError, match="no staging file"):
+        uploads.append_chunk(upload_id, 0, io.BytesIO(b"data"))
+    assert not os.path.exists(uploads.staging_path(upload_id))
+
+def test_unknown_upload(uploads):
+    with pytest.raises(KeyError):
+        uploads.append_chunk("missing", 0, io.BytesIO(b"data"))
+
+def test_abandoned_uploads_expire_with_their_partial_archives(uploads):
+    stale_id = uploads.create_upload(100)
+    uploads.append_chunk(stale_id, 0, io.BytesIO(b"x" * 10))
+    active_id = uploads.create_upload(100)
+    conn = sqlite3.connect(uploads.DB_PATH)
+    with conn:
+        conn.execute("UPDATE bulk_uploads SET updated_at = datetime('now', '-3 days') WHERE upload_id = ?",
+                     (stale_id,))
+    conn.close()
+    uploads._locks[stale_id] = object()
+
+    assert retention.expire_abandoned_uploads(2) == (1, 1, 10)
+    assert uploads.get_upload(stale_id) is None
+    assert not os.path.exists(uploads.staging_path(stale_id))
+    assert stale_id not in uploads._locks
+    assert uploads.get_upload(active_id)["status"] == "receiving"
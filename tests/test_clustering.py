@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+DIM = 16
+
+def unit(*values):
+    vector = np.zeros(DIM, dtype=np.float32)
+    vector[:len(values)] = values
+    return vector / np.linalg.norm(vector)
+
+def roster(names, prototypes, threshold=0.5):
+    return {
+        'names': list(names),
+        'prototypes': np.array(prototypes, dtype=np.float32),
+        'owners': np.arange(len(names)),
+        'thresholds': np.full(len(names), threshold, dtype=np.float32),
+    }
+
+def test_faces_of_one_person_across_images_form_one_cluster(main):
+    alice, bob = unit(1, 0), unit(0, 1)
+    embeddings = [alice, bob, unit(1, 0.05), unit(0.05, 1), unit(1, -0.05)]
+    image_ids = [0, 0, 1, 1, 2]
+
+    labels = main.cluster_faces(embeddings, image_ids)
+
+    assert labels[0] == labels[2] == labels[4]
+    assert labels[1] == labels[3]
+    assert labels[0] != labels[1]
+
+def test_faces_from_the_same_image_are_never_merged(main):
+    # Two near-identical faces in image 0 (twins, a reflection) and one in image 1
+    embeddings = [unit(1, 0), unit(1, 0.01), unit(1, 0.005)]
+    image_ids = [0, 0, 1]
+
+    labels = main.cluster_faces(embeddings, image_ids)
+
+    assert labels[0] != labels[1]
+    assert labels[2] in (labels[0], labels[1])
+    assert len(set(labels)) == 2
+
+def test_same_image_constraint_holds_through_chained_merges(main):
+    # a0 ~ b1 ~ c0: merging all three would put two image-0 faces in one cluster
+    embeddings = [unit(1, 0), unit(1, 0.2), unit(1, 0.4)]
+    image_ids = [0, 1, 0]
+
+    labels = main.cluster_faces(embeddings, image_ids)
+
+    assert labels[0] != labels[2]
+
+def test_faces_further_apart_than_max_distance_stay_separate(main):
+    labels = main.cluster_faces([unit(1, 0), unit(0, 1)], [0, 1], max_distance=0.8)
+    assert labels[0] != labels[1]
+
+def test_no_faces_gives_no_clusters(main):
+    assert len(main.cluster_faces(np.empty((0, DIM)), [])) == 0
+
+def test_clusters_are_matched_by_their_mean_embedding(main):
+    # Each face alone is just outside the threshold, but the two errors cancel in the mean
+    prototype = unit(1, 0)
+    faces = [unit(1, 0.6), unit(1, -0.6)]
+    class_roster = roster(["alice"], [prototype], threshold=0.5)
+
+    per_face = main.match_faces(faces, class_roster)
+    per_cluster = main.match_clusters(faces, np.array([0, 0]), class_roster)
+
+    assert [name for name, _ in per_face] == ["Unknown", "Unknown"]
+    assert len(per_cluster) == 1
+    assert per_cluster[0][0] == "alice"
+    assert per_cluster[0][1] == pytest.approx(0.0, abs=1e-5)
+
+def test_each_person_gets_one_vote_however_many_images_they_appear_in(main):
+    alice, bob = unit(1, 0), unit(0, 1)
+    class_roster = roster(["alice", "bob"], [alice, bob])
+    analyzed = [
+        ("a.jpg", [(0, 0, 10, 10), (20, 0, 30, 10)], np.array([alice, bob])),
+        ("b.jpg", [(0, 0, 10, 10)], np.array([unit(1, 0.05)])),
+        ("c.jpg", [(0, 0, 10, 10)], np.array([unit(1, -0.05)])),
+    ]
+
+    detections = main.decide_from_faces(analyzed, class_roster, annotate=[])
+
+    assert len(detections["alice"]) == 1
+    assert detections["alice"][0]["faces"] == 3
+    assert detections["alice"][0]["images"] == {"a.jpg", "b.jpg", "c.jpg"}
+    assert len(detections["bob"]) == 1
+    assert detections["bob"][0]["images"] == {"a.jpg"}
+
+    present, summary = main.attendance_decision(detections, total_images=3)
+    assert present == {"alice", "bob"}
+    assert summary["alice"]["frequency"] == 1.0
+    assert summary["bob"]["images"] == 1
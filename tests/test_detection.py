@@ -0,0 +1,7 @@
+from backend import detection
+
+def test_unknown_detector_falls_back_to_mtcnn(main, capsys):
+    detector = detection.load_detector(main.mtcnn, "retinaface")
+
+    assert detector.name == "mtcnn"
+    assert "Unknown face detector 'retinaface'" in capsys.readouterr().out
@@ -0,0 +1,49 @@
+import functools
+
+import numpy as np
+import torch
+
+from backend import preprocess
+
+# Regions are padded to different sizes in different batches, so grid coordinates round differently
+assert_close = functools.partial(torch.testing.assert_close, atol=1e-3, rtol=0)
+
+def frame(height=480, width=640, seed=0):
+    rng = np.random.default_rng(seed)
+    return preprocess.image_to_tensor(rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8))
+
+def test_uniform_region_crops_to_its_normalised_value():
+    image = preprocess.image_to_tensor(np.full((300, 400, 3), 200, dtype=np.uint8))
+    faces = preprocess.crop_faces(image, [[50, 50, 250, 250]])
+    assert faces.shape == (1, 3, 160, 160)
+    torch.testing.assert_close(faces, torch.full_like(faces, (200 - 127.5) / 128))
+
+def test_a_close_up_face_does_not_change_the_other_crops():
+    image = frame(1080, 1920)
+    small = [[100, 100, 160, 170], [1800, 1000, 1950, 1100]]
+    close_up = [500, 200, 1100, 900]  # Needs 4x supersampling
+
+    together = preprocess.crop_faces(image, [small[0], close_up, small[1]])
+    alone = preprocess.crop_faces(image, small)
+
+    assert_close(together[[0, 2]], alone)
+    assert_close(together[1:2], preprocess.crop_faces(image, [close_up]))
+
+def test_aligned_crops_match_whether_or_not_faces_are_batched():
+    image = frame()
+    boxes = np.array([[30, 40, 130, 150], [300, 200, 420, 330]], dtype=np.float32)
+    landmarks = boxes[:, None, :2] + np.array([[20, 30], [70, 45], [45, 60], [25, 85], [65, 90]], dtype=np.float32)
+
+    together = preprocess.crop_faces(image, boxes, landmarks, align=True)
+    for i in range(2):
+        assert_close(together[i:i + 1],
+                     preprocess.crop_faces(image, boxes[i:i + 1], landmarks[i:i + 1], align=True))
+
+def test_faces_outside_the_frame_read_as_zero_padding():
+    image = frame()
+    faces = preprocess.crop_faces(image, [[700, 500, 800, 600], [-50, -50, 50, 50]])
+    torch.testing.assert_close(faces[0], torch.full_like(faces[0], -127.5 / 128))
+    assert torch.all(faces[1, :, :70, :70] == -127.5 / 128)
+
+def test_no_faces():
+    assert preprocess.crop_faces(frame(), np.empty((0, 4))).shape == (0, 3, 160, 160)
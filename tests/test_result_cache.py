@@ -0,0 +1,62 @@
+import sqlite3
+import threading
+
+import pytest
+
+from backend import reports
+
+@pytest.fixture
+def cache(main, tmp_path, monkeypatch):
+    from backend import result_cache
+
+    monkeypatch.setattr(main, "DB_PATH", str(tmp_path / "attendance.db"))
+    (tmp_path / "reports" / "10A").mkdir(parents=True)
+    return result_cache
+
+def test_hit_while_the_report_exists(cache, tmp_path):
+    (tmp_path / "reports" / "10A" / "report.xlsx").write_bytes(b"report")
+    cache.put("key", "10A", {"alice": "Present"}, "10A/report.xlsx", 1)
+
+    assert cache.get("key", str(tmp_path / "reports")) == ({"alice": "Present"}, "10A/report.xlsx")
+
+def test_failed_report_write_drops_the_entry(cache, tmp_path, monkeypatch):
+    def failing_writer(path, header, rows):
+        raise OSError("disk full")
+
+    monkeypatch.setitem(reports._WRITERS, "xlsx", failing_writer)
+    report_path = str(tmp_path / "reports" / "10A" / "report.xlsx")
+    cache.put("key", "10A", {"alice": "Present"}, "10A/report.xlsx", 1)
+    reports.submit_report(report_path, ["Name"], [["alice"]])
+
+    assert cache.get("key", str(tmp_path / "reports")) is None
+    assert cache.get_connection().execute("SELECT COUNT(*) FROM attendance_result_cache").fetchone()[0] == 0
+
+def test_report_still_being_written_is_a_miss_that_keeps_the_entry(cache, tmp_path, monkeypatch):
+    release = threading.Event()
+
+    def slow_writer(path, header, rows):
+        release.wait(10)
+        open(path, "wb").close()
+
+    monkeypatch.setitem(reports._WRITERS, "xlsx", slow_writer)
+    wait_for_report = reports.wait_for_report
+    monkeypatch.setattr(reports, "wait_for_report", lambda path, timeout=60: wait_for_report(path, timeout=0.1))
+    report_path = str(tmp_path / "reports" / "10A" / "report.xlsx")
+    cache.put("key", "10A", {"alice": "Present"}, "10A/report.xlsx", 1)
+    future = reports.submit_report(report_path, ["Name"], [["alice"]])
+
+    assert cache.get("key", str(tmp_path / "reports")) is None
+    release.set()
+    future.result(10)
+    assert cache.get("key", str(tmp_path / "reports")) == ({"alice": "Present"}, "10A/report.xlsx")
+
+def test_entries_expire_after_the_ttl(cache, main, tmp_path):
+    (tmp_path / "reports" / "10A" / "report.xlsx").write_bytes(b"report")
+    cache.put("key", "10A", {"alice": "Present"}, "10A/report.xlsx", 1)
+    conn = sqlite3.connect(main.DB_PATH)
+    with conn:
+        conn.execute("UPDATE attendance_result_cache SET created_at = datetime('now', ?)",
+                     (f"-{cache.RESULT_CACHE_TTL + 1} seconds",))
+    conn.close()
+
+    assert cache.get("key", str(tmp_path / "reports")) is None
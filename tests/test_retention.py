@@ -0,0 +1,72 @@
+import os
+import sqlite3
+import time
+
+import pytest
+
+from backend import retention
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(retention, "DB_PATH", str(tmp_path / "attendance.db"))
+    monkeypatch.setattr(retention, "CLASSROOM_IMG_DIR", str(tmp_path / "class_img"))
+    monkeypatch.setattr(retention, "JOB_IMG_DIR", str(tmp_path / "class_img" / "jobs"))
+    monkeypatch.setattr(retention, "BATCH_SIZE", 2)
+    monkeypatch.setattr(retention, "BATCH_PAUSE", 0)
+    return tmp_path
+
+def make_file(path, size=10, age_days=0):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    stamp = time.time() - age_days * 86400
+    os.utime(path, (stamp, stamp))
+    return str(path)
+
+def test_delete_rows_removes_files_then_rows_in_batches(storage):
+    conn = sqlite3.connect(retention.DB_PATH)
+    conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, path TEXT, expired INTEGER)")
+    paths = [make_file(storage / f"item_{i}.bin", size=i + 1) for i in range(5)]
+    conn.executemany("INSERT INTO items (path, expired) VALUES (?, ?)",
+                     [(path, int(i != 2)) for i, path in enumerate(paths)])
+    conn.commit()
+    batches = []
+
+    def delete_files(rows):
+        batches.append(len(rows))
+        return len(rows), sum(retention._remove(path) for _, path in rows)
+
+    def delete_rows(conn, rows):
+        conn.executemany("DELETE FROM items WHERE id = ?", [(row_id,) for row_id, _ in rows])
+
+    files, rows, reclaimed = retention._delete_rows("SELECT id, path FROM items WHERE expired = ? ORDER BY id",
+                                                    [1], delete_files, delete_rows)
+
+    assert (files, rows, reclaimed) == (4, 4, 1 + 2 + 4 + 5)
+    assert batches == [2, 2]
+    assert conn.execute("SELECT path FROM items").fetchall() == [(paths[2],)]
+    assert [os.path.exists(path) for path in paths] == [False, False, True, False, False]
+    conn.close()
+
+def test_delete_rows_ignores_a_feature_that_was_never_used(storage):
+    result = retention._delete_rows("SELECT id FROM missing_table", [], None, None)
+    assert result == (0, 0, 0)
+
+def test_classroom_uploads_expire_with_their_job_folders(storage):
+    class_img = storage / "class_img"
+    old_upload = make_file(class_img / "classroom_1.jpg", age_days=3)
+    new_upload = make_file(class_img / "classroom_2.jpg")
+    other = make_file(class_img / "notes.txt", age_days=3)
+    old_job = class_img / "jobs" / "old"
+    make_file(old_job / "captured_classroom.jpg", age_days=3)
+    make_file(old_job / "result_captured_classroom.jpg", age_days=3)
+    stamp = time.time() - 3 * 86400
+    os.utime(old_job, (stamp, stamp))
+    new_job = class_img / "jobs" / "new"
+    make_file(new_job / "classroom_1.jpg")
+
+    files, rows, reclaimed = retention.expire_classroom_uploads(1)
+
+    assert (files, rows, reclaimed) == (3, 0, 30)
+    assert not os.path.exists(old_upload) and not old_job.exists()
+    assert os.path.exists(new_upload) and os.path.exists(other) and new_job.exists()
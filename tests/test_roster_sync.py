@@ -0,0 +1,66 @@
+import io
+import json
+import zipfile
+
+import numpy as np
+import pytest
+
+from backend import roster_sync
+
+@pytest.fixture
+def snapshot_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(roster_sync, "SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    return tmp_path / "snapshots"
+
+def write_roster(path, names):
+    np.savez(path, names=np.array(names), model_version=np.array("test"))
+    return str(path)
+
+def archive(manifest, members=()):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as out:
+        out.writestr(roster_sync.MANIFEST_FILE, json.dumps(manifest))
+        for name, data in members:
+            out.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+def test_export_then_import_round_trip(snapshot_dir, tmp_path):
+    entry = roster_sync.publish("10A", write_roster(tmp_path / "10A.npz", ["alice", "bob"]))
+    exported = io.BytesIO()
+    assert roster_sync.export_snapshots(exported) == 1
+
+    exported.seek(0)
+    assert roster_sync.import_snapshots(exported) == ["10A"]
+    assert roster_sync.load_manifest()["10A"]["sha256"] == entry["sha256"]
+    assert roster_sync.load_manifest()["10A"]["version"] == 1  # Same roster, so no new version
+
+def test_import_rejects_a_hash_that_is_not_hex(snapshot_dir):
+    with pytest.raises(ValueError, match="Invalid snapshot hash"):
+        roster_sync.import_snapshots(archive({"10A": {"sha256": "../../etc/passwd"}}))
+
+def test_import_rejects_a_path_as_class_name(snapshot_dir):
+    with pytest.raises(ValueError, match="Invalid class name"):
+        roster_sync.import_snapshots(archive({"../10A": {"sha256": "0" * 64}}))
+
+def test_import_reports_a_missing_snapshot_as_invalid_archive(snapshot_dir):
+    with pytest.raises(ValueError, match="no snapshot for 10A"):
+        roster_sync.import_snapshots(archive({"10A": {"sha256": "0" * 64}}))
+
+def test_import_rejects_a_snapshot_that_does_not_match_its_hash(snapshot_dir):
+    digest = "0" * 64
+    with pytest.raises(ValueError, match="does not match"):
+        roster_sync.import_snapshots(archive({"10A": {"sha256": digest}}, [(f"10A/{digest}.npz", b"tampered")]))
+    assert roster_sync.load_manifest() == {}
+
+def test_pull_copies_changed_rosters_and_skips_invalid_entries(snapshot_dir, tmp_path):
+    roster_sync.publish("10A", write_roster(tmp_path / "10A.npz", ["alice"]))
+    manifest = roster_sync.load_manifest()
+    manifest["../evil"] = dict(manifest["10A"])
+    roster_sync._save_manifest(manifest)
+    output_dir = tmp_path / "rosters"
+    output_dir.mkdir()
+
+    assert roster_sync.pull(str(output_dir)) == ["10A"]
+    assert roster_sync.pull(str(output_dir)) == []
+    assert sorted(p.name for p in output_dir.iterdir()) == ["10A_roster.npz"]
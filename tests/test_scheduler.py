@@ -0,0 +1,78 @@
+import threading
+from collections import OrderedDict
+
+import pytest
+
+from backend import scheduler
+
+@pytest.fixture
+def idle_scheduler(monkeypatch):
+    """Scheduler state with no workers taking jobs, so queues can be inspected"""
+    monkeypatch.setattr(scheduler, "_condition", threading.Condition())  # Running workers wait on the old one
+    monkeypatch.setattr(scheduler, "_queues", OrderedDict())
+    monkeypatch.setattr(scheduler, "_queued", 0)
+    monkeypatch.setattr(scheduler, "_running", 0)
+    monkeypatch.setattr(scheduler, "_workers", [None])
+    return scheduler
+
+def test_classes_take_turns(idle_scheduler, monkeypatch):
+    monkeypatch.setattr(scheduler, "MAX_QUEUED", 10)
+    monkeypatch.setattr(scheduler, "MAX_QUEUED_PER_CLASS", 3)
+    for class_name, job in [("a", 1), ("a", 2), ("a", 3), ("b", 1), ("c", 1)]:
+        scheduler.submit(class_name, lambda: None, job)
+
+    order = []
+    while scheduler._queues:
+        class_name, (_, _, args, _, _) = scheduler._next_job()
+        order.append((class_name, args[0]))
+
+    assert order == [("a", 1), ("b", 1), ("c", 1), ("a", 2), ("a", 3)]
+    assert scheduler._queued == 0
+
+def test_full_class_queue_is_rejected_with_retry_after(idle_scheduler, monkeypatch):
+    monkeypatch.setattr(scheduler, "MAX_QUEUED", 10)
+    monkeypatch.setattr(scheduler, "MAX_QUEUED_PER_CLASS", 2)
+    scheduler.submit("a", lambda: None)
+    scheduler.submit("a", lambda: None)
+
+    with pytest.raises(scheduler.SchedulerBusy) as busy:
+        scheduler.submit("a", lambda: None)
+    assert busy.value.retry_after >= 1
+    scheduler.submit("b", lambda: None)  # Other classes are still admitted
+
+def test_full_scheduler_is_rejected(idle_scheduler, monkeypatch):
+    monkeypatch.setattr(scheduler, "MAX_QUEUED", 2)
+    monkeypatch.setattr(scheduler, "MAX_QUEUED_PER_CLASS", 2)
+    scheduler.submit("a", lambda: None)
+    scheduler.submit("b", lambda: None)
+
+    with pytest.raises(scheduler.SchedulerBusy):
+        scheduler.submit("c", lambda: None)
+
+def test_run_executes_on_a_worker_and_returns_the_result():
+    result, thread_name = scheduler.run("a", lambda x: (x * 2, threading.current_thread().name), 21)
+    assert result == 42
+    assert thread_name.startswith("inference-")
+
+def test_run_raises_the_job_exception():
+    def fail():
+        raise ValueError("bad photo")
+
+    with pytest.raises(ValueError, match="bad photo"):
+        scheduler.run("a", fail)
+
+def test_roster_updates_run_on_the_scheduler(main, monkeypatch):
+    done = threading.Event()
+    calls = []
+
+    def update(class_name, student_names):
+        calls.append((class_name, set(student_names), threading.current_thread().name))
+        done.set()
+
+    monkeypatch.setattr(main, "update_student_embeddings", update)
+    main.queue_roster_update("10A", ["alice"])
+
+    assert done.wait(10)
+    class_name, student_names, thread_name = calls[0]
+    assert (class_name, student_names) == ("10A", {"alice"})
+    assert thread_name.startswith("inference-")
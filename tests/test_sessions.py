@@ -0,0 +1,47 @@
+import os
+import sqlite3
+
+import pytest
+
+@pytest.fixture
+def sessions(main, tmp_path, monkeypatch):
+    from backend import sessions, retention
+
+    monkeypatch.setattr(main, "DB_PATH", str(tmp_path / "attendance.db"))
+    monkeypatch.setattr(sessions, "SESSION_IMG_DIR", str(tmp_path / "sessions"))
+    monkeypatch.setattr(retention, "DB_PATH", str(tmp_path / "attendance.db"))
+    monkeypatch.setattr(retention, "SESSION_IMG_DIR", str(tmp_path / "sessions"))
+    monkeypatch.setattr(retention, "BATCH_PAUSE", 0)
+    return sessions
+
+def test_closed_session_rejects_photos_before_they_are_processed(sessions, main, monkeypatch):
+    session_id = sessions.create_session("10A")
+    conn = sessions.get_connection()
+    with conn:
+        conn.execute("UPDATE attendance_sessions SET status = 'closed' WHERE session_id = ?", (session_id,))
+    conn.close()
+    monkeypatch.setattr(main, "analyze_image", lambda path: pytest.fail("closed session photo was processed"))
+
+    with pytest.raises(ValueError, match="Session is closed"):
+        sessions.get_open_session(session_id)
+    with pytest.raises(ValueError, match="Session is closed"):
+        sessions.add_image(session_id, "classroom.jpg")
+    with pytest.raises(KeyError):
+        sessions.get_open_session("missing")
+
+def test_expired_sessions_release_their_locks(sessions):
+    from backend import retention
+
+    session_id = sessions.create_session("10A")
+    sessions._session_lock(session_id)
+    conn = sqlite3.connect(retention.DB_PATH)
+    with conn:
+        conn.execute("UPDATE attendance_sessions SET updated_at = datetime('now', '-40 days')")
+    conn.close()
+
+    files, rows, _ = retention.expire_sessions(30)
+
+    assert rows == 1
+    assert session_id not in sessions._locks
+    assert not os.path.exists(os.path.join(sessions.SESSION_IMG_DIR, session_id))
+    assert sessions.get_session(session_id) is None
@@ -0,0 +1,46 @@
+import numpy as np
+
+def unit_rows(rows):
+    rows = np.asarray(rows, dtype=np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+def test_distance_is_to_the_closest_prototype_of_each_student(main):
+    prototypes = unit_rows([[1, 0, 0], [0, 1, 0], [0, 0, 1]])
+    owners = np.array([0, 1, 0])  # Student 0 has two prototypes
+    embeddings = unit_rows([[0, 0, 1], [0, 1, 0]])
+
+    distances = main.nearest_prototype_distances(embeddings, prototypes, owners, 2)
+
+    assert distances.shape == (2, 2)
+    np.testing.assert_allclose(distances, [[0, np.sqrt(2)], [np.sqrt(2), 0]], atol=1e-6)
+
+def test_prototype_order_does_not_matter(main):
+    rng = np.random.default_rng(0)
+    prototypes = unit_rows(rng.normal(size=(6, 8)))
+    owners = np.array([2, 0, 1, 0, 2, 1])
+    embeddings = unit_rows(rng.normal(size=(4, 8)))
+    shuffle = rng.permutation(6)
+
+    np.testing.assert_allclose(main.nearest_prototype_distances(embeddings, prototypes, owners, 3),
+                               main.nearest_prototype_distances(embeddings, prototypes[shuffle], owners[shuffle], 3),
+                               atol=1e-6)
+
+def test_threshold_separates_well_separated_students(main):
+    rng = np.random.default_rng(1)
+    centres = unit_rows(np.eye(4, 16) * 10 + rng.normal(size=(4, 16)))
+    student_embeddings = [unit_rows(centre + rng.normal(scale=0.02, size=(5, 16))) for centre in centres]
+
+    thresholds = main.calibrate_thresholds(student_embeddings, centres, np.arange(4))
+
+    low, high = main.THRESHOLD_RANGE
+    assert thresholds.shape == (4,)
+    assert np.all((thresholds >= low) & (thresholds <= high))
+    for idx, embeddings in enumerate(student_embeddings):
+        distances = main.nearest_prototype_distances(embeddings, centres, np.arange(4), 4)
+        assert np.all(distances[:, idx] < thresholds[idx])
+        assert np.all(np.delete(distances, idx, axis=1) > thresholds[idx])
+
+def test_a_single_student_keeps_the_default_threshold(main):
+    embeddings = [unit_rows([[1, 0], [1, 0.1]])]
+    thresholds = main.calibrate_thresholds(embeddings, unit_rows([[1, 0]]), np.array([0]))
+    np.testing.assert_allclose(thresholds, [main.DEFAULT_MATCH_THRESHOLD])
@@ -0,0 +1,49 @@
+import json
+import sqlite3
+
+import pytest
+
+from backend import user_store
+
+@pytest.fixture
+def users_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(user_store, "DB_PATH", str(tmp_path / "attendance.db"))
+    return tmp_path
+
+def write_users(path, users):
+    path.write_text(json.dumps(users))
+    return str(path)
+
+def test_malformed_entries_are_skipped(users_db):
+    users_file = write_users(users_db / "users.json", {
+        "teacher2": {"password": "hash", "role": "teacher", "class": "10A", "login_count": 3},
+        "broken": {"role": "teacher"},
+        "also_broken": "not an account",
+    })
+
+    assert user_store.migrate_from_json(users_file) == 1
+    assert user_store.get_user("teacher2")["class"] == "10A"
+    assert user_store.get_user("broken") is None
+
+def test_default_accounts_when_nothing_can_be_imported(users_db):
+    users_file = write_users(users_db / "users.json", ["not", "a", "dictionary"])
+
+    assert user_store.migrate_from_json(users_file) == len(user_store.DEFAULT_USERS)
+    assert user_store.get_user("admin1")["role"] == "admin"
+
+def test_record_login_runs_no_ddl(users_db, monkeypatch):
+    user_store.migrate_from_json(str(users_db / "missing.json"))
+    statements = []
+    connect = sqlite3.connect
+
+    def tracing_connect(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    with monkeypatch.context() as patch:
+        patch.setattr(sqlite3, "connect", tracing_connect)
+        user_store.record_login("admin1")
+
+    assert not any("CREATE" in statement for statement in statements)
+    assert user_store.get_user("admin1")["login_count"] == 1